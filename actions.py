@@ -0,0 +1,188 @@
+# -*- coding: utf8 -*-
+""" Bulk actions (terminate, shutdown) over many resources, of any type, region or account.
+
+    Resources whose API acts on many IDs per call (EC2 instances) are grouped by region and
+    account and sent in batches. The rest go through their own method, one call per resource,
+    in a bounded pool of threads. All batches and calls run concurrently.
+
+    With DryRun, APIs which support it check the permissions and parameters of the action
+    without doing it; the other resources are only reported. Every resource gets a Result.
+
+    Usage:
+        for result in actions.shutdown_many(EC2API.get(query=Query(tags={'env': 'dev'}))):
+            if result.status == 'failed':
+                print result.resource, result.detail
+"""
+
+import collections
+import logging
+import re
+from botocore.exceptions import ClientError
+from . import boto3_clients as clients
+from . import cache
+from . import parallel
+from .resources import (EC2_Resource, EBSVolume_Resource, RDS_Resource, AutoScalingGroup_Resource,
+                        SecurityGroup_Resource, EFS_Resource, is_not_found)
+
+logger = logging.getLogger(__name__)
+
+# Outcome of an action on a resource. status is one of:
+# * 'done': detail is the new state of the resource, if the API returns it
+# * 'dry-run': the action would have been done (checked by AWS if the API supports DryRun)
+# * 'not-found': the resource does not exist anymore
+# * 'failed' and 'unsupported': detail is the error message
+Result = collections.namedtuple('Result', ['resource', 'status', 'detail'])
+
+# Actions, by name. 'stop' is the same as 'shutdown'
+ACTIONS = {'terminate': 'terminate', 'shutdown': 'shutdown', 'stop': 'shutdown'}
+
+# Resource methods taking a DryRun argument, by action
+_DRY_RUN_SUPPORT = {
+    'terminate': (EC2_Resource, EBSVolume_Resource, RDS_Resource, AutoScalingGroup_Resource),
+    'shutdown': (EC2_Resource, RDS_Resource, AutoScalingGroup_Resource),
+}
+
+# Arguments of resource methods, by resource class and action, so that they raise their errors
+# and only return once done. EFS file systems wait for their mount targets to be deleted
+_METHOD_ARGS = {
+    (SecurityGroup_Resource, 'terminate'): {'raise_errors': True},
+    (EFS_Resource, 'terminate'): {'wait': True},
+}
+
+# Instance IDs in the errors of EC2
+_INSTANCE_ID = re.compile(r'\bi-[0-9a-f]+\b')
+
+
+def _error_code(error):
+    return error.response.get('Error', {}).get('Code')
+
+
+# Batch actions. Each one acts on a batch of resources in a single call, and returns a dict of
+# {resource: Result}. They raise the errors of the call, for the whole batch.
+
+def _ec2_instances(function, response_list):
+    def act(client, resources, DryRun):
+        response = getattr(client, function)(InstanceIds=[r._id for r in resources],
+                                              DryRun=DryRun)
+        states = dict((instance['InstanceId'], instance['CurrentState']['Name'])
+                      for instance in response[response_list])
+        return dict((r, Result(r, 'done', states.get(r._id))) for r in resources)
+    return act
+
+
+def _terminate_instances(client, resources, DryRun):
+    terminate = _ec2_instances('terminate_instances', 'TerminatingInstances')
+    try:
+        return terminate(client, resources, DryRun)
+    except ClientError as e:
+        if _error_code(e) != 'OperationNotPermitted':
+            raise
+        # Termination protection is cleared only for the instances which have it, named in the
+        # error, or for the whole batch if none is. With DryRun, this is only checked too
+        named = set(_INSTANCE_ID.findall(e.response['Error'].get('Message', '')))
+        protected = [r for r in resources if r._id in named] or resources
+        for resource in protected:
+            logger.info('Clearing termination protection of %s', resource)
+            client.modify_instance_attribute(InstanceId=resource._id,
+                                             DisableApiTermination={'Value': False},
+                                             DryRun=DryRun)
+        return terminate(client, resources, DryRun)
+
+
+# Batch action, client name and maximum number of resources per call, by resource class and action
+_BATCHES = {
+    (EC2_Resource, 'terminate'): (_terminate_instances, 'ec2', 500),
+    (EC2_Resource, 'shutdown'): (_ec2_instances('stop_instances', 'StoppingInstances'), 'ec2', 500),
+}
+
+
+def _run_batch(act, client, resources, DryRun):
+    """ Runs a batch action. Batches failing as a whole are split in halves, so a single bad
+        resource (e.g. already deleted, or in the wrong state) only fails on its own """
+    try:
+        return act(client, resources, DryRun)
+    except ClientError as e:
+        code = _error_code(e)
+        if code == 'DryRunOperation':
+            return dict((r, Result(r, 'dry-run', None)) for r in resources)
+        if len(resources) == 1 or code in ('UnauthorizedOperation', 'AccessDenied'):
+            status = 'not-found' if is_not_found(e) else 'failed'
+            logger.error('Failed to act on %d resources: %s', len(resources), e)
+            return dict((r, Result(r, status, str(e))) for r in resources)
+    half = len(resources) // 2
+    results = _run_batch(act, client, resources[:half], DryRun)
+    results.update(_run_batch(act, client, resources[half:], DryRun))
+    return results
+
+
+def _run_one(resource, action, DryRun):
+    dry_run_support = isinstance(resource, _DRY_RUN_SUPPORT[action])
+    if DryRun and not dry_run_support:
+        return Result(resource, 'dry-run', 'Not checked, %s has no DryRun' % resource.type)
+    method = getattr(resource, action, None)
+    if method is None:
+        return Result(resource, 'unsupported', '%s is not supported for %s resources' %
+                      (action, resource.type))
+    try:
+        kwargs = dict(_METHOD_ARGS.get((type(resource), action), {}))
+        if dry_run_support:
+            kwargs['DryRun'] = DryRun
+        state = method(**kwargs)
+        return Result(resource, 'done', state if isinstance(state, basestring) else None)
+    except ClientError as e:
+        if _error_code(e) == 'DryRunOperation':
+            return Result(resource, 'dry-run', None)
+        if is_not_found(e):
+            return Result(resource, 'not-found', str(e))
+        logger.error('Failed to %s %s: %s', action, resource, e)
+        return Result(resource, 'failed', str(e))
+
+
+def run(resources, action, DryRun=False, max_workers=parallel.MAX_WORKERS):
+    """ Runs an action ('terminate', 'shutdown' or 'stop') on all the resources. Returns the
+        Result of each resource, in the same order """
+    action = ACTIONS[action]
+    resources = list(resources)
+    groups = {}
+    singles = []
+    for resource in resources:
+        if (type(resource), action) in _BATCHES:
+            key = (type(resource), resource._region, resource._account, resource._role)
+            groups.setdefault(key, []).append(resource)
+        else:
+            singles.append(resource)
+
+    tasks = []
+    for (cls, region, account, role), group in groups.items():
+        act, service, batch_size = _BATCHES[(cls, action)]
+        client = clients.client(service, region, account, role)
+        tasks += [(act, client, batch) for batch in parallel.chunks(group, batch_size)]
+    tasks += [(None, None, resource) for resource in singles]
+
+    def run_task(task):
+        act, client, target = task
+        if act is None:
+            return {target: _run_one(target, action, DryRun)}
+        return _run_batch(act, client, target, DryRun)
+
+    results = {}
+    for task_results in parallel.pmap(run_task, tasks, max_workers):
+        results.update(task_results)
+
+    # Drop the cached descriptions of the resources acted on by batches (resource methods do it
+    # themselves)
+    if not DryRun:
+        for resources_group in groups.values():
+            cache.invalidate_resource(resources_group[0])
+    return [results[resource] for resource in resources]
+
+
+def terminate_many(resources, DryRun=False, max_workers=parallel.MAX_WORKERS):
+    """ Terminates all the resources, see run. EC2 instances keep their security groups until
+        they are gone, unlike with EC2_Resource.terminate """
+    return run(resources, 'terminate', DryRun, max_workers)
+
+
+def shutdown_many(resources, DryRun=False, max_workers=parallel.MAX_WORKERS):
+    """ Stops all the resources (or scales AutoScaling groups down to 0), see run """
+    return run(resources, 'shutdown', DryRun, max_workers)
@@ -1,56 +1,125 @@
 # -*- coding: utf8 -*-
 
-from time import sleep
 import botocore
+import collections
+import copy
 import functools
+import itertools
 import logging
 from . import boto3_clients as clients
+from . import cache
+from . import metrics
+from . import parallel
+from . import tags
+from .query import Query
 from .resources import EC2_Resource, RDS_Resource, RDSAurora_Resource, ELB_Resource, \
     ELBv2_Resource, AutoScalingGroup_Resource, S3Bucket_Resource, LaunchConfiguration_Resource, \
     SecurityGroup_Resource, EBSVolume_Resource, Snapshot_Resource, DBSnapshot_Resource, \
     AMI_Resource, ENI_Resource, EFS_Resource, KeyPair_Resource, Lambda_Resource, \
-    CloudFormation_Resource
+    CloudFormation_Resource, is_not_found
 
 
 logger = logging.getLogger(__name__)
 
+# Filters supported by the describe functions of the EC2 API for any resource type
+EC2_TAG_FILTERS = {'tag': 'tag:%s', 'tag-key': 'tag-key'}
+
+# Whether the describe function of each APIHelper class takes Filters, see _takes_filters
+_filters_support = {}
+
+
+def _bucket_region(bucket):
+    """ Region where an S3 bucket lives, None if it cannot be read """
+    try:
+        location = bucket._client().get_bucket_location(Bucket=bucket._id).get('LocationConstraint')
+    except botocore.exceptions.ClientError as e:
+        logger.warn('Could not get the region of %s: %s', bucket, e)
+        return None
+    # Buckets in us-east-1 have no location constraint, and old ones in eu-west-1 have 'EU'
+    return {None: 'us-east-1', '': 'us-east-1', 'EU': 'eu-west-1'}.get(location, location)
+
 
 # This metaclass defines functions used by the specialized classes.
 # We define some of the functions here just to avoid having to de-reference them from the string
 # variables every time.
 class APIHelperMeta(type):
 
-    def __new__(cls, clsname, bases, dct):
-        """ This constructor creates a _describe function for the class, based on the string properties
-            defined on it. """
-        if clsname != 'APIHelper':  # APIHelper does not need this
-            client = getattr(clients, dct['_type'])
-            api_function = getattr(client, dct['_describe_function'])
-            api_function_params = dct.get('_describe_params', {})
-            dct['_describe'] = functools.partial(api_function, **api_function_params)
-        return super(APIHelperMeta, cls).__new__(cls, clsname, bases, dct)
+    @property
+    def _describe(cls):
+        """ The describe function of the class, with its _describe_params, for the default region
+            and account. The client is looked up on every use, so importing this module does not
+            create a client for every service, and clients replaced by boto3_clients.configure
+            are not kept """
+        client = getattr(clients, cls._type)
+        return functools.partial(getattr(client, cls._describe_function),
+                                 **getattr(cls, '_describe_params', {}))
 
 
-# This is the generic API class. Methods are defined here as generically as possible, based on
-# string properties from each subclass.
 class APIHelper(object):
 
     __metaclass__ = APIHelperMeta
 
+    _describe_filters = {}
+
     @classmethod
-    def describe(cls, params):
-        "Retrieves all objects of this type, returns pure JSON"
+    def _describe_in(cls, region=None, account=None, role=None):
+        """ Returns the _describe function for the given region and account. The function created
+            by the metaclass is used for the default region and account """
+        if region is None and account is None:
+            return cls._describe
+        client = clients.client(cls._type, region, account, role)
+        return functools.partial(getattr(client, cls._describe_function),
+                                 **getattr(cls, '_describe_params', {}))
+
+    @classmethod
+    def _describe_page(cls, params, **location):
+        """Retrieves a single page of objects of this type, returns pure JSON.
+           Throttled requests are rate limited and retried by the client (see throttling.py), so
+           any error raised here is final"""
+        try:
+            with metrics.context(api=cls.__name__):
+                return cls._describe_in(**location)(**params)
+        except botocore.exceptions.ClientError as e:
+            # Some errors are expected (e.g. IDs not found, see _get_chunk): the caller handling
+            # the error decides what to log
+            logger.debug("Failed to get %s resources: %s", cls._type, e)
+            raise
+
+    @classmethod
+    def _describe_pages(cls, params, **location):
+        "Generator over the pages of objects of this type, requested one after the other"
+        client = clients.client(cls._type, **location)
+        if hasattr(cls, '_describe_token_property') or \
+                not client.can_paginate(cls._describe_function):
+            return cls._describe_pages_by_token(params, **location)
+        return cls._paginate(client, params)
+
+    @classmethod
+    def _paginate(cls, client, params):
+        """ Generator over the pages of objects of this type, using the botocore paginator of the
+            describe function, with the largest page size it accepts """
+        params = dict(getattr(cls, '_describe_params', {}), **params)
+        # Requests by ID do not take page sizes in some APIs
+        page_size = getattr(cls, '_describe_page_size', None)
+        if page_size is not None and getattr(cls, '_describe_ids_param', None) not in params:
+            params['PaginationConfig'] = {'PageSize': page_size}
+        pages = iter(client.get_paginator(cls._describe_function).paginate(**params))
         try:
-            r = cls._describe(**params)
-        except botocore.exceptions.ClientError as ce:
-            if ce.response['Error']['Code'] == 'Throttling':
-                print 'Request throttled, waiting one second to retry'
-                sleep(1)
-                try:
-                    r = cls._describe(**params)
-                except botocore.exceptions.ClientError:
-                    logger.exception("Failed to get %s resources", cls._type)
-                    return []
+            while True:
+                # Only the requests are tagged, not the code consuming the pages
+                with metrics.context(api=cls.__name__):
+                    page = next(pages, None)
+                if page is None:
+                    return
+                yield page
+        except botocore.exceptions.ClientError as e:
+            logger.debug("Failed to get %s resources: %s", cls._type, e)
+            raise
+
+    @classmethod
+    def _describe_pages_by_token(cls, params, **location):
+        """ Generator over the pages of objects of this type, for describe functions without a
+            paginator or with a _describe_token_property """
         # Handle pagination
         # For some resources, the name of the token property is different in the request and
         # the response.
@@ -61,30 +130,201 @@ class APIHelper(object):
         # if none is defined, don't try to request more items.
         token_property = getattr(cls, '_describe_token_property', None)
         token_property_response = getattr(cls, '_describe_token_property_response', token_property)
-        token = r.get(token_property_response, None)
-        if token:
+        params = dict(params)
+        while True:
+            r = cls._describe_page(params, **location)
+            yield r
+            token = r.get(token_property_response, None) if token_property else None
+            if not token:
+                return
             params[token_property] = token
-            return [r] + cls.describe(params)
-        else:
-            return [r]
 
     @classmethod
-    def get(cls, **params):
+    def iter_pages(cls, params=None, prefetch=True, **location):
+        """Yields the pages of objects of this type as pure JSON, as they arrive.
+           With prefetch, the next page is requested in the background while the caller is still
+           working on the current one.
+           The location (region, account and role) defaults to the default client.
+           If the cache is enabled (see cache.py), fresh cached pages are returned instead, and
+           pages read from the API are cached"""
+        params = params or {}
+        inventory_cache = cache.default
+        if inventory_cache is not None:
+            cached = inventory_cache.get(cls, params, **location)
+            if cached is not None:
+                return iter(cached)
+        pages = cls._describe_pages(params, **location)
+        if prefetch:
+            pages = parallel.prefetch(pages)
+        if inventory_cache is not None:
+            pages = inventory_cache.caching(cls, params, pages, **location)
+        return pages
+
+    @classmethod
+    def iter(cls, prefetch=True, region=None, account=None, role=None, query=None, compact=False,
+             **params):
+        """Yields all objects of this type as objects of the corresponding 'Resource' class,
+           one page at a time.
+           If a Query is given, only the resources matching it are returned.
+           With compact, resources only keep the fields of the describe output used by their
+           properties, and load the rest again if their 'data' is needed"""
+        location = {'region': region, 'account': account, 'role': role}
+        compiled = cls._compile_query(query)
+        if compiled is not None:
+            params = compiled.params(params)
+        # Tag keys and values are shared by all the compact resources
+        strings = {}
+        loader = cls._describe_resource
+        for result_set in cls.iter_pages(params, prefetch=prefetch, **location):
+            for resource in cls._get_resources_from_result_set(result_set, **location):
+                if compact:
+                    resource._compact(loader, strings)
+                if compiled is None or compiled.matches(resource):
+                    yield resource
+
+    @classmethod
+    def describe(cls, params):
+        "Retrieves all objects of this type, returns pure JSON"
+        return list(cls.iter_pages(params, prefetch=False))
+
+    @classmethod
+    def get(cls, regions=None, accounts=None, role=None, with_tags=False, query=None, vpc=None,
+            compact=False, max_workers=parallel.MAX_WORKERS, **params):
         """Retrieves all objects of this type, returns a list of objects of the corresponding
-           'Resource' class"""
-        resources = []
-        for result_set in cls.describe(params):
-            resources += cls._get_resources_from_result_set(result_set)
+           'Resource' class.
+           If a list of regions is given (or 'all' for every region enabled in the account), and/or
+           a list of accounts to assume the given role in, every (account, region) pair is queried
+           in parallel and each resource carries the region and account it was found in.
+           With with_tags, the tags of resources which are not part of the describe output are
+           loaded with the batch APIs of the service, instead of one call per resource.
+           If a Query is given (or a vpc, as a shortcut), only the resources matching it are
+           returned. Conditions supported by the API are sent as native filters.
+           With compact, the resources keep as little memory as possible (see iter)"""
+        if vpc is not None:
+            query = copy.copy(query) if query is not None else Query()
+            query.vpc = vpc
+        compiled = cls._compile_query(query)
+        if compiled is not None:
+            params = compiled.params(params)
+        resources = cls._get(regions, accounts, role, max_workers, compact=compact, **params)
+        if compiled is not None:
+            resources = compiled.filter(
+                resources, prefetch_tags=lambda left: tags.prefetch(left, max_workers))
+        if with_tags:
+            tags.prefetch(resources, max_workers)
         return resources
 
     @classmethod
-    def _get_resources_from_result_set(cls, result_set):
-        """ Given a response JSON, extract each resource and return a 'Resource' object for it """
+    def _compile_query(cls, query):
+        if query is None:
+            return None
+        filters = cls._describe_filters if cls._describe_filters and cls._takes_filters() else {}
+        return query.compile(filters)
+
+    @classmethod
+    def _takes_filters(cls):
+        """ Whether the describe function takes Filters in the installed version of botocore. Some
+            operations only gained them later (e.g. DescribeAutoScalingGroups), and their
+            _describe_filters are then checked on the client side """
+        if cls not in _filters_support:
+            import botocore.session
+            service_model = botocore.session.get_session().get_service_model(cls._type)
+            takes_filters = False
+            for operation_name in service_model.operation_names:
+                if botocore.xform_name(operation_name) == cls._describe_function:
+                    input_shape = service_model.operation_model(operation_name).input_shape
+                    takes_filters = input_shape is not None and 'Filters' in input_shape.members
+            _filters_support[cls] = takes_filters
+        return _filters_support[cls]
+
+    @classmethod
+    def _get(cls, regions, accounts, role, max_workers, **params):
+        if regions is None and accounts is None:
+            return list(cls.iter(**params))
+        if regions == 'all':
+            regions = clients.regions
+        locations = [(region, account) for account in accounts or [None]
+                     for region in regions or [None]]
+
+        def get_location(location):
+            region, account = location
+            return list(cls.iter(region=region, account=account, role=role, **params))
+
+        return list(itertools.chain(*parallel.pmap(get_location, locations, max_workers)))
+
+    @classmethod
+    def get_many(cls, ids, region=None, account=None, role=None, compact=False,
+                 max_workers=parallel.MAX_WORKERS):
+        """Retrieves the objects of this type with the given IDs, in as few calls as possible:
+           IDs are sent in chunks of the largest size the API accepts, and the chunks are
+           requested in parallel. APIs which do not take IDs are listed once instead.
+           Returns the resources in the order of the IDs, and the list of IDs not found"""
+        location = {'region': region, 'account': account, 'role': role}
+        wanted = list(collections.OrderedDict.fromkeys(ids))
+        if hasattr(cls, '_describe_ids_param'):
+            chunks = list(parallel.chunks(wanted, cls._describe_ids_batch_size))
+        elif hasattr(cls, '_describe_id_param'):
+            chunks = [[resource_id] for resource_id in wanted]
+        else:
+            chunks = [None]
+
+        def get_chunk(chunk):
+            return cls._get_chunk(chunk, location)
+
+        found = {}
+        for resources in parallel.pmap(get_chunk, chunks, max_workers):
+            for resource in resources:
+                # Resources are found by the ID they were requested with, which may not be
+                # their _id (e.g. RDS instances are requested by name, their _id is the ARN)
+                found[resource._id] = resource
+                found[resource._data[cls._describe_resource_id_property]] = resource
+        resources = [found[resource_id] for resource_id in wanted if resource_id in found]
+        missing = [resource_id for resource_id in wanted if resource_id not in found]
+        if compact:
+            strings = {}
+            for resource in resources:
+                resource._compact(cls._describe_resource, strings)
+        return resources, missing
+
+    @classmethod
+    def _get_chunk(cls, chunk, location):
+        """ Returns the resources with the IDs in the chunk (all resources if the chunk is None).
+            APIs which fail when an ID is not found are retried with each half of the chunk, so
+            the IDs which do exist are still found """
+        if chunk is None:
+            params = {}
+        elif hasattr(cls, '_describe_ids_param'):
+            params = {cls._describe_ids_param: chunk}
+        else:
+            params = {cls._describe_id_param: chunk[0]}
+        try:
+            return [resource for result_set in cls._describe_pages(params, **location)
+                    for resource in cls._get_resources_from_result_set(result_set, **location)]
+        except botocore.exceptions.ClientError as e:
+            if chunk is None or not is_not_found(e):
+                raise
+            if len(chunk) == 1:
+                return []
+        half = len(chunk) // 2
+        return cls._get_chunk(chunk[:half], location) + cls._get_chunk(chunk[half:], location)
+
+    @classmethod
+    def _describe_resource(cls, resource):
+        """ Returns the full describe output of a resource of this type, or None if it was not
+            found """
+        resources, _ = cls.get_many([resource._id], resource._region, resource._account,
+                                    resource._role)
+        return resources[0]._data if resources else None
+
+    @classmethod
+    def _get_resources_from_result_set(cls, result_set, **kwargs):
+        """ Given a response JSON, extract each resource and return a 'Resource' object for it.
+            Keyword arguments are passed on to the 'Resource' constructor """
         resource_class = getattr(cls, '_resource_class')
         resource_id_property = getattr(cls, '_describe_resource_id_property')
         resource_list_property = getattr(cls, '_describe_resource_list_property')
 
-        return [resource_class(resource[resource_id_property], resource)
+        return [resource_class(resource[resource_id_property], resource, **kwargs)
                 for resource in result_set[resource_list_property]]
 
 
@@ -103,12 +343,20 @@ class APIHelper(object):
 # * _describe_params: OPTIONAL. Parameters required by the _describe_function. These are parameters
 #   which are always needed to get the right results.
 #
-# * _describe_token_property: OPTIONAL. If the API paginates results, the name of the "token" or
-#   "marker" property used in the request to get the next page of results.
+# * _describe_page_size: OPTIONAL. The largest page size accepted by the _describe_function. Pages
+#   are requested through the botocore paginator of the function, if it has one.
+#
+# * _describe_token_property: OPTIONAL. Only needed for paginated APIs without a botocore paginator,
+#   which are then paginated by hand: the name of the "token" or "marker" property used in the
+#   request to get the next page of results.
 #
-# * _describe_token_property_response: OPTIONAL. If the API paginates results, the name of the
-#   "token" or "marker" property which comes with the API response. Define it only if the property
-#   names in the request and the response are not the same.
+# * _describe_token_property_response: OPTIONAL. Along with _describe_token_property, the name of
+#   the "token" or "marker" property which comes with the API response. Define it only if the
+#   property names in the request and the response are not the same.
+#
+# * _describe_filters: OPTIONAL. The conditions of a Query which the _describe_function can evaluate
+#   with its 'Filters' parameter, mapped to the name of the filter: 'vpc', 'state', 'tag' (with a %s
+#   for the tag key) and 'tag-key'. Other conditions are evaluated on the client side.
 #
 # * _describe_resource_list_property: REQUIRED. In the JSON response from the Describe function,
 #   the name of the property which contains the list of resources. API classes must either define
@@ -118,6 +366,15 @@ class APIHelper(object):
 #   the property which stores the resource ID. API classes must either define this property or
 #   override the method _get_resources_from_result_set from APIHelper.
 #
+# * _describe_ids_param: OPTIONAL. The parameter of the _describe_function which takes a list of
+#   resource IDs, used to describe resources by ID (see get_many).
+#
+# * _describe_ids_batch_size: REQUIRED with _describe_ids_param. The largest number of IDs accepted
+#   by _describe_ids_param in a single call.
+#
+# * _describe_id_param: OPTIONAL. For APIs which can only describe a single resource by ID, the
+#   parameter which takes it. If neither is defined, all resources are described to find some.
+#
 # * _resource_class: REQUIRED. The Resource class for resources retrieved by this API. API classes
 #   must either define this property or override the method _get_resources_from_result_set from
 #   APIHelper.
@@ -127,16 +384,18 @@ class EC2API(APIHelper):
     _type = 'ec2'
     _resource_class = EC2_Resource
     _describe_function = 'describe_instances'
-    _describe_params = {'MaxResults': 1000}
-    _describe_token_property = 'NextToken'
+    _describe_page_size = 1000
+    _describe_filters = dict(EC2_TAG_FILTERS, vpc='vpc-id', state='instance-state-name')
     _describe_resource_list_property = 'Instances'
     _describe_resource_id_property = 'InstanceId'
+    _describe_ids_param = 'InstanceIds'
+    _describe_ids_batch_size = 1000
 
     @classmethod
-    def _get_resources_from_result_set(cls, result_set):
+    def _get_resources_from_result_set(cls, result_set, **kwargs):
         instances = []
         for reservation in result_set.get('Reservations', []):
-            instances += super(EC2API, cls)._get_resources_from_result_set(reservation)
+            instances += super(EC2API, cls)._get_resources_from_result_set(reservation, **kwargs)
         return instances
 
 
@@ -144,27 +403,14 @@ class RDSAPI(APIHelper):
     _type = 'rds'
     _resource_class = RDS_Resource
     _describe_function = 'describe_db_instances'
-    _describe_params = {'MaxRecords': 100}
-    _describe_token_property = 'Marker'
+    _describe_page_size = 100
     _describe_resource_list_property = 'DBInstances'
     _describe_resource_id_property = 'DBInstanceIdentifier'
+    _describe_id_param = 'DBInstanceIdentifier'
 
     @classmethod
-    def get(cls, **params):
-        try:
-            vpc = params['vpc']
-            del params['vpc']
-        except KeyError:
-            vpc = None
-        instances = super(RDSAPI, cls).get(**params)
-        if vpc is None:
-            return instances
-        else:
-            return [inst for inst in instances if inst.vpc == vpc]
-
-    @classmethod
-    def _get_resources_from_result_set(cls, result_set):
-        return [db for db in super(RDSAPI, cls)._get_resources_from_result_set(result_set)
+    def _get_resources_from_result_set(cls, result_set, **kwargs):
+        return [db for db in super(RDSAPI, cls)._get_resources_from_result_set(result_set, **kwargs)
                 if db._data['DBInstanceStatus'] not in ('creating', 'deleting')]
 
 
@@ -172,60 +418,48 @@ class RDSAuroraAPI(RDSAPI):
     _type = RDSAPI._type
     _resource_class = RDSAurora_Resource
     _describe_function = 'describe_db_clusters'
-    _describe_params = RDSAPI._describe_params
-    _describe_token_property = RDSAPI._describe_token_property
+    _describe_page_size = RDSAPI._describe_page_size
     _describe_resource_list_property = 'DBClusters'
     _describe_resource_id_property = 'DBClusterIdentifier'
+    _describe_id_param = 'DBClusterIdentifier'
 
     @classmethod
-    def _get_resources_from_result_set(cls, result_set):
-        return super(RDSAPI, cls)._get_resources_from_result_set(result_set)
+    def _get_resources_from_result_set(cls, result_set, **kwargs):
+        return super(RDSAPI, cls)._get_resources_from_result_set(result_set, **kwargs)
 
 
 class ELBAPI(APIHelper):
     _type = 'elb'
     _resource_class = ELB_Resource
     _describe_function = 'describe_load_balancers'
-    _describe_params = {'PageSize': 400}
-    _describe_token_property = 'Marker'
-    _describe_token_property_response = 'NextMarker'
+    _describe_page_size = 400
     _describe_resource_list_property = 'LoadBalancerDescriptions'
     _describe_resource_id_property = 'LoadBalancerName'
-
-    @classmethod
-    def get(cls, **params):
-        try:
-            vpc = params['vpc']
-            del params['vpc']
-        except KeyError:
-            vpc = None
-
-        elbs = super(ELBAPI, cls).get(**params)
-        if vpc is None:
-            return elbs
-        else:
-            return [elb for elb in elbs if elb.vpc == vpc]
+    _describe_ids_param = 'LoadBalancerNames'
+    _describe_ids_batch_size = 20
 
 
 class ELBv2API(ELBAPI):
     _type = 'elbv2'
     _resource_class = ELBv2_Resource
     _describe_function = ELBAPI._describe_function
-    _describe_params = ELBAPI._describe_params
-    _describe_token_property = ELBAPI._describe_token_property
-    _describe_token_property_response = ELBAPI._describe_token_property_response
+    _describe_page_size = ELBAPI._describe_page_size
     _describe_resource_list_property = 'LoadBalancers'
     _describe_resource_id_property = 'LoadBalancerArn'
+    _describe_ids_param = 'LoadBalancerArns'
+    _describe_ids_batch_size = 20
 
 
 class ASGAPI(APIHelper):
     _type = 'autoscaling'
     _resource_class = AutoScalingGroup_Resource
     _describe_function = 'describe_auto_scaling_groups'
-    _describe_params = {'MaxRecords': 100}
-    _describe_token_property = 'NextToken'
+    _describe_page_size = 100
+    _describe_filters = EC2_TAG_FILTERS
     _describe_resource_list_property = 'AutoScalingGroups'
     _describe_resource_id_property = 'AutoScalingGroupName'
+    _describe_ids_param = 'AutoScalingGroupNames'
+    _describe_ids_batch_size = 50
 
 
 class S3API(APIHelper):
@@ -235,40 +469,71 @@ class S3API(APIHelper):
     _describe_resource_list_property = 'Buckets'
     _describe_resource_id_property = 'Name'
 
+    @classmethod
+    def _get(cls, regions, accounts, role, max_workers, **params):
+        """ Buckets of every region are listed by a single call, so each account is listed only
+            once. Every bucket is then given the region it lives in, and only the buckets in the
+            given regions are kept """
+        if regions is None and accounts is None:
+            return list(cls.iter(**params))
+
+        def get_account(account):
+            return list(cls.iter(account=account, role=role, **params))
+
+        buckets = list(itertools.chain(*parallel.pmap(get_account, accounts or [None],
+                                                      max_workers)))
+        for bucket, region in zip(buckets, parallel.pmap(_bucket_region, buckets, max_workers)):
+            bucket._region = region
+        if regions is None or regions == 'all':
+            return buckets
+        return [bucket for bucket in buckets if bucket._region is None or bucket._region in regions]
+
 
 class LaunchConfigurationAPI(APIHelper):
     _type = 'autoscaling'
     _resource_class = LaunchConfiguration_Resource
     _describe_function = 'describe_launch_configurations'
-    _describe_token_property = 'NextToken'
+    _describe_page_size = 100
     _describe_resource_list_property = 'LaunchConfigurations'
     _describe_resource_id_property = 'LaunchConfigurationName'
+    _describe_ids_param = 'LaunchConfigurationNames'
+    _describe_ids_batch_size = 50
 
 
 class SecurityGroupAPI(APIHelper):
     _type = EC2API._type
     _resource_class = SecurityGroup_Resource
     _describe_function = 'describe_security_groups'
+    _describe_page_size = 1000
+    _describe_filters = dict(EC2_TAG_FILTERS, vpc='vpc-id')
     _describe_resource_list_property = 'SecurityGroups'
     _describe_resource_id_property = 'GroupId'
+    _describe_ids_param = 'GroupIds'
+    _describe_ids_batch_size = 1000
 
 
 class EBSVolumeAPI(APIHelper):
     _type = EC2API._type
     _resource_class = EBSVolume_Resource
     _describe_function = 'describe_volumes'
-    _describe_token_property = 'NextToken'
+    _describe_page_size = 500
+    _describe_filters = dict(EC2_TAG_FILTERS, state='status')
     _describe_resource_list_property = 'Volumes'
     _describe_resource_id_property = 'VolumeId'
+    _describe_ids_param = 'VolumeIds'
+    _describe_ids_batch_size = 500
 
 
 class SnapshotAPI(APIHelper):
     _type = EC2API._type
     _resource_class = Snapshot_Resource
     _describe_function = 'describe_snapshots'
-    _describe_token_property = 'NextToken'
+    _describe_page_size = 1000
+    _describe_filters = dict(EC2_TAG_FILTERS, state='status')
     _describe_resource_list_property = 'Snapshots'
     _describe_resource_id_property = 'SnapshotId'
+    _describe_ids_param = 'SnapshotIds'
+    _describe_ids_batch_size = 1000
 
 
 class AMIAPI(APIHelper):
@@ -276,51 +541,72 @@ class AMIAPI(APIHelper):
     _resource_class = AMI_Resource
     _describe_function = 'describe_images'
     _describe_params = {'Owners': ['self']}
+    _describe_page_size = 1000
+    _describe_filters = dict(EC2_TAG_FILTERS, state='state')
     _describe_resource_list_property = 'Images'
     _describe_resource_id_property = 'ImageId'
+    _describe_ids_param = 'ImageIds'
+    _describe_ids_batch_size = 1000
 
 
 class ENIAPI(APIHelper):
     _type = EC2API._type
     _resource_class = ENI_Resource
     _describe_function = 'describe_network_interfaces'
+    _describe_page_size = 1000
+    _describe_filters = dict(EC2_TAG_FILTERS, vpc='vpc-id', state='status')
     _describe_resource_list_property = 'NetworkInterfaces'
     _describe_resource_id_property = 'NetworkInterfaceId'
+    _describe_ids_param = 'NetworkInterfaceIds'
+    _describe_ids_batch_size = 1000
 
 
 class KeyPairAPI(APIHelper):
     _type = EC2API._type
     _resource_class = KeyPair_Resource
     _describe_function = 'describe_key_pairs'
+    _describe_filters = EC2_TAG_FILTERS
     _describe_resource_list_property = 'KeyPairs'
     _describe_resource_id_property = 'KeyName'
+    _describe_ids_param = 'KeyNames'
+    _describe_ids_batch_size = 1000
 
 
 class EFSAPI(APIHelper):
     _type = 'efs'
     _resource_class = EFS_Resource
     _describe_function = 'describe_file_systems'
-    _describe_token_property = 'Marker'
-    _describe_token_property_response = 'NextMarker'
+    _describe_page_size = 100
     _describe_resource_list_property = 'FileSystems'
     _describe_resource_id_property = 'FileSystemId'
+    _describe_id_param = 'FileSystemId'
+
+    @classmethod
+    def get(cls, with_mount_targets=False, max_workers=parallel.MAX_WORKERS, **kwargs):
+        """ Like APIHelper.get. The mount targets of each file system and their security groups
+            are loaded when first used, or for all file systems at once, in parallel, with
+            with_mount_targets """
+        file_systems = super(EFSAPI, cls).get(max_workers=max_workers, **kwargs)
+        if with_mount_targets:
+            EFS_Resource.prefetch_mount_targets(file_systems, max_workers)
+        return file_systems
 
 
 class DBSnapshotAPI(APIHelper):
     _type = RDSAPI._type
     _resource_class = DBSnapshot_Resource
     _describe_function = 'describe_db_snapshots'
-    _describe_token_property = 'Marker'
+    _describe_page_size = 100
     _describe_resource_list_property = 'DBSnapshots'
     _describe_resource_id_property = 'DBSnapshotIdentifier'
+    _describe_id_param = 'DBSnapshotIdentifier'
 
 
 class LambdaAPI(APIHelper):
     _type = 'lambda'
     _resource_class = Lambda_Resource
     _describe_function = 'list_functions'
-    _describe_token_property = 'Marker'
-    _describe_token_property_response = 'NextMarker'
+    _describe_page_size = 50
     _describe_resource_list_property = 'Functions'
     _describe_resource_id_property = 'FunctionName'
 
@@ -329,7 +615,7 @@ class CloudFormationAPI(APIHelper):
     _type = 'cloudformation'
     _resource_class = CloudFormation_Resource
     _describe_function = 'describe_stacks'
-    _describe_token_property = 'NextToken'
     _describe_resource_list_property = 'Stacks'
     _describe_resource_id_property = 'StackName'
+    _describe_id_param = 'StackName'
 
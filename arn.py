@@ -7,7 +7,7 @@ ARN_FORMAT = 'arn:aws:%(service)s:%(region)s:%(account_id)s:%(resource)s'
 
 def arn(**kwargs):
     for arg in 'region', 'account_id':
-        if arg not in kwargs:
+        if kwargs.get(arg) is None:
             kwargs[arg] = getattr(aws, arg)
     return ARN_FORMAT % kwargs
 
@@ -24,10 +24,21 @@ def state_machine_execution(machine, name):
     return arn(service='states', resource='execution:%s:%s' % (machine, name))
 
 
-def rds_instance(name):
-    return arn(service='rds', resource='db:' + name)
+def rds_instance(name, **kwargs):
+    return arn(service='rds', resource='db:' + name, **kwargs)
 
 
-def rds_snapshot(name):
-    return arn(service='rds', resource='snapshot:' + name)
+def rds_snapshot(name, **kwargs):
+    return arn(service='rds', resource='snapshot:' + name, **kwargs)
 
+
+def lambda_function(name, **kwargs):
+    return arn(service='lambda', resource='function:' + name, **kwargs)
+
+
+def s3_bucket(name):
+    return arn(service='s3', resource=name, region='', account_id='')
+
+
+def efs_file_system(file_system_id, **kwargs):
+    return arn(service='elasticfilesystem', resource='file-system/' + file_system_id, **kwargs)
@@ -1,20 +1,36 @@
 __author__ = 'slopez'
 
 import sys
-import boto3
 from botocore.exceptions import ClientError
 import boto3_clients as clients
+import parallel
+
+# Local profile and region used when no account is given
+PROFILE = 'prod'
+REGION = 'us-east-1'
+
+# Largest number of group names accepted by describe_auto_scaling_groups
+MAX_NAMES = 50
+
+
+def _location(account=None, role=None):
+    # Groups in other accounts are reached by assuming a role in them, see sessions.py
+    if account is None:
+        return {'region': REGION, 'profile': PROFILE}
+    return {'region': REGION, 'account': account, 'role': role}
 
-session = boto3.Session(profile_name='prod', region_name='us-east-1')
-autoscaling = session.client('autoscaling')
-ec2 = session.client('ec2')
 
 class ASG (object):
 
-    def __init__(self, name):
+    def __init__(self, name, account=None, role=None, data=None):
+        """ data is the description of the group, if already known. Otherwise it is requested """
+        location = _location(account, role)
+        self._autoscaling = clients.client('autoscaling', **location)
+        self._ec2 = clients.client('ec2', **location)
         try:
-            response = autoscaling.describe_auto_scaling_groups(AutoScalingGroupNames=[name])['AutoScalingGroups'][0]
-            self.data = response
+            if data is None:
+                data = self._autoscaling.describe_auto_scaling_groups(AutoScalingGroupNames=[name])['AutoScalingGroups'][0]
+            self.data = data
             self.name = name
             if 'LaunchTemplate' in self.data.keys():
                 self.template = self.data['LaunchTemplate']
@@ -26,14 +42,14 @@ class ASG (object):
 
     def stop(self):
         print 'Stopping AutoScaling Group',self.name
-        autoscaling.suspend_processes(
+        self._autoscaling.suspend_processes(
             AutoScalingGroupName=self.name,
             ScalingProcesses=['Launch','Terminate']
         )
         print 'Suspended launch and termination processes'
         for instance in self.instances:
             try:
-                ec2.stop_instances(InstanceIds=[instance['InstanceId']])
+                self._ec2.stop_instances(InstanceIds=[instance['InstanceId']])
                 print 'Stopped instance',instance['InstanceId']
             except ClientError as e:
                 print 'Unable to stop instance',instance['InstanceId'],e
@@ -42,20 +58,20 @@ class ASG (object):
         print 'Restarting AutoScaling Group',self.name
         for instance in self.instances:
             try:
-                ec2.start_instances(InstanceIds=[instance['InstanceId']])
+                self._ec2.start_instances(InstanceIds=[instance['InstanceId']])
                 print 'Started instance',instance['InstanceId']
             except ClientError as e:
                 print 'Unable to start instance',instance['InstanceId'],e
         
     def resume(self):
-        autoscaling.resume_processes(
+        self._autoscaling.resume_processes(
             AutoScalingGroupName=self.name,
             ScalingProcesses=['Launch','Terminate']
         )
         print 'Resumed launch and termination processes'
 
     def set_template(self, template_name):
-        autoscaling.update_auto_scaling_group(
+        self._autoscaling.update_auto_scaling_group(
             AutoScalingGroupName=self.name,
             LaunchTemplate={
                 'LaunchTemplateName': template_name,
@@ -65,10 +81,33 @@ class ASG (object):
         print 'Updated Group %s with latest version of template %s' %(self.name, template_name)
 
 
-def find_asg(environment):
-    for group in autoscaling.describe_auto_scaling_groups()['AutoScalingGroups']:
+def get_many(names, account=None, role=None):
+    """ Returns the ASG objects for the given group names, describing up to MAX_NAMES groups per
+        call, with the calls made in parallel. Also returns the names of the groups not found """
+    autoscaling = clients.client('autoscaling', **_location(account, role))
+    names = list(names)
+
+    def describe(chunk):
+        pages = autoscaling.get_paginator('describe_auto_scaling_groups').paginate(
+            AutoScalingGroupNames=chunk)
+        return [group for page in pages for group in page['AutoScalingGroups']]
+
+    found = {}
+    for groups in parallel.pmap(describe, list(parallel.chunks(names, MAX_NAMES))):
+        for group in groups:
+            found[group['AutoScalingGroupName']] = group
+    return ([ASG(name, account, role, found[name]) for name in names if name in found],
+            [name for name in names if name not in found])
+
+
+def find_asg(environment, account=None, role=None):
+    autoscaling = clients.client('autoscaling', **_location(account, role))
+    pages = autoscaling.get_paginator('describe_auto_scaling_groups').paginate(
+        PaginationConfig={'PageSize': 100})
+    for page in pages:
+        for group in page['AutoScalingGroups']:
             if filter(lambda tag: tag['Value'].lower() == environment.lower(), group['Tags']):
-                ASG(group['AutoScalingGroupName']).stop()
+                ASG(group['AutoScalingGroupName'], account, role, group).stop()
              
 
 if __name__ == '__main__':
@@ -0,0 +1,581 @@
+# -*- coding: utf8 -*-
+""" Offline benchmarks of the library against synthetic AWS accounts.
+
+    A SyntheticAccount holds generated EC2 instances, snapshots, security groups, RDS instances
+    and CloudFormation stacks, and answers the API calls of every client of the default boto3
+    session from them, without sending any request. Each answer takes the configured latency,
+    and requests over the configured rate of each service are throttled and retried the way
+    botocore does, through the client-side rate limiter (see throttling.py).
+
+    Every benchmark runs in its own process, so its peak memory and the caches of the library
+    (reference.py, indexes.py, cache.py) do not depend on the benchmarks run before it. The peak
+    memory includes the synthetic account itself, so it is only comparable across runs of the
+    same size.
+
+    Usage:
+        python -m awsutils.benchmarks --sizes 1000 10000 --latency 0.01
+"""
+
+import argparse
+import collections
+import datetime
+import json
+import multiprocessing
+import os
+import random
+import resource
+import sys
+import tempfile
+import threading
+import time
+from botocore.awsrequest import AWSResponse
+from dateutil.tz import tzutc
+from . import actions
+from . import apihelpers
+from . import parallel
+from . import stacks
+from . import tags
+from . import throttling
+
+ACCOUNT = '123456789012'
+REGION = 'us-east-1'
+SIZES = (1000, 10000, 100000)
+
+# Latency of every simulated request, in seconds
+LATENCY = 0.01
+# Requests per second accepted by each simulated service before it throttles. Services not
+# listed use the 'default' rate given, or DEFAULT_API_RATE.
+DEFAULT_API_RATE = 20
+API_RATES = {
+    'ec2': 100,
+    'rds': 20,
+    'cloudformation': 10,
+}
+
+VPCS = 10
+SUBNETS_PER_VPC = 3
+# Instances terminated by the terminate sweeps, instances stopped by the bulk stop, and stacks
+# launched, whatever the size
+TERMINATE_LIMIT = 1000
+STOP_LIMIT = 3000
+STACKS = 20
+
+# Key of the parameters of a call in its request context
+_PARAMS = 'benchmark_params'
+
+
+class SimulatedError(Exception):
+
+    def __init__(self, code, status=400, message=''):
+        super(SimulatedError, self).__init__(code)
+        self.code = code
+        self.status = status
+        self.message = message
+
+
+class _RateLimit(object):
+    """ Rate limit of a simulated API: requests beyond it are throttled """
+
+    def __init__(self, rate):
+        self.rate = float(rate)
+        self._tokens = self.rate
+        self._last_refill = time.time()
+        self._lock = threading.Lock()
+
+    def allow(self):
+        with self._lock:
+            now = time.time()
+            self._tokens = min(self.rate, self._tokens + (now - self._last_refill) * self.rate)
+            self._last_refill = now
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return True
+            return False
+
+
+def _page(items, params, limit_key, token_key):
+    """ Returns a page of items and the token of the next page, or None if it is the last one """
+    start = int(params.get(token_key) or 0)
+    limit = params.get(limit_key) or len(items)
+    end = start + limit
+    return items[start:end], (str(end) if end < len(items) else None)
+
+
+def _listing(items, params, list_key, limit_key='MaxResults', token_key='NextToken',
+             response_token_key=None):
+    page, token = _page(items, params, limit_key, token_key)
+    response = {list_key: page}
+    if token is not None:
+        response[response_token_key or token_key] = token
+    return response
+
+
+def _field(item, path):
+    for key in path.split('.'):
+        item = item[key]
+    return item
+
+
+def _filter(items, filters, fields):
+    """ Applies EC2 style filters to the items. fields are the paths of the filtered fields, by
+        filter name """
+    for f in filters or []:
+        if f['Name'] not in fields:
+            raise NotImplementedError('Filter %s is not simulated' % f['Name'])
+        items = [item for item in items if _field(item, fields[f['Name']]) in f['Values']]
+    return items
+
+
+def _tags(name, i):
+    return [{'Key': 'Name', 'Value': name}, {'Key': 'env', 'Value': ('prod', 'test', 'dev')[i % 3]}]
+
+
+class SyntheticAccount(object):
+    """ AWS account with 'size' EC2 instances and snapshots, a tenth as many security groups and a
+        hundredth as many RDS instances. Once installed, it answers the API calls of all the
+        clients of the default boto3 session """
+
+    def __init__(self, size, latency=LATENCY, api_rates=None, region=REGION):
+        self.size = size
+        self.latency = latency
+        self.region = region
+        # A rate of None leaves the service unlimited
+        self._rates = dict(API_RATES, **(api_rates or {}))
+        self._limits = {}
+        self.calls = collections.Counter()
+        self.attempts = collections.Counter()
+        self.throttles = collections.Counter()
+        self._lock = threading.Lock()
+        self._build()
+        self._handlers = {
+            ('sts', 'GetCallerIdentity'): self._get_caller_identity,
+            ('ec2', 'DescribeRegions'): self._describe_regions,
+            ('ec2', 'DescribeVpcs'): self._describe_vpcs,
+            ('ec2', 'DescribeSubnets'): self._describe_subnets,
+            ('ec2', 'DescribeSecurityGroups'): self._describe_security_groups,
+            ('ec2', 'DescribeInstances'): self._describe_instances,
+            ('ec2', 'DescribeSnapshots'): self._describe_snapshots,
+            ('ec2', 'ModifyInstanceAttribute'): self._modify_instance_attribute,
+            ('ec2', 'TerminateInstances'): self._terminate_instances,
+            ('ec2', 'StopInstances'): self._stop_instances,
+            ('rds', 'DescribeDBInstances'): self._describe_db_instances,
+            ('rds', 'DescribeEvents'): self._describe_events,
+            ('resourcegroupstaggingapi', 'GetResources'): self._get_resources,
+            ('cloudformation', 'DescribeStacks'): self._describe_stacks,
+            ('cloudformation', 'ValidateTemplate'): self._validate_template,
+            ('cloudformation', 'CreateStack'): self._create_stack,
+            ('cloudformation', 'UpdateStack'): self._update_stack,
+            ('s3', 'PutObject'): self._put_object,
+        }
+
+    def _build(self):
+        now = datetime.datetime.now(tzutc())
+        self.vpcs = [{'VpcId': 'vpc-%08x' % i, 'CidrBlock': '10.%d.0.0/16' % i,
+                      'State': 'available', 'IsDefault': False} for i in range(VPCS)]
+        self.subnets = [{'SubnetId': 'subnet-%08x' % (i * SUBNETS_PER_VPC + j),
+                         'VpcId': vpc['VpcId'], 'CidrBlock': '10.%d.%d.0/24' % (i, j),
+                         'AvailabilityZone': self.region + 'abc'[j], 'State': 'available'}
+                        for i, vpc in enumerate(self.vpcs) for j in range(SUBNETS_PER_VPC)]
+        self.security_groups = [{'GroupId': 'sg-%017x' % i, 'GroupName': 'default',
+                                 'VpcId': vpc['VpcId'], 'OwnerId': ACCOUNT,
+                                 'Description': 'default VPC security group',
+                                 'IpPermissions': [], 'IpPermissionsEgress': []}
+                                for i, vpc in enumerate(self.vpcs)]
+        self.security_groups += [{'GroupId': 'sg-%017x' % i, 'GroupName': 'group-%d' % i,
+                                  'VpcId': self.vpcs[i % VPCS]['VpcId'], 'OwnerId': ACCOUNT,
+                                  'Description': '', 'IpPermissions': [],
+                                  'IpPermissionsEgress': [], 'Tags': _tags('group-%d' % i, i)}
+                                 for i in range(VPCS, VPCS + max(1, self.size // 10))]
+        self.instances = [self._instance(i, now) for i in range(self.size)]
+        self.instances_by_id = dict((i['InstanceId'], i) for i in self.instances)
+        self.snapshots = [{'SnapshotId': 'snap-%017x' % i, 'VolumeId': 'vol-%017x' % i,
+                           'State': 'completed', 'StartTime': now - datetime.timedelta(hours=i),
+                           'VolumeSize': 8, 'OwnerId': ACCOUNT, 'Progress': '100%',
+                           'Description': '', 'Encrypted': False,
+                           'Tags': _tags('snapshot-%d' % i, i)} for i in range(self.size)]
+        self.db_instances = [self._db_instance(i, now) for i in range(max(1, self.size // 100))]
+        self.events = [{'SourceIdentifier': db['DBInstanceIdentifier'], 'SourceType': 'db-instance',
+                        'Message': 'DB instance %s' % kind, 'EventCategories': [kind],
+                        'Date': now - datetime.timedelta(hours=hours)}
+                       for db in self.db_instances
+                       for kind, hours in (('creation', 300), ('availability', 30),
+                                           ('notification', 3))]
+        # Half of the stacks launched already exist, and are updated
+        self.stacks = dict(('stack-%d' % i, self._stack('stack-%d' % i, now))
+                           for i in range(0, STACKS, 2))
+
+    def _instance(self, i, now):
+        subnet = self.subnets[i % len(self.subnets)]
+        group = self.security_groups[VPCS + i % (len(self.security_groups) - VPCS)]
+        stopped = i % 3 == 0
+        launched = now - datetime.timedelta(hours=i % 5000)
+        return {
+            'InstanceId': 'i-%017x' % i,
+            'ImageId': 'ami-%08x' % (i % 50),
+            'InstanceType': ('t3.micro', 'm5.large', 'c5.xlarge')[i % 3],
+            'LaunchTime': launched,
+            'State': {'Code': 80, 'Name': 'stopped'} if stopped else {'Code': 16, 'Name': 'running'},
+            'StateTransitionReason': 'User initiated (%s GMT)' %
+                                     (launched + datetime.timedelta(hours=1)).strftime(
+                                         '%Y-%m-%d %H:%M:%S') if stopped else '',
+            'SubnetId': subnet['SubnetId'],
+            'VpcId': group['VpcId'],
+            'PrivateIpAddress': '10.%d.%d.%d' % (i % VPCS, (i // 250) % 250, i % 250),
+            'SecurityGroups': [{'GroupId': group['GroupId'], 'GroupName': group['GroupName']}],
+            'Tags': _tags('instance-%d' % i, i),
+        }
+
+    def _db_instance(self, i, now):
+        name = 'db-%d' % i
+        return {
+            'DBInstanceIdentifier': name,
+            'DBInstanceArn': 'arn:aws:rds:%s:%s:db:%s' % (self.region, ACCOUNT, name),
+            'DBInstanceClass': 'db.m5.large',
+            'Engine': 'mysql',
+            'DBInstanceStatus': 'stopped' if i % 4 == 0 else 'available',
+            'InstanceCreateTime': now - datetime.timedelta(days=i % 100),
+            'DBSubnetGroup': {'VpcId': self.vpcs[i % VPCS]['VpcId']},
+            'VpcSecurityGroups': [{'VpcSecurityGroupId': self.security_groups[i % VPCS]['GroupId'],
+                                   'Status': 'active'}],
+        }
+
+    def _stack(self, name, now):
+        return {'StackName': name, 'StackId': 'arn:aws:cloudformation:%s:%s:stack/%s/0' %
+                (self.region, ACCOUNT, name), 'StackStatus': 'CREATE_COMPLETE',
+                'CreationTime': now, 'Parameters': [], 'Tags': []}
+
+    # Simulated API calls. Each one takes the parameters of the call and returns its response,
+    # or raises a SimulatedError. They run holding the lock of the account
+
+    def _get_caller_identity(self, params):
+        return {'Account': ACCOUNT, 'Arn': 'arn:aws:iam::%s:user/benchmark' % ACCOUNT,
+                'UserId': 'benchmark'}
+
+    def _describe_regions(self, params):
+        return {'Regions': [{'RegionName': self.region}]}
+
+    def _describe_vpcs(self, params):
+        return _listing(self.vpcs, params, 'Vpcs')
+
+    def _describe_subnets(self, params):
+        return _listing(self.subnets, params, 'Subnets')
+
+    def _describe_security_groups(self, params):
+        groups = self.security_groups
+        if params.get('GroupIds'):
+            wanted = set(params['GroupIds'])
+            groups = [group for group in groups if group['GroupId'] in wanted]
+        groups = _filter(groups, params.get('Filters'), {'group-name': 'GroupName',
+                                                         'vpc-id': 'VpcId'})
+        return _listing(groups, params, 'SecurityGroups')
+
+    def _describe_instances(self, params):
+        instances = self.instances
+        if params.get('InstanceIds'):
+            missing = [i for i in params['InstanceIds'] if i not in self.instances_by_id]
+            if missing:
+                raise SimulatedError('InvalidInstanceID.NotFound',
+                                     message="The instance IDs '%s' do not exist" % missing)
+            instances = [self.instances_by_id[i] for i in params['InstanceIds']]
+        instances = _filter(instances, params.get('Filters'), {
+            'vpc-id': 'VpcId', 'instance-state-name': 'State.Name'})
+        response = _listing(instances, params, 'Reservations')
+        response['Reservations'] = [{'ReservationId': 'r-%s' % instance['InstanceId'][2:],
+                                     'OwnerId': ACCOUNT, 'Instances': [instance]}
+                                    for instance in response['Reservations']]
+        return response
+
+    def _describe_snapshots(self, params):
+        snapshots = self.snapshots
+        if params.get('SnapshotIds'):
+            wanted = set(params['SnapshotIds'])
+            snapshots = [snapshot for snapshot in snapshots if snapshot['SnapshotId'] in wanted]
+        return _listing(snapshots, params, 'Snapshots')
+
+    def _instance_for_update(self, params):
+        if params.get('DryRun'):
+            raise SimulatedError('DryRunOperation', 412)
+        instance_id = params['InstanceId']
+        if instance_id not in self.instances_by_id:
+            raise SimulatedError('InvalidInstanceID.NotFound')
+        return self.instances_by_id[instance_id]
+
+    def _modify_instance_attribute(self, params):
+        instance = self._instance_for_update(params)
+        if 'Groups' in params:
+            instance['SecurityGroups'] = [{'GroupId': g, 'GroupName': ''} for g in params['Groups']]
+        return {}
+
+    def _change_state(self, params, code, name, list_key):
+        if params.get('DryRun'):
+            raise SimulatedError('DryRunOperation', 412)
+        # As in EC2, a single unknown ID fails the whole call
+        missing = [i for i in params['InstanceIds'] if i not in self.instances_by_id]
+        if missing:
+            raise SimulatedError('InvalidInstanceID.NotFound', message=', '.join(missing))
+        changes = []
+        for instance_id in params['InstanceIds']:
+            instance = self.instances_by_id[instance_id]
+            previous = instance['State']
+            instance['State'] = {'Code': code, 'Name': name}
+            changes.append({'InstanceId': instance_id, 'PreviousState': previous,
+                            'CurrentState': instance['State']})
+        return {list_key: changes}
+
+    def _terminate_instances(self, params):
+        return self._change_state(params, 32, 'shutting-down', 'TerminatingInstances')
+
+    def _stop_instances(self, params):
+        return self._change_state(params, 64, 'stopping', 'StoppingInstances')
+
+    def _describe_db_instances(self, params):
+        instances = self.db_instances
+        if params.get('DBInstanceIdentifier'):
+            instances = [db for db in instances
+                         if db['DBInstanceIdentifier'] == params['DBInstanceIdentifier']]
+            if not instances:
+                raise SimulatedError('DBInstanceNotFound', 404)
+        return _listing(instances, params, 'DBInstances', 'MaxRecords', 'Marker')
+
+    def _describe_events(self, params):
+        return _listing(self.events, params, 'Events', 'MaxRecords', 'Marker')
+
+    def _get_resources(self, params):
+        if params.get('ResourceTypeFilters') != ['rds:db']:
+            raise NotImplementedError('Only the tags of RDS instances are simulated')
+        mappings = [{'ResourceARN': db['DBInstanceArn'],
+                     'Tags': _tags(db['DBInstanceIdentifier'], i)}
+                    for i, db in enumerate(self.db_instances)]
+        response = _listing(mappings, params, 'ResourceTagMappingList', 'ResourcesPerPage',
+                            'PaginationToken')
+        response.setdefault('PaginationToken', '')
+        return response
+
+    def _describe_stacks(self, params):
+        if params.get('StackName'):
+            if params['StackName'] not in self.stacks:
+                raise SimulatedError('ValidationError', message='Stack with id %s does not exist'
+                                                                % params['StackName'])
+            return {'Stacks': [self.stacks[params['StackName']]]}
+        return _listing(sorted(self.stacks.values(), key=lambda s: s['StackName']), params,
+                        'Stacks')
+
+    def _validate_template(self, params):
+        return {'Parameters': []}
+
+    def _create_stack(self, params):
+        stack = self._stack(params['StackName'], datetime.datetime.now(tzutc()))
+        self.stacks[params['StackName']] = stack
+        return {'StackId': stack['StackId']}
+
+    def _update_stack(self, params):
+        stack = self._describe_stacks(params)['Stacks'][0]
+        stack['StackStatus'] = 'UPDATE_COMPLETE'
+        return {'StackId': stack['StackId']}
+
+    def _put_object(self, params):
+        return {'ETag': '"0"'}
+
+    def _allow(self, service):
+        if service not in self._limits:
+            rate = self._rates.get(service, self._rates.get('default', DEFAULT_API_RATE))
+            self._limits[service] = _RateLimit(rate) if rate is not None else None
+        return self._limits[service] is None or self._limits[service].allow()
+
+    def _remember_params(self, params, context=None, **kwargs):
+        # The parameters of the call, as given by the caller, before they are serialized
+        if context is not None:
+            context[_PARAMS] = params
+
+    def _call(self, model, context=None, **kwargs):
+        """ Answers an API call. Every attempt waits for the client-side rate limiter of the
+            service, as a request sent by botocore would """
+        service, operation = model.service_model.service_name, model.name
+        handler = self._handlers.get((service, operation))
+        if handler is None:
+            raise NotImplementedError('%s.%s is not simulated' % (service, operation))
+        params = (context or {}).get(_PARAMS, {})
+        token_bucket = throttling.bucket(service, (context or {}).get('client_region'))
+        with self._lock:
+            self.calls[(service, operation)] += 1
+        for attempt in range(throttling.settings['max_attempts']):
+            token_bucket.acquire()
+            with self._lock:
+                self.attempts[(service, operation)] += 1
+            if self._allow(service):
+                token_bucket.on_success()
+                if self.latency:
+                    time.sleep(self.latency)
+                try:
+                    with self._lock:
+                        status, parsed = 200, handler(params)
+                except SimulatedError as e:
+                    status, parsed = e.status, {'Error': {'Code': e.code, 'Message': e.message}}
+                parsed['ResponseMetadata'] = {'HTTPStatusCode': status, 'RetryAttempts': attempt}
+                return AWSResponse(None, status, {}, None), parsed
+            with self._lock:
+                self.throttles[(service, operation)] += 1
+            token_bucket.on_throttle()
+            # Jittered exponential backoff, as in the 'standard' retry mode of botocore
+            time.sleep(random.random() * min(20, 2 ** attempt))
+        return AWSResponse(None, 400, {}, None), {
+            'Error': {'Code': 'Throttling', 'Message': 'Rate exceeded'},
+            'ResponseMetadata': {'HTTPStatusCode': 400, 'RetryAttempts': attempt}}
+
+    def install(self):
+        """ Makes all the clients of the default boto3 session call this account. Clients created
+            before are not affected """
+        import boto3
+        boto3.setup_default_session(region_name=self.region, aws_access_key_id='benchmark',
+                                    aws_secret_access_key='benchmark')
+        boto3.DEFAULT_SESSION.events.register('before-parameter-build', self._remember_params)
+        boto3.DEFAULT_SESSION.events.register('before-call', self._call)
+        return self
+
+    def reset_counts(self):
+        with self._lock:
+            self.calls.clear()
+            self.attempts.clear()
+            self.throttles.clear()
+
+
+# Benchmarks. Each one takes an installed SyntheticAccount, prepares what it needs and returns the
+# function to time
+
+def _get(api):
+    def benchmark(account):
+        return api.get
+    return benchmark
+
+
+def _tag_retrieval(account):
+    db_instances = apihelpers.RDSAPI.get()
+    return lambda: tags.prefetch(db_instances)
+
+
+def _uptime_report(account):
+    resources = apihelpers.EC2API.get() + apihelpers.RDSAPI.get()
+    return lambda: [(resource.uptime, resource.downtime) for resource in resources]
+
+
+def _terminate_sweep(account):
+    instances = apihelpers.EC2API.get()[:TERMINATE_LIMIT]
+    return lambda: parallel.pmap(lambda instance: instance.terminate(), instances)
+
+
+def _bulk_terminate(account):
+    instances = apihelpers.EC2API.get()[:TERMINATE_LIMIT]
+    return lambda: actions.terminate_many(instances)
+
+
+def _bulk_stop(account):
+    instances = apihelpers.EC2API.get()[:STOP_LIMIT]
+    return lambda: actions.shutdown_many(instances)
+
+
+def _stack_launch(account):
+    template = tempfile.NamedTemporaryFile(suffix='.yaml')
+    template.write('Resources: {}\n')
+    template.flush()
+
+    def launch():
+        # Stack.launch reports its progress on stdout
+        stdout, sys.stdout = sys.stdout, open(os.devnull, 'w')
+        try:
+            for i in range(STACKS):
+                stacks.Stack('stack-%d' % i, 'benchmark', template.name).launch()
+        finally:
+            sys.stdout = stdout
+    launch.template = template
+    return launch
+
+
+BENCHMARKS = collections.OrderedDict([
+    ('get_instances', _get(apihelpers.EC2API)),
+    ('get_snapshots', _get(apihelpers.SnapshotAPI)),
+    ('get_security_groups', _get(apihelpers.SecurityGroupAPI)),
+    ('get_db_instances', _get(apihelpers.RDSAPI)),
+    ('tag_retrieval', _tag_retrieval),
+    ('uptime_report', _uptime_report),
+    ('terminate_sweep', _terminate_sweep),
+    ('bulk_terminate', _bulk_terminate),
+    ('bulk_stop', _bulk_stop),
+    ('stack_launch', _stack_launch),
+])
+
+
+def _count(counter):
+    return dict(('%s.%s' % key, count) for key, count in counter.items())
+
+
+def run_benchmark(name, size, latency=LATENCY, api_rates=None):
+    """ Runs a benchmark in this process. Returns its results """
+    account = SyntheticAccount(size, latency, api_rates).install()
+    work = BENCHMARKS[name](account)
+    account.reset_counts()
+    started = time.time()
+    work()
+    seconds = time.time() - started
+    return {
+        'benchmark': name,
+        'size': size,
+        'seconds': seconds,
+        'calls': sum(account.calls.values()),
+        'attempts': sum(account.attempts.values()),
+        'throttles': sum(account.throttles.values()),
+        # Peak resident memory of the process, which Linux reports in KB
+        'peak_memory_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0,
+        'operations': _count(account.calls),
+    }
+
+
+def run(names=None, sizes=SIZES, latency=LATENCY, api_rates=None, progress=None):
+    """ Runs the given benchmarks (all of them by default) at every size, each one in a new
+        process. Returns the list of their results """
+    results = []
+    for size in sizes:
+        for name in names or BENCHMARKS:
+            pool = multiprocessing.Pool(1)
+            try:
+                result = pool.apply(run_benchmark, (name, size, latency, api_rates))
+            finally:
+                pool.terminate()
+            results.append(result)
+            if progress is not None:
+                progress(result)
+    return results
+
+
+def format_result(result):
+    return '%-20s %8d %9.2f %7d %8d %9d %9.1f' % (
+        result['benchmark'], result['size'], result['seconds'], result['calls'],
+        result['attempts'], result['throttles'], result['peak_memory_mb'])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Offline benchmarks against synthetic accounts')
+    parser.add_argument('--benchmarks', nargs='+', choices=list(BENCHMARKS))
+    parser.add_argument('--sizes', nargs='+', type=int, default=list(SIZES))
+    parser.add_argument('--latency', type=float, default=LATENCY)
+    parser.add_argument('--no-throttling', action='store_true',
+                        help='Do not limit the request rate of the simulated services')
+    parser.add_argument('--json', help='File to write the results to')
+    args = parser.parse_args(argv)
+    api_rates = None
+    if args.no_throttling:
+        api_rates = dict([(service, None) for service in API_RATES], default=None)
+    print '%-20s %8s %9s %7s %8s %9s %9s' % ('benchmark', 'size', 'seconds', 'calls', 'attempts',
+                                             'throttles', 'memory MB')
+
+    def progress(result):
+        print format_result(result)
+        sys.stdout.flush()
+
+    results = run(args.benchmarks, args.sizes, args.latency, api_rates, progress)
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+
+
+if __name__ == '__main__':
+    main()
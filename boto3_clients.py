@@ -13,27 +13,117 @@
 # To prevent that, which has nasty effects like setting boto3 to None, thus breaking the __getattr__ method,
 # we first save a reference to the current module in 'ref'
 
-import boto3
 import sys
+import threading
+import cassettes
+import metrics
+import throttling
 
 
 class boto3_clients(object):
 
+    def __init__(self):
+        # Clients by (service, region, account, role, profile). The account, role or profile say
+        # which credentials the client uses
+        self._clients = {}
+        self._key_locks = {}
+        self._services = set()
+        self._lock = threading.Lock()
+        # botocore sessions are not thread-safe, so clients are created one at a time
+        self._session_lock = threading.Lock()
+        self._attr_lock = threading.RLock()
+
+    def _new_client(self, service, region=None, account=None, role=None, profile=None):
+        # boto3 is only imported when the first client is needed, which keeps imports fast for
+        # scripts which never use some (or any) of the services
+        import boto3
+        # Every client shares the rate limiter of its service, region and account (see
+        # throttling.py), and the connection settings of throttling.client_config
+        if account is None and profile is None:
+            with self._session_lock:
+                # The default session is created along with the first client
+                client = boto3.client(service, region_name=region, config=throttling.client_config())
+        else:
+            import sessions
+            # The role is assumed outside the lock, so other clients can be created meanwhile
+            session = sessions.pool.session(account, role, region, profile)
+            with self._session_lock:
+                client = session.client(service, config=throttling.client_config())
+        # Clients of a local profile get rate limiters of their own, as its account is not known
+        bucket_account = account if profile is None else 'profile:%s' % profile
+        # Calls are counted and timed per service and operation (see metrics.py), and recorded
+        # or replayed per account and role, or profile, while a cassette is active (see
+        # cassettes.py)
+        identity = bucket_account if role is None else '%s/%s' % (bucket_account, role)
+        return cassettes.register(metrics.register(throttling.register(client, bucket_account)),
+                                  identity)
+
+    def client(self, service, region=None, account=None, role=None, profile=None):
+        """ Returns the shared client for a service in the given region. The default region is used
+            if no region is given.
+            If an account is given, the client uses the credentials of a role assumed in that account
+            (see sessions.py). A local profile can be used instead.
+            Clients can be used from any number of threads. Each one is created only once, and
+            keeps a pool of connections shared by all of them. """
+        key = (service, region, account, role, profile)
+        with self._lock:
+            client = self._clients.get(key)
+            if client is not None:
+                return client
+            key_lock = self._key_locks.setdefault(key, threading.Lock())
+        # Threads needing the same client wait for the first one to create it
+        with key_lock:
+            with self._lock:
+                client = self._clients.get(key)
+            if client is None:
+                client = self._new_client(service, region, account, role, profile)
+                with self._lock:
+                    self._clients[key] = client
+        return client
+
+    def configure(self, **settings):
+        """ Changes the connection settings of the clients: max_pool_connections, connect_timeout,
+            read_timeout, tcp_keepalive, retry_mode and max_attempts (see throttling.py).
+            The clients created so far are dropped, and created again with the new settings when
+            next needed """
+        throttling.configure(**settings)
+        with self._lock:
+            self._clients.clear()
+            for service in self._services:
+                self.__dict__.pop(service, None)
+            self._services.clear()
+
     def __getattr__(self, attr):
+        if attr.startswith('__'):
+            raise AttributeError(attr)
+        if attr in ('account_id', 'regions', 'region'):
+            with self._attr_lock:
+                if attr in self.__dict__:
+                    return self.__dict__[attr]
+                attr_value = self._account_attribute(attr)
+        else:
+            attr_value = self.client(attr)
+            with self._lock:
+                self._services.add(attr)
+
+        setattr(self, attr, attr_value)
+        return attr_value
+
+    def _account_attribute(self, attr):
         if attr == 'account_id':
-            attr_value = self.sts.get_caller_identity()['Account']
-        elif attr == 'region':
+            return self.sts.get_caller_identity()['Account']
+        elif attr == 'regions':
+            # Only the regions enabled for the account are returned
+            return [r['RegionName'] for r in self.ec2.describe_regions()['Regions']]
+        else:
             # if the default session is None, it means no client was created
             # so we force the creation of a client.
-            attr_value = getattr(boto3.DEFAULT_SESSION, 'region_name', None)
-            if attr_value is None:
+            import boto3
+            region = getattr(boto3.DEFAULT_SESSION, 'region_name', None)
+            if region is None:
                 self.ec2
-                return self.region
-        else:
-            attr_value = boto3.client(attr)
-
-        setattr(self, attr, attr_value)
-        return attr_value 
+                region = boto3.DEFAULT_SESSION.region_name
+            return region
 
 ref = sys.modules[__name__]
 sys.modules[__name__] = boto3_clients()
@@ -0,0 +1,153 @@
+# -*- coding: utf8 -*-
+""" Optional persistent cache of the describe output of the APIHelper classes.
+
+    Pages are stored in a local SQLite file, keyed by account, region, API class and describe
+    parameters, and are served from there while they are younger than the TTL of their API class.
+    Methods of the Resource classes which change resources drop the cached pages of their service
+    in their region and account.
+
+    The cache is off by default. Enable it with enable(), after which APIHelper.iter_pages and
+    everything built on it (get, iter) read from it. """
+
+import hashlib
+import json
+import logging
+import sqlite3
+import threading
+import time
+import zlib
+from contextlib import closing
+
+try:
+    import cPickle as pickle
+except ImportError:
+    import pickle
+
+from . import boto3_clients as clients
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PATH = 'awsutils_cache.sqlite'
+
+# Time to live of the cached pages of each APIHelper class, in seconds. Classes not listed here
+# use DEFAULT_TTL.
+DEFAULT_TTL = 600
+TTLS = {
+    'EC2API': 300,
+    'ASGAPI': 300,
+    'RDSAPI': 300,
+    'RDSAuroraAPI': 300,
+    'AMIAPI': 6 * 3600,
+    'KeyPairAPI': 24 * 3600,
+    'LaunchConfigurationAPI': 6 * 3600,
+    'SnapshotAPI': 3600,
+    'DBSnapshotAPI': 3600,
+}
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS pages (
+    key TEXT PRIMARY KEY,
+    account TEXT,
+    region TEXT,
+    service TEXT,
+    api TEXT,
+    created REAL,
+    data BLOB
+)
+"""
+
+
+class InventoryCache(object):
+
+    def __init__(self, path=DEFAULT_PATH, ttls=None, default_ttl=DEFAULT_TTL):
+        self.path = path
+        self.ttls = dict(TTLS, **(ttls or {}))
+        self.default_ttl = default_ttl
+        with closing(self._connect()) as connection:
+            with connection:
+                connection.execute(_SCHEMA)
+
+    def _connect(self):
+        # One connection per operation, so the cache can be used from any thread
+        return sqlite3.connect(self.path, timeout=30)
+
+    @staticmethod
+    def _location(region=None, account=None, role=None):
+        return region or clients.region, account or clients.account_id
+
+    def _key(self, api, params, **location):
+        region, account = self._location(**location)
+        key = json.dumps([account, region, api.__name__, params], sort_keys=True, default=str)
+        return hashlib.sha1(key).hexdigest(), region, account
+
+    def get(self, api, params, **location):
+        """ Returns the cached pages of an APIHelper class, or None if missing or expired """
+        key, region, account = self._key(api, params, **location)
+        ttl = self.ttls.get(api.__name__, self.default_ttl)
+        with closing(self._connect()) as connection:
+            row = connection.execute('SELECT data FROM pages WHERE key = ? AND created > ?',
+                                     (key, time.time() - ttl)).fetchone()
+        if row is None:
+            return None
+        logger.debug('Using cached %s pages for %s in %s', api.__name__, account, region)
+        return pickle.loads(zlib.decompress(row[0]))
+
+    def put(self, api, params, pages, **location):
+        key, region, account = self._key(api, params, **location)
+        data = sqlite3.Binary(zlib.compress(pickle.dumps(pages, pickle.HIGHEST_PROTOCOL), 1))
+        with closing(self._connect()) as connection:
+            with connection:
+                connection.execute('INSERT OR REPLACE INTO pages VALUES (?, ?, ?, ?, ?, ?, ?)',
+                                   (key, account, region, api._type, api.__name__, time.time(),
+                                    data))
+
+    def caching(self, api, params, pages, **location):
+        """ Yields the given pages, storing them in the cache once all were read """
+        read = []
+        for page in pages:
+            read.append(page)
+            yield page
+        self.put(api, params, read, **location)
+
+    def invalidate(self, service=None, region=None, account=None, role=None):
+        """ Drops the cached pages of a service (all services if None) in a region and account """
+        region, account = self._location(region, account, role)
+        query = 'DELETE FROM pages WHERE region = ? AND account = ?'
+        args = (region, account)
+        if service is not None:
+            query += ' AND service = ?'
+            args += (service,)
+        with closing(self._connect()) as connection:
+            with connection:
+                connection.execute(query, args)
+
+    def clear(self):
+        with closing(self._connect()) as connection:
+            with connection:
+                connection.execute('DELETE FROM pages')
+
+
+# Cache in use, if enabled
+default = None
+_lock = threading.Lock()
+
+
+def enable(path=DEFAULT_PATH, ttls=None, default_ttl=DEFAULT_TTL):
+    """ Enables the cache for all APIHelper classes. ttls overrides the TTL of APIHelper classes,
+        by class name """
+    global default
+    with _lock:
+        default = InventoryCache(path, ttls, default_ttl)
+    return default
+
+
+def disable():
+    global default
+    with _lock:
+        default = None
+
+
+def invalidate_resource(resource):
+    """ Drops the cached pages of the service of a resource, in its region and account """
+    if default is not None:
+        default.invalidate(resource._type, resource._region, resource._account, resource._role)
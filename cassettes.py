@@ -0,0 +1,269 @@
+# -*- coding: utf8 -*-
+""" Record and replay of the AWS API calls made by every client created through boto3_clients.
+
+    While recording, every call (its parameters, response and latency) is appended to a gzipped
+    cassette file, one JSON document per line. Credentials, passwords and other secrets are
+    redacted, in the parameters and in the responses.
+
+    While replaying, calls are answered from a cassette, without sending any request, after the
+    recorded latency (scaled by latency_scale). Calls are matched by service, region, identity of
+    the client (its account and role, or its profile), operation and parameters; a call made
+    several times gets the recorded responses in order, and the last one from then on. With strict (the default), calls not found in the cassette fail with
+    CassetteMiss; otherwise they are sent to AWS.
+
+    Only one cassette is active at a time, for all threads. Clients of other accounts get the
+    responses recorded in their own account, and the AssumeRole calls giving them their
+    credentials (see sessions.py) are replayed too: no role is assumed, the recorded (redacted)
+    credentials are used, and their expiration is moved to REPLAYED_CREDENTIALS_DURATION seconds
+    after the replay.
+
+    Usage:
+        with cassettes.record('sweep.cassette.gz'):
+            EC2API.get()
+        with cassettes.replay('sweep.cassette.gz', latency_scale=0):
+            EC2API.get()
+"""
+
+import base64
+import collections
+import datetime
+import functools
+import gzip
+import io
+import json
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+REDACTED = 'REDACTED'
+# Keys whose values are never written to a cassette, wherever they appear
+SECRET_KEYS = frozenset(['AccessKeyId', 'SecretAccessKey', 'SessionToken', 'Password',
+                         'MasterUserPassword', 'NewPassword', 'OldPassword', 'SecretString',
+                         'SecretBinary', 'KeyMaterial', 'PrivateKey', 'AuthorizationToken',
+                         'UserData'])
+
+# Lifetime of the credentials returned by replayed calls (e.g. STS AssumeRole), in seconds, so
+# they are not refreshed over and over with the expired ones recorded
+REPLAYED_CREDENTIALS_DURATION = 3600
+
+# Key of the recorded call in its request context
+_CALL = 'cassette'
+
+
+class CassetteMiss(Exception):
+    """ Raised while replaying a call which is not in the cassette """
+
+
+def _redact(value):
+    if isinstance(value, dict):
+        return dict((k, REDACTED if k in SECRET_KEYS else _redact(v)) for k, v in value.items())
+    if isinstance(value, list):
+        return [_redact(item) for item in value]
+    return value
+
+
+def _encode(value):
+    """ Converts a value of a call to JSON, keeping the types JSON does not have """
+    if isinstance(value, dict):
+        return dict((k, _encode(v)) for k, v in value.items())
+    if isinstance(value, (list, tuple)):
+        return [_encode(item) for item in value]
+    if isinstance(value, datetime.datetime):
+        return {'__datetime__': value.isoformat()}
+    if isinstance(value, str):
+        try:
+            return value.decode('utf8')
+        except UnicodeDecodeError:
+            return {'__bytes__': base64.b64encode(value)}
+    if value is None or isinstance(value, (unicode, bool, int, long, float)):
+        return value
+    # Other objects (e.g. files given as the body of S3 uploads) are matched by their type only
+    return {'__object__': type(value).__name__}
+
+
+def _decode(value):
+    if isinstance(value, dict):
+        if '__datetime__' in value:
+            from dateutil.parser import parse
+            return parse(value['__datetime__'])
+        if '__bytes__' in value:
+            return base64.b64decode(value['__bytes__'])
+        if '__stream__' in value:
+            from botocore.response import StreamingBody
+            data = base64.b64decode(value['__stream__'])
+            return StreamingBody(io.BytesIO(data), len(data))
+        return dict((k, _decode(v)) for k, v in value.items())
+    if isinstance(value, list):
+        return [_decode(item) for item in value]
+    return value
+
+
+def _read_streams(parsed):
+    """ Reads the streaming bodies of a response (e.g. of S3 GetObject) to record them, and puts
+        back a new stream for the caller to read. Returns the encodable response """
+    from botocore.response import StreamingBody
+    encodable = dict(parsed)
+    for key, value in parsed.items():
+        if isinstance(value, StreamingBody):
+            data = value.read()
+            parsed[key] = StreamingBody(io.BytesIO(data), len(data))
+            encodable[key] = {'__stream__': base64.b64encode(data)}
+    return encodable
+
+
+def _renew_credentials(response):
+    credentials = response.get('Credentials')
+    if isinstance(credentials, dict) and 'Expiration' in credentials:
+        from dateutil.tz import tzutc
+        credentials['Expiration'] = datetime.datetime.now(tzutc()) + \
+            datetime.timedelta(seconds=REPLAYED_CREDENTIALS_DURATION)
+    return response
+
+
+def _match_key(service, region, identity, operation, params):
+    return json.dumps([service, region, identity, operation, _encode(_redact(params))],
+                      sort_keys=True)
+
+
+class Cassette(object):
+
+    def __init__(self, path, mode, latency_scale=1.0, strict=True):
+        self.path = path
+        self.mode = mode
+        self.latency_scale = latency_scale
+        self.strict = strict
+        self.calls = 0
+        self._lock = threading.Lock()
+        self._file = None
+        self._interactions = {}
+        if mode == 'record':
+            self._file = gzip.open(path, 'wb')
+        else:
+            self._load()
+
+    def _load(self):
+        with gzip.open(self.path, 'rb') as f:
+            for line in f:
+                interaction = json.loads(line)
+                key = _match_key(interaction['service'], interaction['region'],
+                                 interaction.get('identity'), interaction['operation'],
+                                 _decode(interaction['params']))
+                self._interactions.setdefault(key, collections.deque()).append(interaction)
+        logger.info('Replaying %d calls from %s', sum(len(calls) for calls in
+                                                      self._interactions.values()), self.path)
+
+    def _write(self, interaction):
+        line = json.dumps(interaction, sort_keys=True) + '\n'
+        with self._lock:
+            if self._file is not None:
+                self._file.write(line)
+                self.calls += 1
+
+    def _next(self, key):
+        with self._lock:
+            interactions = self._interactions.get(key)
+            if not interactions:
+                return None
+            self.calls += 1
+            # The last response recorded is kept for any further calls
+            return interactions.popleft() if len(interactions) > 1 else interactions[0]
+
+    def close(self):
+        global _active
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+        if _active is self:
+            _active = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+_active = None
+
+
+def record(path):
+    """ Records all calls to a new cassette, until it is closed """
+    return _start(Cassette(path, 'record'))
+
+
+def replay(path, latency_scale=1.0, strict=True):
+    """ Answers all calls from a cassette, until it is closed """
+    return _start(Cassette(path, 'replay', latency_scale, strict))
+
+
+def _start(cassette):
+    global _active
+    if _active is not None:
+        _active.close()
+    _active = cassette
+    return cassette
+
+
+def stop():
+    if _active is not None:
+        _active.close()
+
+
+def _on_call_start(params=None, model=None, context=None, identity=None, **kwargs):
+    if _active is None or context is None or model is None:
+        return
+    context[_CALL] = {'params': params, 'identity': identity, 'started': time.time()}
+
+
+def _on_before_call(model=None, context=None, **kwargs):
+    cassette = _active
+    call = (context or {}).get(_CALL)
+    if cassette is None or cassette.mode != 'replay' or call is None:
+        return
+    service, operation = model.service_model.service_name, model.name
+    interaction = cassette._next(_match_key(service, context.get('client_region'),
+                                            call['identity'], operation, call['params']))
+    if interaction is None:
+        if cassette.strict:
+            raise CassetteMiss('%s.%s in %s as %s with %s is not in %s' % (
+                service, operation, context.get('client_region'), call['identity'] or 'default',
+                call['params'], cassette.path))
+        return
+    call['replayed'] = True
+    if cassette.latency_scale:
+        time.sleep(interaction['seconds'] * cassette.latency_scale)
+    from botocore.awsrequest import AWSResponse
+    return (AWSResponse(None, interaction['status'], {}, None),
+            _renew_credentials(_decode(interaction['response'])))
+
+
+def _on_call_end(http_response=None, parsed=None, model=None, context=None, **kwargs):
+    cassette = _active
+    call = (context or {}).pop(_CALL, None)
+    if cassette is None or cassette.mode != 'record' or call is None or http_response is None:
+        return
+    cassette._write({
+        'service': model.service_model.service_name,
+        'region': context.get('client_region'),
+        'identity': call['identity'],
+        'operation': model.name,
+        'params': _encode(_redact(call['params'])),
+        'status': http_response.status_code,
+        'response': _encode(_redact(_read_streams(parsed))),
+        'seconds': time.time() - call['started'],
+    })
+
+
+def register(client, identity=None):
+    """ Records or replays the calls of a client while a cassette is active. The identity tells
+        whose credentials the client uses (None for the default ones), so calls made with
+        different credentials are replayed with their own responses """
+    events = client.meta.events
+    events.register('before-parameter-build', functools.partial(_on_call_start,
+                                                                identity=identity))
+    events.register('before-call', _on_before_call)
+    events.register('after-call', _on_call_end)
+    return client
@@ -0,0 +1,117 @@
+# -*- coding: utf8 -*-
+""" Inventory snapshots and the changes between them.
+
+    A snapshot keeps one content fingerprint per resource (a hash of its describe output, tags
+    included when they are part of it), so comparing two inventories is a set difference over
+    keys plus one string comparison per resource. Snapshots can be saved to disk, so each run of
+    a job only has to process the changes since the previous one.
+
+    Usage:
+        old = InventorySnapshot.load('ec2.snapshot')
+        new = InventorySnapshot()
+        for change in changes(old, EC2API.iter(), new):
+            ...
+        new.save('ec2.snapshot')
+"""
+
+import collections
+import gzip
+import hashlib
+import json
+import time
+
+# A change in a resource: kind is 'created', 'changed' or 'deleted'. Deleted resources are not
+# available anymore, so their resource is None.
+Change = collections.namedtuple('Change', ['kind', 'key', 'resource'])
+
+
+def key(resource):
+    """ Key of a resource, unique across types, accounts and regions """
+    return '%s|%s|%s|%s' % (resource.type, resource.account, resource.region, resource._id)
+
+
+def fingerprint(resource):
+    """ Hash of the describe output of a resource, with its tags if they are part of it. Tags
+        loaded by separate API calls are left out, so the fingerprint does not depend on whether
+        they were loaded, and no API calls are made """
+    tags = None
+    if not hasattr(resource, '_describe_tags_func') and resource._data is not None:
+        # Read from the describe output, or from _tags for compact resources
+        tags = resource.tags
+    content = json.dumps([resource._data, tags], sort_keys=True, separators=(',', ':'),
+                         default=str)
+    return hashlib.md5(content).hexdigest()
+
+
+class InventorySnapshot(object):
+
+    def __init__(self, fingerprints=None, taken=None):
+        self.fingerprints = fingerprints if fingerprints is not None else {}
+        self.taken = taken or time.time()
+        # Resources added to this snapshot in this process, by key
+        self.resources = {}
+
+    @classmethod
+    def take(cls, resources):
+        snapshot = cls()
+        for resource in resources:
+            snapshot.add(resource)
+        return snapshot
+
+    def add(self, resource, keep=True):
+        """ Adds a resource to the snapshot. Unless keep is False, the resource is kept in memory,
+            to be returned with the changes of a diff """
+        resource_key = key(resource)
+        self.fingerprints[resource_key] = fingerprint(resource)
+        if keep:
+            self.resources[resource_key] = resource
+        return resource_key
+
+    def __len__(self):
+        return len(self.fingerprints)
+
+    def __contains__(self, resource_key):
+        return resource_key in self.fingerprints
+
+    def diff(self, newer):
+        """ Yields the changes from this snapshot to a newer one """
+        old = self.fingerprints
+        for resource_key, new_fingerprint in newer.fingerprints.iteritems():
+            old_fingerprint = old.get(resource_key)
+            if old_fingerprint is None:
+                yield Change('created', resource_key, newer.resources.get(resource_key))
+            elif old_fingerprint != new_fingerprint:
+                yield Change('changed', resource_key, newer.resources.get(resource_key))
+        for resource_key in old:
+            if resource_key not in newer.fingerprints:
+                yield Change('deleted', resource_key, None)
+
+    def save(self, path):
+        with gzip.open(path, 'wb') as f:
+            json.dump({'taken': self.taken, 'fingerprints': self.fingerprints}, f)
+
+    @classmethod
+    def load(cls, path):
+        with gzip.open(path, 'rb') as f:
+            data = json.load(f)
+        return cls(data['fingerprints'], data['taken'])
+
+
+def changes(old, resources, new=None):
+    """ Yields the changes from an old snapshot to the given resources as soon as each resource is
+        read, so consumers can start on them while the inventory is still being retrieved.
+        Deleted resources are yielded once all resources were read. If a new snapshot is given,
+        the resources are added to it. """
+    if new is None:
+        new = InventorySnapshot()
+    old_fingerprints = old.fingerprints
+    for resource in resources:
+        resource_key = new.add(resource, keep=False)
+        old_fingerprint = old_fingerprints.get(resource_key)
+        if old_fingerprint is None:
+            yield Change('created', resource_key, resource)
+        elif old_fingerprint != new.fingerprints[resource_key]:
+            yield Change('changed', resource_key, resource)
+    for resource_key in old_fingerprints:
+        if resource_key not in new.fingerprints:
+            yield Change('deleted', resource_key, None)
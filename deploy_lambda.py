@@ -6,7 +6,6 @@ import errno
 import zipfile
 import json
 import botocore
-import boto3
 import boto3_clients as aws
 
 # DEFINE LIST OF FUNCTIONS TO DEPLOY HERE
@@ -57,7 +56,7 @@ def deploy_functions(bucket, region='us-east-1', function_dir=os.getcwd(), funct
     upload_zip(s3_path,function_zip,bucket)
     lambda_s3_zip_path = '%s/%s' %(s3_path,function_zip)
     print lambda_s3_zip_path
-    l_client = boto3.client('lambda', region_name=region)
+    l_client = aws.client('lambda', region)
     for function in lambda_function_list:
         filename = function+'.py'
         if filename in os.listdir(function_dir):
@@ -0,0 +1,204 @@
+# -*- coding: utf8 -*-
+""" Account-wide indexes of the history of resources, used by the resource properties which
+    would otherwise call the API once per resource.
+
+    Each index is loaded with a few paginated calls per account and region the first time it is
+    needed there, and loaded again once older than its TTL.
+
+    Besides history, the usage index tells which resources refer to security groups, key pairs,
+    images, launch configurations and snapshots, to find the ones nothing uses anymore. """
+
+import datetime
+import logging
+import threading
+import time
+from . import boto3_clients as clients
+
+logger = logging.getLogger(__name__)
+
+# RDS only tracks events for 14 days
+RDS_EVENTS_HOURS = 335
+RDS_EVENT_CATEGORIES = ['creation', 'availability', 'notification', 'deletion']
+RDS_EVENTS_TTL = 300
+
+
+class Index(object):
+    """ Data loaded per (region, account, role) by a function of the client of a service (or of
+        the clients of a tuple of services), and shared by all threads until it is older than the
+        TTL """
+
+    def __init__(self, name, service, load, ttl):
+        self.name = name
+        self.services = service if isinstance(service, tuple) else (service,)
+        self.load = load
+        self.ttl = ttl
+        self._entries = {}
+        self._key_locks = {}
+        self._lock = threading.Lock()
+
+    def get(self, region=None, account=None, role=None):
+        key = (region, account, role)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and time.time() - entry[0] < self.ttl:
+                return entry[1]
+            key_lock = self._key_locks.setdefault(key, threading.Lock())
+        # The index is loaded only once per location, even if many threads need it at once
+        with key_lock:
+            with self._lock:
+                entry = self._entries.get(key)
+            if entry is None or time.time() - entry[0] >= self.ttl:
+                logger.info('Loading %s for %s in %s', self.name, account or 'default account',
+                            region or 'default region')
+                entry = (time.time(), self.load(*[clients.client(service, region, account, role)
+                                                    for service in self.services]))
+                with self._lock:
+                    self._entries[key] = entry
+        return entry[1]
+
+    def invalidate(self, region=None, account=None, role=None):
+        with self._lock:
+            self._entries.pop((region, account, role), None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+def _load_rds_events(client):
+    # Last event of each DB instance, by instance identifier
+    now = datetime.datetime.utcnow()
+    pages = client.get_paginator('describe_events').paginate(
+        SourceType='db-instance',
+        StartTime=now - datetime.timedelta(hours=RDS_EVENTS_HOURS),
+        EndTime=now,
+        EventCategories=RDS_EVENT_CATEGORIES,
+        PaginationConfig={'PageSize': 100}
+    )
+    last_events = {}
+    for page in pages:
+        for event in page['Events']:
+            last = last_events.get(event['SourceIdentifier'])
+            if last is None or event['Date'] >= last['Date']:
+                last_events[event['SourceIdentifier']] = event
+    return last_events
+
+
+rds_events = Index('RDS events', 'rds', _load_rds_events, RDS_EVENTS_TTL)
+
+
+def rds_last_event(name, region=None, account=None, role=None):
+    """ Returns the last event of a DB instance in the last RDS_EVENTS_HOURS, or None """
+    return rds_events.get(region, account, role).get(name)
+
+
+# Kinds of scaling activities tracked, by the start of their description
+SCALING_ACTIVITY_KINDS = {'Launching': 'Launch', 'Terminating': 'Terminate'}
+SCALING_ACTIVITIES_TTL = 600
+
+
+def _load_scaling_activities(client):
+    # Start time of the last Launch and Terminate activities of each group, by group name.
+    # Activities of all groups are listed at once (AWS keeps them for six weeks)
+    pages = client.get_paginator('describe_scaling_activities').paginate(
+        PaginationConfig={'PageSize': 100})
+    last_activities = {}
+    for page in pages:
+        for activity in page['Activities']:
+            kind = SCALING_ACTIVITY_KINDS.get(activity.get('Description', '').split(' ', 1)[0])
+            if kind is None:
+                continue
+            group = last_activities.setdefault(activity['AutoScalingGroupName'], {})
+            if kind not in group or activity['StartTime'] > group[kind]:
+                group[kind] = activity['StartTime']
+    return last_activities
+
+
+scaling_activities = Index('scaling activities', 'autoscaling', _load_scaling_activities,
+                           SCALING_ACTIVITIES_TTL)
+
+
+def last_scaling_activity(group, kind, region=None, account=None, role=None):
+    """ Returns the start time of the last 'Launch' or 'Terminate' activity of an AutoScaling
+        group, or None """
+    return scaling_activities.get(region, account, role).get(group, {}).get(kind)
+
+
+# Usage of the resources which others refer to. Resources are identified by (kind, ID), the kind
+# being one of 'securitygroup', 'keypair', 'image', 'launchconfiguration' and 'snapshot' for the
+# resources referred to, and 'networkinterface', 'instance', 'securitygroup', 'image',
+# 'launchconfiguration' and 'autoscaling' for the ones referring to them.
+# Launch templates are not followed.
+USAGE_TTL = 300
+
+
+def describe_all(client, operation, list_property, page_size=None, **params):
+    """ Yields the items of every page of a describe operation. Operations without a paginator
+        are called once """
+    if not client.can_paginate(operation):
+        return getattr(client, operation)(**params)[list_property]
+    if page_size is not None:
+        params['PaginationConfig'] = {'PageSize': page_size}
+    pages = client.get_paginator(operation).paginate(**params)
+    return (item for page in pages for item in page[list_property])
+
+
+def _load_usage(ec2, autoscaling):
+    # Referrers of each resource, as a set of (kind, ID), by the (kind, ID) of the resource
+    usage = {}
+
+    def refer(kind, resource_id, referrer):
+        if resource_id:
+            usage.setdefault((kind, resource_id), set()).add(referrer)
+
+    # Network interfaces cover the security groups of every service running in a VPC
+    for interface in describe_all(ec2, 'describe_network_interfaces', 'NetworkInterfaces', 1000):
+        for group in interface.get('Groups', []):
+            refer('securitygroup', group['GroupId'],
+                  ('networkinterface', interface['NetworkInterfaceId']))
+    for reservation in describe_all(ec2, 'describe_instances', 'Reservations', 1000):
+        for instance in reservation['Instances']:
+            referrer = ('instance', instance['InstanceId'])
+            refer('keypair', instance.get('KeyName'), referrer)
+            refer('image', instance.get('ImageId'), referrer)
+            for group in instance.get('SecurityGroups', []):
+                refer('securitygroup', group['GroupId'], referrer)
+    # Groups referred to by the rules of other groups cannot be deleted either
+    for group in describe_all(ec2, 'describe_security_groups', 'SecurityGroups', 1000):
+        for permission in group.get('IpPermissions', []) + group.get('IpPermissionsEgress', []):
+            for pair in permission.get('UserIdGroupPairs', []):
+                if pair.get('GroupId') != group['GroupId']:
+                    refer('securitygroup', pair.get('GroupId'), ('securitygroup', group['GroupId']))
+    for image in describe_all(ec2, 'describe_images', 'Images', Owners=['self']):
+        for mapping in image.get('BlockDeviceMappings', []):
+            refer('snapshot', mapping.get('Ebs', {}).get('SnapshotId'), ('image', image['ImageId']))
+    for config in describe_all(autoscaling, 'describe_launch_configurations',
+                               'LaunchConfigurations', 100):
+        referrer = ('launchconfiguration', config['LaunchConfigurationName'])
+        refer('keypair', config.get('KeyName'), referrer)
+        refer('image', config.get('ImageId'), referrer)
+        # Groups are given by name in EC2-Classic, and by ID otherwise
+        for group in config.get('SecurityGroups', []):
+            refer('securitygroup', group, referrer)
+        for mapping in config.get('BlockDeviceMappings', []):
+            refer('snapshot', mapping.get('Ebs', {}).get('SnapshotId'), referrer)
+    for group in describe_all(autoscaling, 'describe_auto_scaling_groups', 'AutoScalingGroups',
+                              100):
+        refer('launchconfiguration', group.get('LaunchConfigurationName'),
+              ('autoscaling', group['AutoScalingGroupName']))
+    return usage
+
+
+resource_usage = Index('resource usage', ('ec2', 'autoscaling'), _load_usage, USAGE_TTL)
+
+
+def referrers(kind, resource_id, region=None, account=None, role=None):
+    """ Returns the (kind, ID) of the resources referring to a resource, an empty set if none """
+    return resource_usage.get(region, account, role).get((kind, resource_id), frozenset())
+
+
+def unused(resources):
+    """ Returns the resources nothing refers to, out of security groups, key pairs, images, launch
+        configurations and snapshots. Default security groups are never unused """
+    return [resource for resource in resources
+            if not resource.referrers and not getattr(resource, 'isdefault', False)]
@@ -0,0 +1,110 @@
+# -*- coding: utf8 -*-
+""" Whole-account inventory over all the APIHelper classes.
+
+    All the APIHelper classes are fetched concurrently. The number of classes fetched at the same
+    time from a single service is capped, since they share its API rate limits, so the snapshot
+    takes about as long as the slowest service. """
+
+import logging
+import threading
+import time
+from . import apihelpers
+from . import delta
+from . import parallel
+
+logger = logging.getLogger(__name__)
+
+# Number of APIHelper classes fetched at the same time from each service. Services not listed
+# use DEFAULT_SERVICE_LIMIT.
+DEFAULT_SERVICE_LIMIT = 2
+SERVICE_LIMITS = {
+    'ec2': 4,
+}
+
+
+def api_classes():
+    """ Returns all the APIHelper classes """
+    found = []
+    pending = [apihelpers.APIHelper]
+    while pending:
+        for subclass in pending.pop().__subclasses__():
+            if subclass not in found:
+                found.append(subclass)
+                pending.append(subclass)
+    return found
+
+
+class Inventory(object):
+
+    def __init__(self, apis=None, service_limits=None, max_workers=16, progress=None,
+                 **get_params):
+        """ apis: APIHelper classes to fetch, all of them by default.
+            service_limits: overrides SERVICE_LIMITS, by service name.
+            progress: optional function called with the name of each API class and its report
+            entry as soon as it is fetched.
+            get_params: passed on to APIHelper.get, e.g. regions, accounts, role, with_tags. """
+        self.apis = apis or api_classes()
+        self.service_limits = dict(SERVICE_LIMITS, **(service_limits or {}))
+        self.max_workers = max_workers
+        self.progress = progress
+        self.get_params = get_params
+        self.resources = {}
+        self.report = {}
+        self.seconds = 0.0
+        self._semaphores = {}
+
+    def _semaphore(self, service):
+        if service not in self._semaphores:
+            self._semaphores[service] = threading.Semaphore(
+                self.service_limits.get(service, DEFAULT_SERVICE_LIMIT))
+        return self._semaphores[service]
+
+    def _fetch(self, api):
+        entry = {'count': 0, 'seconds': 0.0, 'waited': 0.0, 'error': None}
+        requested = time.time()
+        with self._semaphore(api._type):
+            started = time.time()
+            entry['waited'] = started - requested
+            try:
+                self.resources[api.__name__] = api.get(**self.get_params)
+                entry['count'] = len(self.resources[api.__name__])
+            except Exception as e:
+                logger.exception('Failed to get %s resources', api.__name__)
+                self.resources[api.__name__] = []
+                entry['error'] = str(e)
+            entry['seconds'] = time.time() - started
+        self.report[api.__name__] = entry
+        logger.info('%s: %d resources in %.1fs', api.__name__, entry['count'], entry['seconds'])
+        if self.progress is not None:
+            self.progress(api.__name__, entry)
+
+    def fetch(self):
+        """ Fetches all the APIHelper classes concurrently. Returns the inventory itself """
+        started = time.time()
+        # Semaphores are created up front, so the worker threads only read the dict
+        for api in self.apis:
+            self._semaphore(api._type)
+        parallel.pmap(self._fetch, self.apis, self.max_workers)
+        self.seconds = time.time() - started
+        return self
+
+    def __getitem__(self, api):
+        """ Resources of an APIHelper class, given the class or its name """
+        return self.resources[getattr(api, '__name__', api)]
+
+    def __iter__(self):
+        for resources in self.resources.values():
+            for resource in resources:
+                yield resource
+
+    def snapshot(self):
+        """ Returns a delta.InventorySnapshot of all the resources """
+        return delta.InventorySnapshot.take(self)
+
+    def format_report(self):
+        lines = ['%-24s %8s %8s %8s  %s' % ('API', 'count', 'seconds', 'waited', 'error')]
+        for name, entry in sorted(self.report.items(), key=lambda item: -item[1]['seconds']):
+            lines.append('%-24s %8d %8.1f %8.1f  %s' % (name, entry['count'], entry['seconds'],
+                                                       entry['waited'], entry['error'] or ''))
+        lines.append('Total: %.1fs' % self.seconds)
+        return '\n'.join(lines)
@@ -0,0 +1,238 @@
+# -*- coding: utf8 -*-
+""" Metrics of the AWS API calls made by every client created through boto3_clients.
+
+    For each service, operation and set of context tags, the number of calls, errors, retries and
+    throttled responses, the bytes received and a histogram of the latency of whole calls
+    (including retries) are kept in memory.
+
+    Context tags say what the calls were made for: APIHelper classes tag their describe calls
+    with 'api', and Resource actions with 'action'. Any code can add its own with context().
+
+    Usage:
+        with metrics.context(job='nightly-sweep'):
+            EC2API.get()
+        print metrics.to_prometheus()
+"""
+
+import functools
+import json
+import re
+import threading
+import time
+import throttling
+
+# Upper bounds of the buckets of the latency histograms, in seconds
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+_local = threading.local()
+
+
+def _current_tags():
+    return getattr(_local, 'tags', {})
+
+
+class context(object):
+    """ Context manager adding tags to the metrics of the calls made inside it, in this thread
+        (and in the threads started for it by parallel.py) """
+
+    def __init__(self, **tags):
+        self.tags = tags
+
+    def __enter__(self):
+        self._previous = _current_tags()
+        _local.tags = dict(self._previous, **self.tags)
+        return self
+
+    def __exit__(self, *exc_info):
+        _local.tags = self._previous
+
+
+def bind(function):
+    """ Returns a function which runs the given one with the context tags of the current thread,
+        to be run in another thread """
+    tags = _current_tags()
+
+    @functools.wraps(function)
+    def bound(*args, **kwargs):
+        with context(**tags):
+            return function(*args, **kwargs)
+    return bound
+
+
+class _Stats(object):
+
+    def __init__(self):
+        self.calls = 0
+        self.errors = 0
+        self.attempts = 0
+        self.throttles = 0
+        self.bytes = 0
+        self.seconds = 0.0
+        self.buckets = [0] * (len(LATENCY_BUCKETS) + 1)
+
+    def to_dict(self):
+        return {
+            'calls': self.calls,
+            'errors': self.errors,
+            # Stubbed and replayed calls send no requests, but count as one attempt
+            'retries': max(0, self.attempts - self.calls),
+            'throttles': self.throttles,
+            'bytes': self.bytes,
+            'seconds': self.seconds,
+            'latency_buckets': dict(zip([str(b) for b in LATENCY_BUCKETS] + ['+Inf'],
+                                        _cumulative(self.buckets))),
+        }
+
+
+def _cumulative(counts):
+    total = 0
+    result = []
+    for count in counts:
+        total += count
+        result.append(total)
+    return result
+
+
+_stats = {}
+_lock = threading.Lock()
+
+
+def _stats_for(call):
+    key = (call['service'], call['operation'], tuple(sorted(call['tags'].items())))
+    stats = _stats.get(key)
+    if stats is None:
+        stats = _stats.setdefault(key, _Stats())
+    return stats
+
+
+def _on_call_start(context=None, model=None, **kwargs):
+    if context is None or model is None:
+        return
+    context['metrics'] = {
+        'service': model.service_model.service_name,
+        'operation': model.name,
+        'tags': _current_tags(),
+        'started': time.time(),
+        'attempts': 0,
+        'throttles': 0,
+        'bytes': 0,
+    }
+
+
+def _body_size(response_dict):
+    """ Size of a response body. Streaming bodies (e.g. of S3 GetObject) are not read here, their
+        size is taken from the Content-Length header """
+    length = (response_dict.get('headers') or {}).get('content-length')
+    if length is not None and length.isdigit():
+        return int(length)
+    body = response_dict.get('body')
+    return len(body) if isinstance(body, basestring) else 0
+
+
+def _on_response(context=None, response_dict=None, parsed_response=None, **kwargs):
+    call = (context or {}).get('metrics')
+    if call is None:
+        return
+    call['attempts'] += 1
+    if response_dict is not None:
+        call['bytes'] += _body_size(response_dict)
+        error_code = (parsed_response or {}).get('Error', {}).get('Code')
+        if response_dict.get('status_code') == 429 or throttling.is_throttling_error(error_code):
+            call['throttles'] += 1
+
+
+def _on_call_end(context=None, http_response=None, parsed=None, exception=None, **kwargs):
+    call = (context or {}).pop('metrics', None)
+    if call is None:
+        return
+    if call['attempts'] == 0 and http_response is not None:
+        # Answered without sending a request (stubbed or replayed), count the answer instead
+        _on_response(context={'metrics': call}, parsed_response=parsed,
+                     response_dict={'status_code': http_response.status_code})
+    seconds = time.time() - call['started']
+    failed = exception is not None or (http_response is not None and
+                                       http_response.status_code >= 300)
+    bucket = len(LATENCY_BUCKETS)
+    for i, bound in enumerate(LATENCY_BUCKETS):
+        if seconds <= bound:
+            bucket = i
+            break
+    with _lock:
+        stats = _stats_for(call)
+        stats.calls += 1
+        stats.errors += 1 if failed else 0
+        stats.attempts += max(1, call['attempts'])
+        stats.throttles += call['throttles']
+        stats.bytes += call['bytes']
+        stats.seconds += seconds
+        stats.buckets[bucket] += 1
+
+
+def register(client):
+    """ Records the metrics of all calls of a client """
+    events = client.meta.events
+    # before-parameter-build is emitted for every call, even if a handler of before-call (such
+    # as botocore's Stubber) answers it without sending a request
+    events.register('before-parameter-build', _on_call_start)
+    events.register('response-received', _on_response)
+    events.register('after-call', _on_call_end)
+    events.register('after-call-error', _on_call_end)
+    return client
+
+
+def snapshot():
+    """ Returns the metrics recorded so far, as a list of dicts with the service, operation and
+        tags of each series """
+    with _lock:
+        items = [(key, stats.to_dict()) for key, stats in _stats.items()]
+    result = []
+    for (service, operation, tags), stats in sorted(items):
+        stats.update(service=service, operation=operation, tags=dict(tags))
+        result.append(stats)
+    return result
+
+
+def reset():
+    with _lock:
+        _stats.clear()
+
+
+def to_json(**kwargs):
+    return json.dumps(snapshot(), sort_keys=True, **kwargs)
+
+
+def _label_name(tag):
+    """ Prometheus label name of a context tag: characters other than letters, digits and
+        underscores are replaced by underscores, and names cannot start with a digit """
+    name = re.sub('[^a-zA-Z0-9_]', '_', tag)
+    return '_' + name if not name or name[0].isdigit() else name
+
+
+def _labels(series, **extra):
+    labels = [('service', series['service']), ('operation', series['operation'])]
+    labels += sorted((_label_name(tag), value) for tag, value in series['tags'].items())
+    labels += sorted(extra.items())
+    return '{%s}' % ','.join('%s="%s"' % (name, str(value).replace('\\', '\\\\').replace('"', '\\"'))
+                             for name, value in labels)
+
+
+def to_prometheus(prefix='awsutils_api'):
+    """ Returns the metrics in the Prometheus text exposition format """
+    series_list = snapshot()
+    lines = []
+    for name, field, kind in (('calls_total', 'calls', 'counter'),
+                              ('errors_total', 'errors', 'counter'),
+                              ('retries_total', 'retries', 'counter'),
+                              ('throttles_total', 'throttles', 'counter'),
+                              ('received_bytes_total', 'bytes', 'counter')):
+        lines.append('# TYPE %s_%s %s' % (prefix, name, kind))
+        for series in series_list:
+            lines.append('%s_%s%s %s' % (prefix, name, _labels(series), series[field]))
+    lines.append('# TYPE %s_call_seconds histogram' % prefix)
+    for series in series_list:
+        for bound in [str(b) for b in LATENCY_BUCKETS] + ['+Inf']:
+            lines.append('%s_call_seconds_bucket%s %s' % (prefix, _labels(series, le=bound),
+                                                          series['latency_buckets'][bound]))
+        lines.append('%s_call_seconds_sum%s %s' % (prefix, _labels(series), series['seconds']))
+        lines.append('%s_call_seconds_count%s %s' % (prefix, _labels(series), series['calls']))
+    return '\n'.join(lines) + '\n'
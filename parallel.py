@@ -0,0 +1,73 @@
+# -*- coding: utf8 -*-
+""" Helpers to overlap AWS API calls with the processing of their results """
+
+import sys
+import threading
+from multiprocessing.pool import ThreadPool
+import metrics
+
+# Default size of the thread pools used to run API calls concurrently
+MAX_WORKERS = 8
+
+
+class _Fetcher(threading.Thread):
+    """ Retrieves the next item of an iterator in a background thread """
+
+    def __init__(self, iterator):
+        super(_Fetcher, self).__init__()
+        self.daemon = True
+        # Calls made for the caller are tagged with its metrics context
+        self._next = metrics.bind(next)
+        self._iterator = iterator
+        self.item = None
+        self.exhausted = False
+        self.exc_info = None
+        self.start()
+
+    def run(self):
+        try:
+            self.item = self._next(self._iterator)
+        except StopIteration:
+            self.exhausted = True
+        except Exception:
+            self.exc_info = sys.exc_info()
+
+    def result(self):
+        self.join()
+        if self.exc_info is not None:
+            raise self.exc_info[0], self.exc_info[1], self.exc_info[2]
+        return self.item
+
+
+def prefetch(iterable):
+    """ Yields the items of an iterable, retrieving the next item in a background thread while the
+        caller is still working on the current one. Only one item is read ahead, so memory use
+        does not depend on the length of the iterable. """
+    iterator = iter(iterable)
+    fetcher = _Fetcher(iterator)
+    while True:
+        item = fetcher.result()
+        if fetcher.exhausted:
+            return
+        fetcher = _Fetcher(iterator)
+        yield item
+
+
+def pmap(function, items, max_workers=MAX_WORKERS):
+    """ Applies function to every item using a bounded pool of threads. Results are returned in
+        the same order as the items. If any call fails, its exception is raised. """
+    items = list(items)
+    if not items:
+        return []
+    pool = ThreadPool(min(max_workers, len(items)))
+    try:
+        return pool.map(metrics.bind(function), items, chunksize=1)
+    finally:
+        pool.close()
+        pool.join()
+
+
+def chunks(items, size):
+    """ Splits a list in consecutive chunks of at most 'size' items """
+    items = list(items)
+    return [items[i:i + size] for i in range(0, len(items), size)]
@@ -0,0 +1,135 @@
+# -*- coding: utf8 -*-
+""" Conditions on the resources retrieved by the APIHelper classes.
+
+    A Query is compiled against the filters each API supports: conditions the API can evaluate
+    are sent as native 'Filters', so only matching resources are downloaded, and the rest are
+    evaluated on the client side. """
+
+from . import UTC_TZ
+
+
+def _as_list(value):
+    if isinstance(value, (list, tuple, set, frozenset)):
+        return list(value)
+    return [value]
+
+
+def _utc(dt):
+    # Naive datetimes are taken as UTC
+    if dt.tzinfo is None:
+        return dt.replace(tzinfo=UTC_TZ)
+    return dt
+
+
+class Query(object):
+    """ Conditions on a resource, all of which must hold:
+        * vpc: ID of the VPC of the resource
+        * tags: dict of {key: value}. The value may be a list of accepted values, or None to only
+          require the key
+        * state: state (or list of accepted states) of the resource
+        * created_before / created_after: datetime limits of the creation time """
+
+    def __init__(self, vpc=None, tags=None, state=None, created_before=None, created_after=None):
+        self.vpc = vpc
+        self.tags = tags or {}
+        self.state = state
+        self.created_before = created_before
+        self.created_after = created_after
+
+    def compile(self, filter_names):
+        """ Compiles the query for an API. filter_names maps the conditions the API can evaluate
+            ('vpc', 'state', 'tag' and 'tag-key') to the name of its filter ('tag' with a %s for
+            the key). """
+        return CompiledQuery(self, filter_names or {})
+
+
+class CompiledQuery(object):
+
+    def __init__(self, query, filter_names):
+        self.filters = []
+        # Checks on the describe output of the resource, and checks on its tags, which may need
+        # an extra API call per resource
+        self.checks = []
+        self.tag_checks = []
+
+        if query.state is not None:
+            states = _as_list(query.state)
+            if 'state' in filter_names:
+                self.filters.append({'Name': filter_names['state'], 'Values': states})
+            else:
+                states = frozenset(states)
+                self.checks.append(lambda resource: _get(resource, 'status') in states)
+
+        if query.vpc is not None:
+            vpc = query.vpc
+            if 'vpc' in filter_names:
+                self.filters.append({'Name': filter_names['vpc'], 'Values': [vpc]})
+            else:
+                self.checks.append(lambda resource: _get(resource, 'vpc') == vpc)
+
+        if query.created_after is not None or query.created_before is not None:
+            after = query.created_after and _utc(query.created_after)
+            before = query.created_before and _utc(query.created_before)
+
+            def created_in_range(resource):
+                created = _get(resource, 'created_time')
+                if created is None:
+                    return False
+                created = _utc(created)
+                return (after is None or created > after) and (before is None or created < before)
+
+            self.checks.append(created_in_range)
+
+        for key, value in query.tags.items():
+            if value is None:
+                if 'tag-key' in filter_names:
+                    self.filters.append({'Name': filter_names['tag-key'], 'Values': [key]})
+                else:
+                    self.tag_checks.append(lambda resource, key=key: key in resource.tags)
+            else:
+                values = _as_list(value)
+                if 'tag' in filter_names:
+                    self.filters.append({'Name': filter_names['tag'] % key, 'Values': values})
+                else:
+                    values = frozenset(values)
+                    self.tag_checks.append(
+                        lambda resource, key=key, values=values: resource.tags.get(key) in values)
+
+    def params(self, params):
+        """ Returns the parameters for the describe function, with the native filters added """
+        if not self.filters:
+            return params
+        params = dict(params)
+        params['Filters'] = list(params.get('Filters', [])) + self.filters
+        return params
+
+    def matches(self, resource):
+        for check in self.checks:
+            if not check(resource):
+                return False
+        for check in self.tag_checks:
+            if not check(resource):
+                return False
+        return True
+
+    def filter(self, resources, prefetch_tags=None):
+        """ Returns the resources which pass the client side checks. The checks on the describe
+            output run first; prefetch_tags, if given, is called with the resources left before
+            their tags are checked """
+        checks = self.checks
+        resources = [r for r in resources if all(check(r) for check in checks)]
+        if self.tag_checks:
+            if prefetch_tags is not None:
+                prefetch_tags(resources)
+            tag_checks = self.tag_checks
+            resources = [r for r in resources if all(check(r) for check in tag_checks)]
+        return resources
+
+
+def _get(resource, attribute):
+    # Resource types without the attribute, or resources missing the data it is read from, never
+    # match
+    try:
+        return getattr(resource, attribute)
+    except (NotImplementedError, AttributeError, KeyError, IndexError, TypeError):
+        return None
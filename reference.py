@@ -0,0 +1,99 @@
+# -*- coding: utf8 -*-
+""" Shared cache of EC2 reference data: VPCs, subnets, default security groups and availability
+    zones.
+
+    Each kind of data is loaded in bulk, with one paginated call per account and region, the
+    first time it is needed there, and loaded again once older than its TTL. Lookups such as the
+    VPC of a subnet or the default security group of a VPC are then answered from memory, so
+    sweeps over thousands of resources do not call the EC2 API once per resource.
+
+    Every function takes the region, account and role to look in, which default to those of the
+    default client. """
+
+from . import indexes
+
+# Time to live of the loaded data, in seconds. Kinds not listed here use DEFAULT_TTL.
+DEFAULT_TTL = 900
+TTLS = {
+    'availability_zones': 24 * 3600,
+}
+
+
+def _load_vpcs(client):
+    return dict((vpc['VpcId'], vpc)
+                for vpc in indexes.describe_all(client, 'describe_vpcs', 'Vpcs'))
+
+
+def _load_subnets(client):
+    return dict((subnet['SubnetId'], subnet)
+                for subnet in indexes.describe_all(client, 'describe_subnets', 'Subnets'))
+
+
+def _load_default_sgs(client):
+    groups = indexes.describe_all(client, 'describe_security_groups', 'SecurityGroups',
+                                  Filters=[{'Name': 'group-name', 'Values': ['default']}])
+    return dict((group['VpcId'], group['GroupId']) for group in groups if 'VpcId' in group)
+
+
+def _load_availability_zones(client):
+    return [zone['ZoneName'] for zone in indexes.describe_all(
+        client, 'describe_availability_zones', 'AvailabilityZones')]
+
+
+_LOADERS = {
+    'vpcs': _load_vpcs,
+    'subnets': _load_subnets,
+    'default_sgs': _load_default_sgs,
+    'availability_zones': _load_availability_zones,
+}
+
+# One index of the EC2 API per kind of data, see indexes.Index
+_indexes = dict((kind, indexes.Index(kind.replace('_', ' '), 'ec2', load,
+                                     TTLS.get(kind, DEFAULT_TTL)))
+                for kind, load in _LOADERS.items())
+
+
+def _get(kind, region=None, account=None, role=None):
+    return _indexes[kind].get(region, account, role)
+
+
+def vpcs(region=None, account=None, role=None):
+    """ Returns the descriptions of all VPCs, by VPC ID """
+    return _get('vpcs', region, account, role)
+
+
+def subnets(region=None, account=None, role=None):
+    """ Returns the descriptions of all subnets, by subnet ID """
+    return _get('subnets', region, account, role)
+
+
+def default_sgs(region=None, account=None, role=None):
+    """ Returns the IDs of the default security groups, by VPC ID """
+    return _get('default_sgs', region, account, role)
+
+
+def availability_zones(region=None, account=None, role=None):
+    """ Returns the names of the availability zones of the region """
+    return _get('availability_zones', region, account, role)
+
+
+def subnet_vpc(subnet, region=None, account=None, role=None):
+    """ Returns the ID of the VPC of a subnet, or None if the subnet does not exist """
+    description = subnets(region, account, role).get(subnet)
+    return description['VpcId'] if description is not None else None
+
+
+def default_sg(vpc, region=None, account=None, role=None):
+    """ Returns the ID of the default security group of a VPC, or None if not found """
+    return default_sgs(region, account, role).get(vpc)
+
+
+def invalidate(region=None, account=None, role=None):
+    """ Drops all the data loaded for a location, to be loaded again when next needed """
+    for index in _indexes.values():
+        index.invalidate(region, account, role)
+
+
+def clear():
+    for index in _indexes.values():
+        index.clear()
@@ -1,29 +1,137 @@
 __author__ = 'sebalopez'
 import arn
+import cache
 import datetime
-import dateutil.parser
+import functools
+import indexes
 import itertools
 import logging
-import boto3
 import boto3_clients as clients
+import metrics
+import parallel
+import reference
+import time
 from botocore.exceptions import ClientError
-from dateutil.tz import tzutc
 
 logger = logging.getLogger(__name__)
 
 
+def is_not_found(error):
+    """ Whether a ClientError means that some of the resources a call names do not exist, or
+        that their IDs are malformed """
+    code = error.response.get('Error', {}).get('Code', '')
+    message = error.response.get('Error', {}).get('Message', '')
+    # CloudFormation reports missing stacks as a ValidationError
+    return 'NotFound' in code or code.endswith('.Malformed') or code == 'InvalidID' or \
+        (code == 'ValidationError' and 'does not exist' in message)
+
+
+def _mutates(method):
+    """ Decorator for the methods which change the resource in AWS. Afterwards, the cached
+        describe output of its service in its region and account is dropped (see cache.py) """
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        try:
+            with metrics.context(action='%s.%s' % (type(self).__name__, method.__name__)):
+                return method(self, *args, **kwargs)
+        finally:
+            cache.invalidate_resource(self)
+    return wrapper
+
+
+def _project(data, fields):
+    """ Returns a copy of a describe output with only the given fields. A field may be a path to a
+        nested field, e.g. 'DBSubnetGroup.VpcId' """
+    projected = {}
+    for field in fields:
+        path = field.split('.')
+        source, target = data, projected
+        for key in path[:-1]:
+            source = source.get(key)
+            if not isinstance(source, dict):
+                break
+            target = target.setdefault(key, {})
+        else:
+            if path[-1] in source:
+                target[path[-1]] = source[path[-1]]
+    return projected
+
+
 class Resource(object):
 
-    def __init__(self, obj_id, obj_data):
+    # Resources carry no __dict__, so large inventories take as little memory as possible.
+    # Subclasses must define __slots__ too, listing any attribute they add.
+    __slots__ = ('_id', '_data', '_tags', '_region', '_account', '_role', '_loader')
+
+    # Fields of the describe output read by the properties of the class, kept by compact resources
+    # (see _compact). Tags are kept apart, in _tags.
+    _compact_fields = ()
+
+    # Resource type in the Resource Groups Tagging API. If defined, the tags of many resources of
+    # the class are loaded at once from that API (see _load_tags), and written through it (see
+    # tags.tag_many). Classes defining it must have an 'arn' property.
+    _tagging_resource_type = None
+
+    # Kind of the resource in the usage index, for the resources others refer to (see
+    # indexes.resource_usage)
+    _usage_kind = None
+
+    def __init__(self, obj_id, obj_data=None, region=None, account=None, role=None):
         self._id = obj_id
         self._data = obj_data
         self._tags = None
+        self._region = region
+        self._account = account
+        self._role = role
+        # Function returning the full describe output of compact resources, None if _data is
+        # complete
+        self._loader = None
+
+    def _compact(self, loader, strings):
+        """ Keeps only the _compact_fields of the describe output, which is loaded again with
+            loader if the full output is needed (see the data property). Tags in the describe
+            output are moved to _tags, sharing the strings found in the strings dict with other
+            resources """
+        if self._data is None:
+            return
+        if self._tags is None and 'Tags' in self._data:
+            self._tags = dict((strings.setdefault(t['Key'], t['Key']),
+                               strings.setdefault(t['Value'], t['Value']))
+                              for t in self._data['Tags'])
+        self._data = _project(self._data, self._compact_fields)
+        self._loader = loader
+
+    @property
+    def data(self):
+        """ Full describe output of the resource, loaded again the first time it is needed if the
+            resource is compact """
+        if self._loader is not None:
+            data = self._loader(self)
+            if data is None:
+                logger.warn('Could not describe %s, only part of its data is available', self)
+            else:
+                self._data = data
+            self._loader = None
+        return self._data
+
+    def _client(self, service=None):
+        """ Returns the client for the service of this resource (or for the given service) in the
+            region and account where the resource lives """
+        return clients.client(service or self._type, self._region, self._account, self._role)
+
+    @property
+    def region(self):
+        return self._region or clients.region
+
+    @property
+    def account(self):
+        return self._account or clients.account_id
 
     @property
     def tags(self):
         if self._tags is None:
             if hasattr(self, '_describe_tags_func'):
-                describe_tags_fn = getattr(getattr(clients, self._type), self._describe_tags_func)
+                describe_tags_fn = getattr(self._client(), self._describe_tags_func)
                 self._tags = {t['Key']: t['Value']
                               for t in self._get_tag_obj_from_api_response(
                                   describe_tags_fn(**self._describe_tags_params))}
@@ -31,6 +139,60 @@ class Resource(object):
                 self._tags = {t['Key']: t['Value'] for t in self._data.get('Tags', [])}
         return self._tags
 
+    @classmethod
+    def _load_tags(cls, resources):
+        """ Loads the tags of many resources of this class, all in the same region and account,
+            with as few API calls as possible """
+        if hasattr(cls, '_describe_tags_batch_size'):
+            cls._load_tags_in_batches(resources)
+        elif cls._tagging_resource_type is not None:
+            cls._load_tags_from_tagging_api(resources)
+        for resource in resources:
+            if resource._tags is None:
+                resource.tags
+
+    @classmethod
+    def _load_tags_in_batches(cls, resources):
+        # For APIs which describe the tags of several resources in a single call
+        describe_tags_fn = getattr(resources[0]._client(), cls._describe_tags_func)
+        for chunk in parallel.chunks(resources, cls._describe_tags_batch_size):
+            by_id = dict((resource._id, resource) for resource in chunk)
+            response = describe_tags_fn(**{cls._describe_tags_batch_param:
+                                           [resource._id for resource in chunk]})
+            for description in response['TagDescriptions']:
+                by_id[description[cls._describe_tags_batch_id]]._tags = {
+                    t['Key']: t['Value'] for t in description['Tags']}
+            for resource in chunk:
+                if resource._tags is None:
+                    resource._tags = {}
+
+    @classmethod
+    def _load_tags_from_tagging_api(cls, resources):
+        first = resources[0]
+        by_arn = dict((resource.arn, resource) for resource in resources)
+        for region in cls._tagging_regions(first._region, first._account, first._role):
+            tagging = clients.client('resourcegroupstaggingapi', region, first._account, first._role)
+            pages = tagging.get_paginator('get_resources').paginate(
+                ResourceTypeFilters=[cls._tagging_resource_type], ResourcesPerPage=100)
+            for page in pages:
+                for mapping in page['ResourceTagMappingList']:
+                    resource = by_arn.get(mapping['ResourceARN'])
+                    if resource is not None:
+                        resource._tags = {t['Key']: t['Value'] for t in mapping['Tags']}
+        # Resources without tags are not returned by the Tagging API
+        for resource in resources:
+            if resource._tags is None:
+                resource._tags = {}
+
+    @classmethod
+    def _tagging_regions(cls, region, account=None, role=None):
+        return [region]
+
+    # ID used to tag the resource in APIs which take resource IDs
+    @property
+    def _tag_id(self):
+        return self._id
+
     @property
     def created_time(self):
         raise NotImplementedError
@@ -54,15 +216,22 @@ class Resource(object):
     def groups(self):
         return NotImplemented
 
+    @property
+    def referrers(self):
+        """ (kind, ID) of the resources which refer to this one, from the usage index of its
+            region and account """
+        if self._usage_kind is None:
+            raise NotImplementedError
+        return indexes.referrers(self._usage_kind, self._id, self._region, self._account,
+                                 self._role)
+
     def default_sg(self):
-        return clients.ec2.describe_security_groups(Filters=[
-            {'Name': 'vpc-id', 'Values': [self.vpc]},
-            {'Name': 'group-name', 'Values': ['default']}
-        ])['SecurityGroups'][0]['GroupId']
+        return reference.default_sg(self.vpc, self._region, self._account, self._role)
 
-    def terminate(self):
-        terminate_fn = getattr(getattr(clients, self._type), self._terminate_func)
-        return terminate_fn(**self._terminate_params)
+    @_mutates
+    def terminate(self, **kwargs):
+        terminate_fn = getattr(self._client(), self._terminate_func)
+        return terminate_fn(**dict(self._terminate_params, **kwargs))
 
     def __str__(self):
         obj_str = '[%s]:%s' % (self.type, self._id)
@@ -72,28 +241,21 @@ class Resource(object):
 
 
 class EC2_Resource(Resource):
+    __slots__ = ()
     _type = 'ec2'
-    _default_sg = {}
     _terminate_func = 'terminate_instances'
+    _compact_fields = ('VpcId', 'State', 'LaunchTime', 'SecurityGroups', 'StateTransitionReason')
 
     @classmethod
-    def get_default_sg(self, vpc):
-        if not EC2_Resource._default_sg:
-            logger.info('Retrieving default security groups')
-            groups = clients.ec2.describe_security_groups(
-                Filters=[{'Name': 'group-name', 'Values': ['default']}])['SecurityGroups']
-            for g in groups:
-                EC2_Resource._default_sg.setdefault(g['VpcId'], g['GroupId'])
-
-        if vpc in EC2_Resource._default_sg:
-            return EC2_Resource._default_sg[vpc]
-        else:
+    def get_default_sg(self, vpc, region=None, account=None, role=None):
+        default_sg = reference.default_sg(vpc, region, account, role)
+        if default_sg is None:
             logger.error('Could not find default security group for vpc %s', vpc)
-            return None
+        return default_sg
 
-    def __init__(self, _id, _data=None):
-        self._terminate_params = {'InstanceIds': [_id], 'DryRun': False}
-        super(EC2_Resource, self).__init__(_id, _data)
+    @property
+    def _terminate_params(self):
+        return {'InstanceIds': [self._id]}
 
     @property
     def vpc(self):
@@ -112,30 +274,33 @@ class EC2_Resource(Resource):
         return [sg['GroupId'] for sg in self._data['SecurityGroups']]
 
     @groups.setter
+    @_mutates
     def groups(self, sgroups, **kwargs):
-        clients.ec2.modify_instance_attribute(InstanceId=self._id, Groups=sgroups)
+        self._client().modify_instance_attribute(InstanceId=self._id, Groups=sgroups)
         self._data['SecurityGroups'] = [{'GroupName': 'default', 'GroupId': g} for g in sgroups]
 
+    @_mutates
     def delete_tags(self, keys, **kwargs):
-        return clients.ec2.delete_tags(Resources=[self._id],
+        return self._client().delete_tags(Resources=[self._id],
                                        Tags=[{'Key': k} for k in keys],
                                        **kwargs)
 
+    @_mutates
     def terminate(self, clear_sg=True, DryRun=False):
         if clear_sg:
             logger.info('Setting security groups for instance %s to %s', self._id,
-                        [EC2_Resource.get_default_sg(self.vpc)])
-            self.groups = [EC2_Resource.get_default_sg(self.vpc)]
+                        [EC2_Resource.get_default_sg(self.vpc, self._region, self._account, self._role)])
+            self.groups = [EC2_Resource.get_default_sg(self.vpc, self._region, self._account, self._role)]
 
         # clear the Termination Protection first
-        clients.ec2.modify_instance_attribute(InstanceId=self._id,
+        self._client().modify_instance_attribute(InstanceId=self._id,
                                               DisableApiTermination={'Value': False},
                                               DryRun=DryRun)
-        self._terminate_params['DryRun'] = DryRun
-        super(EC2_Resource, self).terminate()
+        super(EC2_Resource, self).terminate(DryRun=DryRun)
 
+    @_mutates
     def shutdown(self, DryRun=False):
-        clients.ec2.stop_instances(InstanceIds=[self._id], DryRun=DryRun)
+        self._client().stop_instances(InstanceIds=[self._id], DryRun=DryRun)
 
     @property
     def uptime(self):
@@ -163,16 +328,27 @@ class EC2_Resource(Resource):
 
 
 class RDS_Resource(Resource):
+    __slots__ = ('_name',)
 
     _type = 'rds'
     _terminate_func = 'delete_db_instance'
     _describe_tags_func = 'list_tags_for_resource'
+    _tagging_resource_type = 'rds:db'
+    _compact_fields = ('DBInstanceIdentifier', 'DBSubnetGroup.VpcId', 'VpcSecurityGroups',
+                       'InstanceCreateTime', 'DBInstanceStatus')
 
-    def __init__(self, _id, _data=None):
-        self._terminate_params = {'DBInstanceIdentifier': _id, 'SkipFinalSnapshot': True}
+    def __init__(self, _id, _data=None, **kwargs):
         self._name = _id
-        self._describe_tags_params = {'ResourceName': self.arn}
-        super(RDS_Resource, self).__init__(self.arn, _data)
+        super(RDS_Resource, self).__init__(_id, _data, **kwargs)
+        self._id = self.arn
+
+    @property
+    def _terminate_params(self):
+        return {'DBInstanceIdentifier': self._name, 'SkipFinalSnapshot': True}
+
+    @property
+    def _describe_tags_params(self):
+        return {'ResourceName': self._id}
 
     @property
     def name(self):
@@ -180,7 +356,8 @@ class RDS_Resource(Resource):
 
     @property
     def arn(self):
-        return arn.rds_instance(self._name)
+        return arn.rds_instance(self._name, region=self._region,
+                                account_id=self._account)
 
     @property
     def vpc(self):
@@ -191,8 +368,9 @@ class RDS_Resource(Resource):
         return [sg['VpcSecurityGroupId'] for sg in self._data['VpcSecurityGroups']]
 
     @groups.setter
+    @_mutates
     def groups(self, sgroups):
-        clients.rds.modify_db_instance(DBInstanceIdentifier=self._name, VpcSecurityGroupIds=sgroups)
+        self._client().modify_db_instance(DBInstanceIdentifier=self._name, VpcSecurityGroupIds=sgroups)
         self._data['VpcSecurityGroups'] = [{'Status': 'active', 'VpcSecurityGroupId': g}
                                            for g in sgroups]
 
@@ -207,52 +385,44 @@ class RDS_Resource(Resource):
     def _get_tag_obj_from_api_response(self, obj):
         return obj['TagList']
 
+    @_mutates
     def delete_tags(self, keys):
-        return clients.rds.remove_tags_from_resource(ResourceName=self._id, TagKeys=keys)
+        return self._client().remove_tags_from_resource(ResourceName=self._id, TagKeys=keys)
 
+    @_mutates
     def shutdown(self, DryRun=False):
         if DryRun:
             raise ClientError({'Error': {'Code': 'DryRunOperation'}}, "")
         else:
-            clients.rds.stop_db_instance(DBInstanceIdentifier=self.name)
+            self._client().stop_db_instance(DBInstanceIdentifier=self.name)
 
     def last_event(self):
-        # RDS only tracks events for 14 days
-        look_back_hours = 335
-        now = datetime.datetime.utcnow()
-        try:
-            return clients.rds.describe_events(
-                SourceIdentifier=self.name,
-                SourceType='db-instance',
-                StartTime=now - datetime.timedelta(hours=look_back_hours),
-                EndTime=now,
-                EventCategories=['creation', 'availability', 'notification', 'deletion']
-            )['Events'][-1]
-        except IndexError:
-            return 'NA'
+        # The events of all instances in the region and account are loaded at once, see indexes.py
+        event = indexes.rds_last_event(self.name, self._region, self._account, self._role)
+        return event if event is not None else 'NA'
+
+    def _time_since_last_event(self):
+        event = self.last_event()
+        if event == 'NA':
+            # RDS only tracks events for 14 days
+            return datetime.timedelta(days=14)
+        return datetime.datetime.utcnow() - event['Date'].replace(tzinfo=None)
 
     @property
     def uptime(self):
         if self.status == 'available':
-            if self.last_event() == 'NA':
-                return datetime.timedelta(days=14)
-            else:
-                now = datetime.datetime.utcnow()
-                return now-self.last_event()['Date'].replace(tzinfo=None)
+            return self._time_since_last_event()
         else:
             return datetime.timedelta(0)
 
     @property
     def downtime(self):
         if self.status == 'stopped':
-            if self.last_event() == 'NA':
-                return datetime.timedelta(days=14)
-            else:
-                now = datetime.datetime.utcnow()
-                return now-self.last_event()['Date'].replace(tzinfo=None)
+            return self._time_since_last_event()
         else:
             return datetime.timedelta(0)
 
+    @_mutates
     def terminate(self, DryRun=False):
         if DryRun:
             raise ClientError({'Error': {'Code': 'DryRunOperation'}}, "")
@@ -261,24 +431,38 @@ class RDS_Resource(Resource):
 
 
 class RDSAurora_Resource(Resource):
+    __slots__ = ()
     _type = 'rds'
     _terminate_func = 'delete_db_cluster'
+    _tagging_resource_type = 'rds:cluster'
+    _compact_fields = ('DBClusterArn',)
 
-    def __init__(self, _id, _data=None):
-        super(RDSAurora_Resource, self).__init__(_id, _data)
-        self._terminate_params = {'DBClusterIdentifier': _id, 'SkipFinalSnapshot': True}
+    @property
+    def _terminate_params(self):
+        return {'DBClusterIdentifier': self._id, 'SkipFinalSnapshot': True}
+
+    @property
+    def arn(self):
+        return self._data['DBClusterArn']
 
 
 class ELB_Resource(Resource):
+    __slots__ = ()
     _type = 'elb'
     _terminate_func = 'delete_load_balancer'
     _describe_tags_func = 'describe_tags'
+    _describe_tags_batch_size = 20
+    _describe_tags_batch_param = 'LoadBalancerNames'
+    _describe_tags_batch_id = 'LoadBalancerName'
+    _compact_fields = ('VPCId', 'SecurityGroups', 'CreatedTime')
 
-    def __init__(self, _id, _data=None):
-        self._terminate_params = {'LoadBalancerName': _id}
-        self._describe_tags_params = {'LoadBalancerNames': [_id]}
-        super(ELB_Resource, self).__init__(_id, _data)
-        self._name = _id
+    @property
+    def _terminate_params(self):
+        return {'LoadBalancerName': self._id}
+
+    @property
+    def _describe_tags_params(self):
+        return {'LoadBalancerNames': [self._id]}
 
     @property
     def vpc(self):
@@ -289,8 +473,9 @@ class ELB_Resource(Resource):
         return self._data['SecurityGroups']
 
     @groups.setter
+    @_mutates
     def groups(self, sggroups):
-        clients.elb.apply_security_groups_to_load_balancer(
+        self._client().apply_security_groups_to_load_balancer(
             LoadBalancerName=self._id, SecurityGroups=sggroups)
 
     @property
@@ -302,14 +487,27 @@ class ELB_Resource(Resource):
 
 
 class ELBv2_Resource(Resource):
+    __slots__ = ()
     _type = 'elbv2'
     _terminate_func = 'delete_load_balancer'
     _describe_tags_func = 'describe_tags'
+    _describe_tags_batch_size = 20
+    _describe_tags_batch_param = 'ResourceArns'
+    _describe_tags_batch_id = 'ResourceArn'
+    _tagging_resource_type = 'elasticloadbalancing:loadbalancer'
+    _compact_fields = ('VpcId', 'SecurityGroups', 'CreatedTime')
+
+    @property
+    def _terminate_params(self):
+        return {'LoadBalancerArn': self._id}
 
-    def __init__(self, _id, _data=None):
-        self._terminate_params = {'LoadBalancerArn': _id}
-        self._describe_tags_params = {'ResourceArns': [_id]}
-        super(ELBv2_Resource, self).__init__(_id, _data)
+    @property
+    def _describe_tags_params(self):
+        return {'ResourceArns': [self._id]}
+
+    @property
+    def arn(self):
+        return self._id
 
     @property
     def vpc(self):
@@ -320,8 +518,9 @@ class ELBv2_Resource(Resource):
         return self._data['SecurityGroups']
 
     @groups.setter
+    @_mutates
     def groups(self, sggroups):
-        clients.elbv2.set_security_groups(LoadBalancerArn=self._id, SecurityGroups=sggroups)
+        self._client().set_security_groups(LoadBalancerArn=self._id, SecurityGroups=sggroups)
 
     @property
     def created_time(self):
@@ -330,33 +529,37 @@ class ELBv2_Resource(Resource):
     def _get_tag_obj_from_api_response(self, obj):
         return obj['TagDescriptions'][0]['Tags']
 
+    @_mutates
     def terminate(self):
         # clear deletion protection first
-        clients.elbv2.modify_load_balancer_attributes(
+        self._client().modify_load_balancer_attributes(
             LoadBalancerArn=self._id, Attributes=[{'Key': 'deletion_protection.enabled',
                                                    'Value': 'false'}])
         return super(ELBv2_Resource, self).terminate()
 
 
 class AutoScalingGroup_Resource(Resource):
+    __slots__ = ('valid_tags',)
     _type = 'autoscaling'
     # NOTE: Deleting an AutoScaling Group automatically terminates all the instances under it.
     # The Group cannot be deleted otherwise
     _terminate_func = 'delete_auto_scaling_group'
+    _compact_fields = ('CreatedTime', 'SuspendedProcesses', 'DesiredCapacity')
 
-    def __init__(self, _id, _data=None):
-        self._terminate_params = {'AutoScalingGroupName': _id, 'ForceDelete': True}
-        super(AutoScalingGroup_Resource, self).__init__(_id, _data)
-        if _data is not None:
-            self.data = _data
-        else:
+    def __init__(self, _id, _data=None, **kwargs):
+        super(AutoScalingGroup_Resource, self).__init__(_id, _data, **kwargs)
+        if _data is None:
             try:
-                self.data = clients.autoscaling.describe_auto_scaling_groups(AutoScalingGroupNames=[_id])['AutoScalingGroups'][0]
+                self._data = self._client().describe_auto_scaling_groups(AutoScalingGroupNames=[_id])['AutoScalingGroups'][0]
             except IndexError:
                 logger.warn('no data found for group %s' %_id)
-                self.data = {}
+                self._data = {}
         self.valid_tags = []
 
+    @property
+    def _terminate_params(self):
+        return {'AutoScalingGroupName': self._id, 'ForceDelete': True}
+
     @property
     def name(self):
         return self._id
@@ -365,28 +568,31 @@ class AutoScalingGroup_Resource(Resource):
     def created_time(self):
         return self._data['CreatedTime']
 
+    @_mutates
     def suspend(self, DryRun=False):
         if DryRun:
             raise ClientError({'Error': {'Code': 'DryRunOperation'}}, "")
         else:
-            return clients.autoscaling.suspend_processes(
+            return self._client().suspend_processes(
                 AutoScalingGroupName=self._id,
                 ScalingProcesses=['Launch', 'Terminate', 'ReplaceUnhealthy']
             )
 
+    @_mutates
     def terminate(self, DryRun=False):
         if DryRun:
             raise ClientError({'Error': {'Code': 'DryRunOperation'}}, "")
         else:
-            return super(RDS_Resource, self).terminate()
+            return super(AutoScalingGroup_Resource, self).terminate()
 
     # Shutdown for an AutoScaling group is taken as setting its desired capacity to 0.
     # This terminates all its instances while not deleting the group itself
+    @_mutates
     def shutdown(self, DryRun=False):
         if DryRun:
             raise ClientError({'Error': {'Code': 'DryRunOperation'}}, "")
         else:
-            return clients.autoscaling.set_desired_capacity(AutoScalingGroupName=self.name, DesiredCapacity=0)
+            return self._client().set_desired_capacity(AutoScalingGroupName=self.name, DesiredCapacity=0)
 
     # This returns if the group's Launch process is suspended and when.
     # It indicates whether stopping or deleting its instances would trigger a new one
@@ -404,18 +610,20 @@ class AutoScalingGroup_Resource(Resource):
             'Status': 'Active'
         }
 
+    def _time_since_last_activity(self, kind):
+        # The activities of all groups in the region and account are loaded at once, see indexes.py
+        since = indexes.last_scaling_activity(self._id, kind, self._region, self._account,
+                                              self._role)
+        if since is None:
+            since = self._data['CreatedTime']
+        return datetime.datetime.utcnow() - since.replace(tzinfo=None)
+
     # Downtime for an ASG is the amount of time since it latest Terminate activity when the group size is 0
     # if none found it will be the group creation time
     @property
     def downtime(self):
         if self._data['DesiredCapacity'] == 0:
-            ### TEMPORARYY SOOLUTION UNTIL WE CAN RESOLVE THE THROTTLING ISSUES
-            return datetime.datetime.utcnow() - self._data['CreatedTime'].replace(tzinfo=None)
-            #            activities = clients.autoscaling.describe_scaling_activities(AutoScalingGroupName=self.name)['Activities'] 
-            #            if len(activities) > 0:
-            #                return datetime.datetime.utcnow() - activities[0]['StartTime'].replace(tzinfo=None)
-            #            else:
-            #                return datetime.datetime.utcnow() - self._data['CreatedTime'].replace(tzinfo=None)
+            return self._time_since_last_activity('Terminate')
         else:
             return datetime.timedelta(0)
 
@@ -426,26 +634,29 @@ class AutoScalingGroup_Resource(Resource):
         if self._data['DesiredCapacity'] == 0:
             return datetime.timedelta(0)
         else:
-            ### TEMPORARYY SOOLUTION UNTIL WE CAN RESOLVE THE THROTTLING ISSUES
-            return datetime.datetime.utcnow() - self._data['CreatedTime'].replace(tzinfo=None)
-            #            activities = clients.autoscaling.describe_scaling_activities(AutoScalingGroupName=self.name)['Activities']
-            #            if len(activities) > 0:
-            #                return datetime.datetime.utcnow() - activities[0]['StartTime'].replace(tzinfo=None)
-            #            else:
-            #                return datetime.datetime.utcnow() - self._data['CreatedTime'].replace(tzinfo=None)
+            return self._time_since_last_activity('Launch')
 
 
 class S3Bucket_Resource(Resource):
+    __slots__ = ('valid_tags',)
     _type = 's3'
     _describe_tags_func = 'get_bucket_tagging'
+    _tagging_resource_type = 's3'
     _terminate_func = 'delete_bucket'
+    _compact_fields = ('CreationDate',)
 
-    def __init__(self, _id, _data=None):
-        self._describe_tags_params = {'Bucket': _id}
-        self._terminate_params = {'Bucket': _id}
-        super(S3Bucket_Resource, self).__init__(_id, _data)
+    def __init__(self, _id, _data=None, **kwargs):
+        super(S3Bucket_Resource, self).__init__(_id, _data, **kwargs)
         self.valid_tags = []
 
+    @property
+    def _terminate_params(self):
+        return {'Bucket': self._id}
+
+    @property
+    def _describe_tags_params(self):
+        return {'Bucket': self._id}
+
     @property
     def created_time(self):
         return self._data['CreationDate']
@@ -454,36 +665,65 @@ class S3Bucket_Resource(Resource):
     def name(self):
         return self._id
 
+    @property
+    def arn(self):
+        return arn.s3_bucket(self._id)
+
+    # Buckets are listed for all regions at once, but the Tagging API is regional: buckets whose
+    # region is not known are looked for in every region enabled in their account
+    @classmethod
+    def _tagging_regions(cls, region, account=None, role=None):
+        if region is not None:
+            return [region]
+        if account is None:
+            return clients.regions
+        ec2 = clients.client('ec2', None, account, role)
+        return [r['RegionName'] for r in ec2.describe_regions()['Regions']]
+
     def _get_tag_obj_from_api_response(self, obj):
         return obj['TagSet']
 
+    @_mutates
     def terminate(self):
-        bucket = boto3.resource('s3').Bucket(self._id)
-        bucket.objects.all().delete()
-        bucket.object_versions.all().delete()
+        # Objects and their versions are deleted with the client of the bucket's own region and
+        # account, up to 1000 per call
+        s3 = self._client()
+        for page in s3.get_paginator('list_object_versions').paginate(Bucket=self._id):
+            objects = [{'Key': version['Key'], 'VersionId': version['VersionId']}
+                       for version in page.get('Versions', []) + page.get('DeleteMarkers', [])]
+            if objects:
+                s3.delete_objects(Bucket=self._id, Delete={'Objects': objects, 'Quiet': True})
         super(S3Bucket_Resource, self).terminate()
 
 
 class LaunchConfiguration_Resource(Resource):
+    __slots__ = ()
     _type = 'autoscaling'
     _terminate_func = 'delete_launch_configuration'
+    _usage_kind = 'launchconfiguration'
 
     def _get_tag_obj_from_api_response(self, obj):
         return []
 
-    def __init__(self, _id, _data=None):
-        self._terminate_params = {'LaunchConfigurationName': _id}
-        super(LaunchConfiguration_Resource, self).__init__(_id, _data)
+    @property
+    def _terminate_params(self):
+        return {'LaunchConfigurationName': self._id}
 
 
 class SecurityGroup_Resource(Resource):
+    __slots__ = ()
     _type = EC2_Resource._type
     _terminate_func = 'delete_security_group'
+    _usage_kind = 'securitygroup'
+    _compact_fields = ('VpcId', 'GroupName')
 
-    def __init__(self, _id, _data=None):
-        self._terminate_params = {'GroupId': _id}
-        super(SecurityGroup_Resource, self).__init__(_id, _data)
-        self.isdefault = self.name == 'default'
+    @property
+    def _terminate_params(self):
+        return {'GroupId': self._id}
+
+    @property
+    def isdefault(self):
+        return self.name == 'default'
 
     @property
     def vpc(self):
@@ -497,13 +737,17 @@ class SecurityGroup_Resource(Resource):
     def type(self):
         return 'securitygroup'
 
-    def terminate(self):
+    @_mutates
+    def terminate(self, raise_errors=False):
+        """ Deletes the group. Failures are logged, or raised with raise_errors """
         if self.name == 'default':
             logger.warn("Refusing to remove default security group %s for VPC %s", self, self.vpc)
         else:
             try:
                 super(SecurityGroup_Resource, self).terminate()
             except ClientError as e:
+                if raise_errors:
+                    raise
                 if e.response['Error']['Code'] == 'DependencyViolation':
                     logger.error('Could not delete security group: the group is still attached to other resources.')
                 else:
@@ -511,30 +755,36 @@ class SecurityGroup_Resource(Resource):
 
 
 class EBSVolume_Resource(Resource):
+    __slots__ = ()
     _type = EC2_Resource._type
     _terminate_func = 'delete_volume'
 
-    def __init__(self, _id, _data=None):
-        self._terminate_params = {'VolumeId': _id}
-        super(EBSVolume_Resource, self).__init__(_id, _data)
+    @property
+    def _terminate_params(self):
+        return {'VolumeId': self._id}
 
+    @_mutates
     def terminate(self, DryRun=False):
-        self._terminate_params['DryRun'] = DryRun
-        super(EBSVolume_Resource, self).terminate()
+        super(EBSVolume_Resource, self).terminate(DryRun=DryRun)
 
 
 class Snapshot_Resource(Resource):
+    __slots__ = ()
     _type = EC2_Resource._type
     _terminate_func = 'delete_snapshot'
+    _usage_kind = 'snapshot'
 
-    def __init__(self, _id, _data=None):
-        self._terminate_params = {'SnapshotId': _id}
-        super(Snapshot_Resource, self).__init__(_id, _data)
+    @property
+    def _terminate_params(self):
+        return {'SnapshotId': self._id}
 
 
 class AMI_Resource(Resource):
+    __slots__ = ()
     _type = EC2_Resource._type
     _terminate_func = 'deregister_image'
+    _usage_kind = 'image'
+    _compact_fields = ('Name', 'CreationDate')
 
     @property
     def name(self):
@@ -542,73 +792,140 @@ class AMI_Resource(Resource):
 
     @property
     def created_time(self):
+        import dateutil.parser
         return dateutil.parser.parse(self._data['CreationDate'])
 
-    def __init__(self, _id, _data=None):
-        self._terminate_params = {'ImageId': _id}
-        super(AMI_Resource, self).__init__(_id, _data)
+    @property
+    def _terminate_params(self):
+        return {'ImageId': self._id}
 
 
 class ENI_Resource(Resource):
+    __slots__ = ()
     _type = EC2_Resource._type
     _terminate_func = 'delete_network_interface'
 
-    def __init__(self, _id, _data=None):
-        self._terminate_params = {'NetworkInterfaceId': _id}
-        super(ENI_Resource, self).__init__(_id, _data)
+    @property
+    def _terminate_params(self):
+        return {'NetworkInterfaceId': self._id}
 
 
 class KeyPair_Resource(Resource):
+    __slots__ = ()
     _type = EC2_Resource._type
     _terminate_func = 'delete_key_pair'
+    _usage_kind = 'keypair'
+    _compact_fields = ('KeyPairId',)
 
-    def __init__(self, _id, _data=None):
-        self._terminate_params = {'KeyName': _id}
-        super(KeyPair_Resource, self).__init__(_id, _data)
+    @property
+    def _terminate_params(self):
+        return {'KeyName': self._id}
 
     @property
     def type(self):
         return 'key'
 
+    # Key pairs are tagged by ID, not by name
+    @property
+    def _tag_id(self):
+        return self._data['KeyPairId']
+
+
+# Deleting mount targets takes about a minute. Their file system can be deleted afterwards
+MOUNT_TARGETS_DELETE_TIMEOUT = 600
+MOUNT_TARGETS_POLL_INTERVAL = 10
+
 
 class EFS_Resource(Resource):
+    __slots__ = ('_mount_targets', '_security_groups')
     _type = 'efs'
     _terminate_func = 'delete_file_system'
     _describe_tags_func = 'describe_tags'
+    _tagging_resource_type = 'elasticfilesystem:file-system'
+    _compact_fields = ('CreationTime', 'Name')
+
+    def __init__(self, _id, _data=None, **kwargs):
+        super(EFS_Resource, self).__init__(_id, _data, **kwargs)
+        # Mount targets and their security groups are loaded when first needed, or for many file
+        # systems at once with prefetch_mount_targets
+        self._mount_targets = None
+        self._security_groups = None
+
+    @property
+    def _terminate_params(self):
+        return {'FileSystemId': self._id}
 
-    def __init__(self, _id, _data=None):
-        self._terminate_params = {'FileSystemId': _id}
-        self._describe_tags_params = self._terminate_params
-        super(EFS_Resource, self).__init__(_id, _data)
-        self._mount_targets = self._get_mount_targets()
-        self._security_groups = self._get_security_groups()
-        self._vpc = None
+    @property
+    def _describe_tags_params(self):
+        return {'FileSystemId': self._id}
 
     def _get_mount_targets(self):
         targets = []
         try:
-            targets = clients.efs.describe_mount_targets(FileSystemId=self._id)['MountTargets']
+            targets = self._client().describe_mount_targets(FileSystemId=self._id)['MountTargets']
         except ClientError:
             logger.exception('Failed to get mount targets for EFS %s', self._id)
 
         return targets
 
+    def _get_target_security_groups(self, target):
+        try:
+            return self._client().describe_mount_target_security_groups(
+                MountTargetId=target['MountTargetId'])['SecurityGroups']
+        except ClientError:
+            logger.exception('Failed to get security groups for mount target %s',
+                             target['MountTargetId'])
+            return None
+
     def _get_security_groups(self):
         groups = {}
-        for target in self._mount_targets:
-            try:
-                groups[target['MountTargetId']] = clients.efs.describe_mount_target_security_groups(
-                    MountTargetId=target['MountTargetId'])['SecurityGroups']
-            except ClientError:
-                logger.exception('Failed to get security groups for mount target %s',
-                                 target['MountTargetId'])
+        for target in self.mount_targets:
+            target_groups = self._get_target_security_groups(target)
+            if target_groups is not None:
+                groups[target['MountTargetId']] = target_groups
 
         return groups
 
+    @property
+    def mount_targets(self):
+        if self._mount_targets is None:
+            self._mount_targets = self._get_mount_targets()
+        return self._mount_targets
+
+    @property
+    def security_groups(self):
+        """ Security groups of each mount target, by mount target ID """
+        if self._security_groups is None:
+            self._security_groups = self._get_security_groups()
+        return self._security_groups
+
+    @classmethod
+    def prefetch_mount_targets(cls, file_systems, max_workers=parallel.MAX_WORKERS):
+        """ Loads the mount targets of many file systems and their security groups, with the calls
+            made in parallel """
+        parallel.pmap(lambda fs: fs.mount_targets, file_systems, max_workers)
+        targets = [(fs, target) for fs in file_systems if fs._security_groups is None
+                   for target in fs._mount_targets]
+
+        def target_security_groups(fs_target):
+            return fs_target[0]._get_target_security_groups(fs_target[1])
+
+        groups = parallel.pmap(target_security_groups, targets, max_workers)
+        for fs in file_systems:
+            if fs._security_groups is None:
+                fs._security_groups = {}
+        for (fs, target), target_groups in zip(targets, groups):
+            if target_groups is not None:
+                fs._security_groups[target['MountTargetId']] = target_groups
+
     @property
     def created_time(self):
         return self._data['CreationTime']
 
+    @property
+    def arn(self):
+        return arn.efs_file_system(self._id, region=self._region, account_id=self._account)
+
     def _get_tag_obj_from_api_response(self, obj):
         return obj['Tags']
 
@@ -618,78 +935,119 @@ class EFS_Resource(Resource):
 
     @property
     def vpc(self):
-        if self._vpc is None:
-            subnet_of_first_mount_target = self._mount_targets[0]['SubnetId']
-            vpc = clients.ec2.describe_subnets(SubnetIds=[subnet_of_first_mount_target])
-            self._vpc = vpc['Subnets'][0]['VpcId']
-
-        return self._vpc
+        if not self.mount_targets:
+            # Without mount targets, a file system is not in any VPC
+            return None
+        first_mount_target = self.mount_targets[0]
+        # Recent versions of the API include the VPC in the description of the mount target
+        if 'VpcId' in first_mount_target:
+            return first_mount_target['VpcId']
+        return reference.subnet_vpc(first_mount_target['SubnetId'], self._region, self._account,
+                                    self._role)
 
     @property
     def groups(self):
-        return list(set(itertools.chain(*self._security_groups.values())))
+        return list(set(itertools.chain(*self.security_groups.values())))
 
     @groups.setter
+    @_mutates
     def groups(self, sggroups):
         # To simplify, this assumes all mount points should get the same security groups.
-        for target in self._mount_targets:
+        for target in self.mount_targets:
             try:
                 logger.info('Setting security groups for mount point %s', target['MountTargetId'])
-                clients.efs.modify_mount_target_security_groups(
+                self._client().modify_mount_target_security_groups(
                     MountTargetId=target['MountTargetId'], SecurityGroups=sggroups)
             except ClientError:
                 logger.exception('Failed to set security groups')
-
-    def terminate(self):
-        if self._mount_targets:
-            for target in self._mount_targets:
+        self._security_groups = None
+
+    @_mutates
+    def delete_mount_target(self, target):
+        logger.info('Deleting mount target %s', target['MountTargetId'])
+        self._client().delete_mount_target(MountTargetId=target['MountTargetId'])
+        self._mount_targets = None
+        self._security_groups = None
+
+    @_mutates
+    def terminate(self, wait=False, timeout=MOUNT_TARGETS_DELETE_TIMEOUT):
+        """ Deletes the mount targets of the file system, then the file system. The file system
+            can only be deleted once its mount targets are gone: with wait, they are waited for
+            (up to timeout seconds), otherwise the file system is left for the next run """
+        if self.mount_targets:
+            for target in self.mount_targets:
+                if target.get('LifeCycleState') in ('deleting', 'deleted'):
+                    continue
                 logger.info('Deleting mount target %s', target['MountTargetId'])
                 try:
-                    clients.efs.delete_mount_target(MountTargetId=target['MountTargetId'])
+                    self._client().delete_mount_target(MountTargetId=target['MountTargetId'])
                 except ClientError:
                     logger.exception('Failed to delete mount target %s for filesystem %s',
                                      target['MountTargetId'], self._id)
                     logger.error('Deletion of file system aborted, manual intervention is required')
-            logger.warn('The mount targets of filesystem %s were removed, but the FS itself was not. It will be removed next time if it still exists', self._id)
-        else:
-            super(EFS_Resource, self).terminate()
+            self._mount_targets = None
+            self._security_groups = None
+            if not wait:
+                logger.warn('The mount targets of filesystem %s were removed, but the FS itself was not. It will be removed next time if it still exists', self._id)
+                return
+            deadline = time.time() + timeout
+            while self.mount_targets and time.time() < deadline:
+                time.sleep(MOUNT_TARGETS_POLL_INTERVAL)
+                self._mount_targets = None
+            # If the mount targets are still there, AWS refuses with FileSystemInUse
+        super(EFS_Resource, self).terminate()
 
 
 class DBSnapshot_Resource(Resource):
+    __slots__ = ()
     _type = RDS_Resource._type
     _terminate_func = 'delete_db_snapshot'
     _describe_tags_func = 'list_tags_for_resource'
+    _tagging_resource_type = 'rds:snapshot'
+    _compact_fields = ('SnapshotCreateTime',)
 
     @property
     def created_time(self):
+        from dateutil.tz import tzutc
         return self._data.get('SnapshotCreateTime', datetime.datetime.now(tzutc()))
 
     @property
     def arn(self):
-        return arn.rds_snapshot(self._id)
+        return arn.rds_snapshot(self._id, region=self._region,
+                                account_id=self._account)
 
-    def __init__(self, _id, _data=None):
-        self._terminate_params = {'DBSnapshotIdentifier': _id}
-        super(DBSnapshot_Resource, self).__init__(_id, _data)
-        self._describe_tags_params = {'ResourceName': self.arn}
+    @property
+    def _terminate_params(self):
+        return {'DBSnapshotIdentifier': self._id}
+
+    @property
+    def _describe_tags_params(self):
+        return {'ResourceName': self.arn}
 
     def _get_tag_obj_from_api_response(self, obj):
         return obj['TagList']
 
 
 class Lambda_Resource(Resource):
+    __slots__ = ()
     _type = 'lambda'
     _terminate_func = 'delete_function'
     _describe_tags_func = 'list_tags'
+    _tagging_resource_type = 'lambda:function'
+    _compact_fields = ('LastModified',)
 
-    def __init__(self, _id, _data=None):
-        self._terminate_params = {'FunctionName': _id}
-        super(Lambda_Resource, self).__init__(_id, _data)
-        self._describe_tags_params = {'Resource': self.arn}
+    @property
+    def _terminate_params(self):
+        return {'FunctionName': self._id}
+
+    @property
+    def _describe_tags_params(self):
+        return {'Resource': self.arn}
 
     @property
     def arn(self):
-        return arn.lambda_function(self._id)
+        return arn.lambda_function(self._id, region=self._region,
+                                   account_id=self._account)
 
     @property
     def name(self):
@@ -698,22 +1056,25 @@ class Lambda_Resource(Resource):
     @property
     def tags(self):
         if self._tags is None:
-            describe_tags_func = getattr(getattr(clients, self._type), self._describe_tags_func)
+            describe_tags_func = getattr(self._client(), self._describe_tags_func)
             self._tags = describe_tags_func(**self._describe_tags_params)['Tags']
         return self._tags
 
     @property
     def created_time(self):
+        import dateutil.parser
         return dateutil.parser.parse(self._data['LastModified'])
 
 
 class CloudFormation_Resource(Resource):
+    __slots__ = ()
     _type = 'cloudformation'
     _terminate_func = 'delete_stack'
+    _compact_fields = ('CreationTime',)
 
-    def __init__(self, _id, _data=None):
-        super(CloudFormation_Resource, self).__init__(_id, _data)
-        self._terminate_params = {'StackName': self._id}
+    @property
+    def _terminate_params(self):
+        return {'StackName': self._id}
 
     @property
     def name(self):
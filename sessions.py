@@ -0,0 +1,136 @@
+# -*- coding: utf8 -*-
+""" Pool of boto3 sessions for other AWS accounts, reached by assuming an IAM role in them.
+
+    Each role is assumed once per (account, role) and its temporary credentials are shared by the
+    sessions of every region. A background thread refreshes the credentials before they expire,
+    so long-running sweeps never stop on an expired token and calls never wait on STS. """
+
+import boto3
+import botocore.session
+import logging
+import threading
+import time
+from botocore.credentials import CredentialProvider, CredentialResolver, RefreshableCredentials
+
+logger = logging.getLogger(__name__)
+
+# Role assumed in the target accounts when none is given. This is the role created by AWS
+# Organizations in member accounts.
+DEFAULT_ROLE = 'OrganizationAccountAccessRole'
+
+# Lifetime requested for the temporary credentials, in seconds
+CREDENTIALS_DURATION = 3600
+
+# How often the background thread checks the credentials. botocore refreshes credentials which
+# are due to expire in the next 15 minutes whenever they are read.
+REFRESH_INTERVAL = 60
+
+ROLE_ARN_FORMAT = 'arn:aws:iam::%s:role/%s'
+
+
+class _PoolCredentialProvider(CredentialProvider):
+    """ Credential provider of the sessions of an assumed role, giving them the credentials
+        shared by all its sessions """
+    METHOD = 'sts-assume-role'
+    CANONICAL_NAME = 'awsutils-session-pool'
+
+    def __init__(self, credentials):
+        super(_PoolCredentialProvider, self).__init__()
+        self._credentials = credentials
+
+    def load(self):
+        return self._credentials
+
+
+class SessionPool(object):
+
+    def __init__(self, session_name='awsutils'):
+        self.session_name = session_name
+        self._credentials = {}
+        self._key_locks = {}
+        self._sessions = {}
+        self._lock = threading.Lock()
+        self._refresher = None
+
+    def _assume_role(self, account, role):
+        role_arn = ROLE_ARN_FORMAT % (account, role)
+
+        def refresh():
+            logger.info('Assuming role %s', role_arn)
+            # The shared client of the default session, looked up on every refresh so that
+            # clients replaced by boto3_clients.configure are not kept
+            import boto3_clients as clients
+            credentials = clients.sts.assume_role(
+                RoleArn=role_arn,
+                RoleSessionName='%s-%s' % (self.session_name, account),
+                DurationSeconds=CREDENTIALS_DURATION
+            )['Credentials']
+            return {
+                'access_key': credentials['AccessKeyId'],
+                'secret_key': credentials['SecretAccessKey'],
+                'token': credentials['SessionToken'],
+                'expiry_time': credentials['Expiration'].isoformat()
+            }
+
+        return RefreshableCredentials.create_from_metadata(
+            metadata=refresh(), refresh_using=refresh, method='sts-assume-role')
+
+    def credentials(self, account, role=None):
+        """ Returns the (self-refreshing) credentials for a role in an account, assuming the role
+            the first time it is requested """
+        key = (account, role or DEFAULT_ROLE)
+        with self._lock:
+            key_lock = self._key_locks.setdefault(key, threading.Lock())
+        # Roles in different accounts are assumed concurrently, each one only once
+        with key_lock:
+            credentials = self._credentials.get(key)
+            if credentials is None:
+                credentials = self._assume_role(*key)
+                with self._lock:
+                    self._credentials[key] = credentials
+                    self._start_refresher()
+        return credentials
+
+    def session(self, account=None, role=None, region=None, profile=None):
+        """ Returns the shared session for a role in an account (or for a local profile), in the
+            given region """
+        key = (account, role or DEFAULT_ROLE, region, profile)
+        with self._lock:
+            session = self._sessions.get(key)
+        if session is not None:
+            return session
+
+        if account is not None:
+            credentials = self.credentials(account, role)
+            botocore_session = botocore.session.get_session()
+            botocore_session.register_component(
+                'credential_provider', CredentialResolver([_PoolCredentialProvider(credentials)]))
+            session = boto3.Session(botocore_session=botocore_session, region_name=region)
+        else:
+            session = boto3.Session(profile_name=profile, region_name=region)
+
+        with self._lock:
+            return self._sessions.setdefault(key, session)
+
+    def _start_refresher(self):
+        if self._refresher is None:
+            self._refresher = threading.Thread(target=self._refresh_loop, name='credentials-refresh')
+            self._refresher.daemon = True
+            self._refresher.start()
+
+    def _refresh_loop(self):
+        while True:
+            time.sleep(REFRESH_INTERVAL)
+            with self._lock:
+                credentials = self._credentials.items()
+            for (account, role), creds in credentials:
+                try:
+                    # Reading the credentials refreshes them if they are close to expiring
+                    creds.get_frozen_credentials()
+                except Exception:
+                    logger.exception('Failed to refresh credentials for role %s in account %s',
+                                     role, account)
+
+
+# Shared pool, used by boto3_clients
+pool = SessionPool()
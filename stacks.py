@@ -21,17 +21,16 @@ bucket = '< ENTER TARGET S3 BUCKET FOR TEMPLATES HERE>'
 
 class Stack (object):
 
-    def __init__(self, name, bucket=bucket,template_file=''):
+    def __init__(self, name, bucket=bucket,template_file='', data=None):
+        """ data is the description of the stack, if already known. Otherwise it is requested """
         self.id = self.name = name
         self.template = template_file
-        self._exists = True
         self.bucket = bucket
-        try:
-            self.tags = { t['Key']: t['Value'] for t in self.data.get('Tags', []) }
-            self.params = { p['ParameterKey']: p['ParameterValue'] for p in self.data.get('Parameters', []) }
-        except botocore.exceptions.ClientError as ce:
-            if ce.response['Error']['Code'] == 'ValidationError':
-                self._exists = False
+        if data is None:
+            data = self.data
+        self._exists = bool(data)
+        self.tags = { t['Key']: t['Value'] for t in data.get('Tags', []) }
+        self.params = { p['ParameterKey']: p['ParameterValue'] for p in data.get('Parameters', []) }
 
     @property
     def data(self):
@@ -157,3 +156,14 @@ class Stack (object):
             print 'Current Stack status: ', self.status
             print 'No Waiter for this status'
 
+
+def get_many(names, bucket=bucket):
+    """ Returns the Stack objects for the given stack names, describing all stacks once instead of
+        once per name. Also returns the names of the stacks not found """
+    names = list(names)
+    found = {}
+    for page in clients.cloudformation.get_paginator('describe_stacks').paginate():
+        for stack in page['Stacks']:
+            found[stack['StackName']] = stack
+    return ([Stack(name, bucket, data=found[name]) for name in names if name in found],
+            [name for name in names if name not in found])
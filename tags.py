@@ -0,0 +1,164 @@
+# -*- coding: utf8 -*-
+""" Bulk tag operations over many resources, of any type, region or account """
+
+import logging
+from botocore.exceptions import ClientError
+from . import boto3_clients as clients
+from . import cache
+from . import parallel
+from .resources import AutoScalingGroup_Resource, is_not_found
+
+logger = logging.getLogger(__name__)
+
+
+def prefetch(resources, max_workers=parallel.MAX_WORKERS):
+    """ Loads the tags of all the given resources which get them from a separate API call, using
+        the batch APIs of each service instead of one call per resource. Groups of resources of
+        different type, region or account are loaded concurrently. """
+    groups = {}
+    for resource in resources:
+        if resource._tags is None and hasattr(resource, '_describe_tags_func'):
+            key = (type(resource), resource._region, resource._account, resource._role)
+            groups.setdefault(key, []).append(resource)
+
+    def load(group):
+        type(group[0])._load_tags(group)
+
+    parallel.pmap(load, groups.values(), max_workers)
+    return resources
+
+
+# Tag writers. Each one tags (or untags, when keys are given instead of tags) a batch of resources
+# in a single call, and returns a dict of {resource: error message} for the resources which
+# failed. A writer raising an error fails the whole batch.
+
+def _write_ec2(client, resources, tags=None, keys=None):
+    ids = [resource._tag_id for resource in resources]
+    if tags is not None:
+        client.create_tags(Resources=ids, Tags=[{'Key': k, 'Value': v} for k, v in tags.items()])
+    else:
+        client.delete_tags(Resources=ids, Tags=[{'Key': k} for k in keys])
+    return {}
+
+
+def _write_elb(client, resources, tags=None, keys=None):
+    names = [resource._id for resource in resources]
+    if tags is not None:
+        client.add_tags(LoadBalancerNames=names,
+                        Tags=[{'Key': k, 'Value': v} for k, v in tags.items()])
+    else:
+        client.remove_tags(LoadBalancerNames=names, Tags=[{'Key': k} for k in keys])
+    return {}
+
+
+def _write_autoscaling(client, resources, tags=None, keys=None):
+    if tags is not None:
+        client.create_or_update_tags(Tags=[
+            {'ResourceId': resource._id, 'ResourceType': 'auto-scaling-group', 'Key': k,
+             'Value': v, 'PropagateAtLaunch': False}
+            for resource in resources for k, v in tags.items()])
+    else:
+        client.delete_tags(Tags=[
+            {'ResourceId': resource._id, 'ResourceType': 'auto-scaling-group', 'Key': k}
+            for resource in resources for k in keys])
+    return {}
+
+
+def _write_tagging(client, resources, tags=None, keys=None):
+    by_arn = dict((resource.arn, resource) for resource in resources)
+    if tags is not None:
+        response = client.tag_resources(ResourceARNList=list(by_arn), Tags=tags)
+    else:
+        response = client.untag_resources(ResourceARNList=list(by_arn), TagKeys=list(keys))
+    return dict((by_arn[arn], failure.get('ErrorMessage') or failure.get('ErrorCode'))
+                for arn, failure in response.get('FailedResourcesMap', {}).items())
+
+
+# Writer, client name and maximum number of resources per call of each API. Classic ELB takes
+# a list of load balancer names, but only accepts one
+_WRITERS = {
+    'ec2': (_write_ec2, 'ec2', 1000),
+    'elb': (_write_elb, 'elb', 1),
+    'autoscaling': (_write_autoscaling, 'autoscaling', 20),
+    'tagging': (_write_tagging, 'resourcegroupstaggingapi', 20),
+}
+
+
+def _writer(resource):
+    if resource._type in ('ec2', 'elb'):
+        return resource._type
+    if isinstance(resource, AutoScalingGroup_Resource):
+        return 'autoscaling'
+    if resource._tagging_resource_type is not None:
+        return 'tagging'
+    return None
+
+
+def _write(resources, tags=None, keys=None, max_workers=parallel.MAX_WORKERS):
+    failed = {}
+    groups = {}
+    for resource in resources:
+        writer = _writer(resource)
+        if writer is None:
+            failed[resource] = 'Tagging is not supported for %s resources' % resource.type
+        else:
+            key = (writer, resource._region, resource._account, resource._role)
+            groups.setdefault(key, []).append(resource)
+
+    batches = []
+    for (writer, region, account, role), group in groups.items():
+        write_fn, service, batch_size = _WRITERS[writer]
+        client = clients.client(service, region, account, role)
+        batches += [(write_fn, client, batch) for batch in parallel.chunks(group, batch_size)]
+
+    def write_batch(write_fn, client, resources):
+        try:
+            return write_fn(client, resources, tags, keys)
+        except ClientError as e:
+            if len(resources) == 1 or not is_not_found(e):
+                logger.error('Failed to update tags of %d resources: %s', len(resources), e)
+                return dict((resource, str(e)) for resource in resources)
+        # A single bad ID fails the whole call: the batch is split in halves, so only the bad
+        # resources fail
+        half = len(resources) // 2
+        batch_failed = write_batch(write_fn, client, resources[:half])
+        batch_failed.update(write_batch(write_fn, client, resources[half:]))
+        return batch_failed
+
+    def write(batch):
+        return write_batch(*batch)
+
+    for batch_failed in parallel.pmap(write, batches, max_workers):
+        failed.update(batch_failed)
+
+    # Drop the cached descriptions, which include tags for some resource types
+    if cache.default is not None:
+        for service, region, account, role in set(
+                (r._type, r._region, r._account, r._role) for r in resources):
+            cache.default.invalidate(service, region, account, role)
+
+    # Keep the tags already loaded in the resources up to date
+    for resource in resources:
+        if resource not in failed and resource._tags is not None:
+            if tags is not None:
+                resource._tags.update(tags)
+            else:
+                for k in keys:
+                    resource._tags.pop(k, None)
+    return failed
+
+
+def tag_many(resources, tags, max_workers=parallel.MAX_WORKERS):
+    """ Sets the given tags ({key: value}) on all the resources. Resources are grouped by service,
+        region and account and tagged with the largest batches each API allows, running the
+        batches concurrently.
+        Returns a dict of {resource: error message} with the resources which could not be
+        tagged. """
+    return _write(resources, tags=tags, max_workers=max_workers)
+
+
+def untag_many(resources, keys, max_workers=parallel.MAX_WORKERS):
+    """ Removes the tags with the given keys from all the resources, in batches like tag_many.
+        Returns a dict of {resource: error message} with the resources which could not be
+        untagged. """
+    return _write(resources, keys=keys, max_workers=max_workers)
@@ -0,0 +1,415 @@
+# -*- coding: utf8 -*-
+""" Teardown of whole environments, such as everything in a VPC or with some tags.
+
+    The resources are deleted in dependency order: AutoScaling groups before their launch
+    configurations, instances before their network interfaces and volumes, DB instances before
+    their Aurora cluster, mount targets before their file system, and everything using a security
+    group before the group. Instances of the AutoScaling groups torn down are left to the group,
+    and so are the network interfaces and volumes deleted along with their instance.
+
+    The plan is run in waves: every step in a wave only depends on steps of earlier waves, and
+    the steps of a wave run in parallel. AWS deletes many resources asynchronously, so steps
+    failing because something still depends on their resource (e.g. DependencyViolation on a
+    security group whose instances are still shutting down) are retried until it is gone.
+
+    Usage:
+        plan = Teardown.select(Query(tags={'env': 'dev'}))
+        print plan.format_plan()
+        plan.execute()
+        print plan.format_report()
+"""
+
+import copy
+import logging
+import time
+from botocore.exceptions import ClientError
+from . import apihelpers
+from . import parallel
+from . import reference
+from . import tags
+from .query import Query
+from .resources import EC2_Resource, RDS_Resource, RDSAurora_Resource, ELB_Resource, \
+    ELBv2_Resource, AutoScalingGroup_Resource, LaunchConfiguration_Resource, \
+    SecurityGroup_Resource, EBSVolume_Resource, ENI_Resource, EFS_Resource, is_not_found
+
+logger = logging.getLogger(__name__)
+
+# API classes whose resources are selected for teardown by default
+TEARDOWN_APIS = (
+    apihelpers.ASGAPI,
+    apihelpers.LaunchConfigurationAPI,
+    apihelpers.EC2API,
+    apihelpers.ENIAPI,
+    apihelpers.EBSVolumeAPI,
+    apihelpers.ELBAPI,
+    apihelpers.ELBv2API,
+    apihelpers.RDSAPI,
+    apihelpers.RDSAuroraAPI,
+    apihelpers.EFSAPI,
+    apihelpers.SecurityGroupAPI,
+)
+
+# API classes whose resources have no VPC of their own. When tearing down a VPC, they are
+# selected through the resources they use: AutoScaling groups through their subnets and
+# instances, launch configurations through the groups selected, volumes through the instances
+# they are attached to, and Aurora clusters through their DB instances and DB subnet group.
+# Volumes which are not attached to any instance are left out.
+VPC_RELATED_APIS = (
+    apihelpers.ASGAPI,
+    apihelpers.LaunchConfigurationAPI,
+    apihelpers.EBSVolumeAPI,
+    apihelpers.RDSAuroraAPI,
+)
+
+# Error codes returned while a resource is still used by others being deleted. Steps failing
+# with them are retried, with exponential backoff, until RETRY_TIMEOUT seconds after they started
+RETRY_ERRORS = ('DependencyViolation', 'InvalidNetworkInterface.InUse', 'VolumeInUse',
+                'InvalidDBClusterStateFault', 'InvalidDBInstanceState', 'FileSystemInUse',
+                'MountTargetConflict', 'ResourceInUse', 'ResourceInUseFault',
+                'ScalingActivityInProgress')
+RETRY_TIMEOUT = 1800
+RETRY_DELAY = 5
+MAX_RETRY_DELAY = 60
+
+# Tag set by AutoScaling on the instances of each group
+ASG_TAG = 'aws:autoscaling:groupName'
+
+
+class Step(object):
+    """ Deletion of a resource, or of a part of it (e.g. a mount target) """
+
+    def __init__(self, name, action, resource=None):
+        self.name = name
+        self.action = action
+        self.resource = resource
+        # Steps which must be done before this one
+        self.after = set()
+        self.wave = None
+        self.status = 'pending'
+        self.error = None
+        self.attempts = 0
+        self.seconds = 0.0
+
+    def __repr__(self):
+        return '<Step %s>' % self.name
+
+
+def _groups(resource):
+    """ IDs of the security groups used by a resource """
+    try:
+        groups = resource.groups
+    except (NotImplementedError, KeyError, TypeError):
+        return []
+    if groups is NotImplemented:
+        # Network interfaces only have them in their describe output
+        return [group['GroupId'] for group in (resource._data or {}).get('Groups', [])]
+    return groups
+
+
+def _waves(steps):
+    """ Splits the steps in waves, each one with the steps whose dependencies are all in earlier
+        waves """
+    pending = set(steps)
+    waves = []
+    while pending:
+        wave = [step for step in pending if not step.after & pending]
+        if not wave:
+            raise ValueError('Circular dependencies between %s' % sorted(s.name for s in pending))
+        wave.sort(key=lambda step: step.name)
+        for step in wave:
+            step.wave = len(waves)
+        waves.append(wave)
+        pending.difference_update(wave)
+    return waves
+
+
+def _location(resource):
+    return resource._region, resource._account, resource._role
+
+
+def _in_vpc(resources, vpc):
+    """ Keeps the resources of the types in VPC_RELATED_APIS which use resources in a VPC. The
+        other resources were selected in the VPC already, and launch configurations are left to
+        _with_launch_configurations """
+    instances = set((_location(r), r._id) for r in resources if isinstance(r, EC2_Resource))
+    db_instances = [r for r in resources if isinstance(r, RDS_Resource)]
+    db_clusters = set((_location(r), r._data.get('DBClusterIdentifier')) for r in db_instances)
+    # VPC of each DB subnet group, as described with the DB instances
+    subnet_groups = dict(((_location(r), r._data['DBSubnetGroup']['DBSubnetGroupName']),
+                          r._data['DBSubnetGroup']['VpcId']) for r in db_instances)
+
+    def asg_in_vpc(group):
+        location = _location(group)
+        subnets = [s for s in (group._data.get('VPCZoneIdentifier') or '').split(',') if s]
+        return any(reference.subnet_vpc(subnet, *location) == vpc for subnet in subnets) or \
+            any((location, i['InstanceId']) in instances for i in group._data.get('Instances', []))
+
+    def volume_in_vpc(volume):
+        return any((_location(volume), a['InstanceId']) in instances
+                   for a in volume._data.get('Attachments', []))
+
+    def cluster_in_vpc(cluster):
+        location = _location(cluster)
+        if (location, cluster._id) in db_clusters:
+            return True
+        name = cluster._data.get('DBSubnetGroup')
+        if not name:
+            return False
+        if (location, name) not in subnet_groups:
+            try:
+                described = cluster._client().describe_db_subnet_groups(DBSubnetGroupName=name)
+                subnet_groups[(location, name)] = described['DBSubnetGroups'][0]['VpcId']
+            except ClientError as e:
+                if not is_not_found(e):
+                    raise
+                subnet_groups[(location, name)] = None
+        return subnet_groups[(location, name)] == vpc
+
+    checks = {
+        AutoScalingGroup_Resource: asg_in_vpc,
+        EBSVolume_Resource: volume_in_vpc,
+        RDSAurora_Resource: cluster_in_vpc,
+        LaunchConfiguration_Resource: lambda config: True,
+    }
+    return [r for r in resources if checks.get(type(r), lambda r: True)(r)]
+
+
+def _with_launch_configurations(resources):
+    """ Keeps only the launch configurations used by the AutoScaling groups selected """
+    used = set((_location(r), r._data.get('LaunchConfigurationName')) for r in resources
+               if isinstance(r, AutoScalingGroup_Resource))
+    return [r for r in resources if not isinstance(r, LaunchConfiguration_Resource) or
+            (_location(r), r._id) in used]
+
+
+class Teardown(object):
+
+    def __init__(self, resources, max_workers=parallel.MAX_WORKERS, retry_timeout=RETRY_TIMEOUT):
+        """ Plans the deletion of the given resources """
+        self.resources = list(resources)
+        self.max_workers = max_workers
+        self.retry_timeout = retry_timeout
+        self.skipped = []
+        self.steps = self._plan()
+        self.waves = _waves(self.steps)
+
+    @classmethod
+    def select(cls, query=None, vpc=None, region=None, account=None, role=None, apis=TEARDOWN_APIS,
+               **kwargs):
+        """ Plans the deletion of all the resources matching a query (or in a VPC, as a shortcut).
+            The AutoScaling groups of the instances found are included, or they would replace
+            them. kwargs are passed on to Teardown """
+        if vpc is not None:
+            query = copy.copy(query) if query is not None else Query()
+            query.vpc = vpc
+        # The types in VPC_RELATED_APIS are selected with the rest of the query, then by VPC
+        related_query = None
+        if query is not None and query.vpc is not None:
+            related_query = copy.copy(query)
+            related_query.vpc = None
+        location = {'regions': [region] if region is not None else None,
+                    'accounts': [account] if account is not None else None, 'role': role}
+
+        def select_api(api):
+            if api is apihelpers.LaunchConfigurationAPI and related_query is not None:
+                # Launch configurations have no tags, they go with the groups using them
+                return api.get(**location)
+            if api in VPC_RELATED_APIS and related_query is not None:
+                return api.get(query=related_query, **location)
+            if api is not apihelpers.EFSAPI:
+                return api.get(query=query, **location)
+            # The VPC of a file system is the one of its mount targets, all loaded at once
+            file_systems = api.get(with_mount_targets=True, **location)
+            if query is None:
+                return file_systems
+            return query.compile({}).filter(file_systems, prefetch_tags=tags.prefetch)
+
+        resources = [resource for found in parallel.pmap(select_api, apis)
+                     for resource in found]
+        if related_query is not None:
+            resources = _in_vpc(resources, query.vpc)
+        groups = set(r._id for r in resources if isinstance(r, AutoScalingGroup_Resource))
+        missing = set(r.tags.get(ASG_TAG) for r in resources
+                      if isinstance(r, EC2_Resource)) - groups - set([None])
+        if missing:
+            found, _ = apihelpers.ASGAPI.get_many(sorted(missing), region, account, role)
+            resources += found
+        if related_query is not None:
+            resources = _with_launch_configurations(resources)
+        return cls(resources, **kwargs)
+
+    def _plan(self):
+        steps = []
+        # Step deleting each resource, by resource type and ID. Resources deleted along with
+        # another one (e.g. the instances of an AutoScaling group) map to the step of the other
+        by_key = {}
+
+        def add(name, action, resource=None):
+            step = Step(name, action, resource)
+            steps.append(step)
+            return step
+
+        def of_type(cls):
+            return [r for r in self.resources if type(r) is cls]
+
+        # AutoScaling groups delete their instances
+        for group in of_type(AutoScalingGroup_Resource):
+            step = add(str(group), group.terminate, group)
+            by_key[('asg', group._id)] = step
+            for instance in group._data.get('Instances', []):
+                by_key[('instance', instance['InstanceId'])] = step
+        for config in of_type(LaunchConfiguration_Resource):
+            step = add(str(config), config.terminate, config)
+            for group in of_type(AutoScalingGroup_Resource):
+                if group._data.get('LaunchConfigurationName') == config._id:
+                    step.after.add(by_key[('asg', group._id)])
+        for instance in of_type(EC2_Resource):
+            instance_key = ('instance', instance._id)
+            owner = instance.tags.get(ASG_TAG)
+            if instance_key not in by_key and ('asg', owner) in by_key:
+                by_key[instance_key] = by_key[('asg', owner)]
+            if instance_key not in by_key:
+                # Instances are moved to the default security group only to free their groups,
+                # which they do anyway once terminated
+                by_key[instance_key] = add(str(instance),
+                                           lambda i=instance: i.terminate(clear_sg=False), instance)
+
+        # Network interfaces and volumes go after their instance, or with it
+        for eni in of_type(ENI_Resource):
+            attachment = eni._data.get('Attachment') or {}
+            instance_step = by_key.get(('instance', attachment.get('InstanceId')))
+            if eni._data.get('RequesterManaged') or \
+                    (instance_step is not None and attachment.get('DeleteOnTermination')):
+                # Interfaces of other services (load balancers, databases, mount targets...) are
+                # deleted along with their owner
+                by_key[('eni', eni._id)] = instance_step
+                if instance_step is None:
+                    self.skipped.append(eni)
+                continue
+            step = by_key[('eni', eni._id)] = add(str(eni), eni.terminate, eni)
+            if instance_step is not None:
+                step.after.add(instance_step)
+        for volume in of_type(EBSVolume_Resource):
+            attachments = volume._data.get('Attachments', [])
+            instance_steps = [by_key.get(('instance', a['InstanceId'])) for a in attachments]
+            if attachments and all(s is not None for s in instance_steps) and \
+                    all(a.get('DeleteOnTermination') for a in attachments):
+                continue
+            step = add(str(volume), volume.terminate, volume)
+            step.after.update(s for s in instance_steps if s is not None)
+
+        for load_balancer in of_type(ELB_Resource) + of_type(ELBv2_Resource):
+            by_key[('elb', load_balancer._id)] = add(str(load_balancer),
+                                                        load_balancer.terminate, load_balancer)
+        db_instances = of_type(RDS_Resource)
+        for db_instance in db_instances:
+            by_key[('rds', db_instance._id)] = add(str(db_instance), db_instance.terminate,
+                                                      db_instance)
+        # Clusters go after their instances
+        for cluster in of_type(RDSAurora_Resource):
+            step = add(str(cluster), cluster.terminate, cluster)
+            for db_instance in db_instances:
+                if db_instance._data.get('DBClusterIdentifier') == cluster._id:
+                    step.after.add(by_key[('rds', db_instance._id)])
+
+        # File systems go after their mount targets, which are deleted in parallel
+        target_groups = []
+        for fs in of_type(EFS_Resource):
+            step = add(str(fs), lambda fs=fs: fs.terminate(wait=True), fs)
+            for target in fs.mount_targets:
+                target_step = add('[efs-mount-target]:%s' % target['MountTargetId'],
+                                  lambda fs=fs, target=target: fs.delete_mount_target(target))
+                step.after.add(target_step)
+                target_groups.append((target_step,
+                                      fs.security_groups.get(target['MountTargetId'], [])))
+
+        # Security groups go after everything using them
+        # (file systems use them through their mount targets)
+        users = target_groups + [(step, _groups(step.resource)) for step in steps
+                                 if step.resource is not None and
+                                 not isinstance(step.resource, EFS_Resource)]
+        for resource in self.resources:
+            # Resources deleted along with another one use its step
+            owner = by_key.get(('instance', resource._id)) or \
+                by_key.get(('eni', resource._id))
+            if owner is not None and owner.resource is not resource:
+                users.append((owner, _groups(resource)))
+        for group in of_type(SecurityGroup_Resource):
+            if group.isdefault:
+                # Default groups are deleted along with their VPC
+                self.skipped.append(group)
+                continue
+            step = add(str(group), lambda g=group: g.terminate(raise_errors=True), group)
+            step.after.update(user for user, groups in users if group._id in groups)
+
+        for step in steps:
+            step.after.discard(None)
+        return steps
+
+    def _run(self, step):
+        started = time.time()
+        delay = RETRY_DELAY
+        while True:
+            step.attempts += 1
+            try:
+                step.action()
+                step.status = 'done'
+                break
+            except ClientError as e:
+                code = e.response['Error']['Code']
+                if is_not_found(e):
+                    # Deleted meanwhile, by its owner or by someone else
+                    step.status = 'done'
+                    break
+                if code in RETRY_ERRORS and time.time() + delay - started < self.retry_timeout:
+                    logger.info('%s: %s, retrying in %ds', step.name, code, delay)
+                    time.sleep(delay)
+                    delay = min(delay * 2, MAX_RETRY_DELAY)
+                    continue
+                logger.error('Failed to delete %s: %s', step.name, e)
+                step.status = 'failed'
+                step.error = str(e)
+                break
+            except Exception as e:
+                logger.exception('Failed to delete %s', step.name)
+                step.status = 'failed'
+                step.error = str(e)
+                break
+        step.seconds = time.time() - started
+
+    def execute(self):
+        """ Runs the plan, wave after wave. Steps which depend on a failed step are skipped.
+            Returns True if all steps were done """
+        for wave in self.waves:
+            runnable = []
+            for step in wave:
+                if all(dependency.status == 'done' for dependency in step.after):
+                    runnable.append(step)
+                else:
+                    step.status = 'skipped'
+            logger.info('Wave %d: deleting %d resources', wave[0].wave, len(runnable))
+            parallel.pmap(self._run, runnable, self.max_workers)
+        return all(step.status == 'done' for step in self.steps)
+
+    def results(self):
+        return [{'name': step.name, 'wave': step.wave, 'status': step.status,
+                 'attempts': step.attempts, 'seconds': step.seconds, 'error': step.error}
+                for wave in self.waves for step in wave]
+
+    def format_plan(self):
+        lines = []
+        for i, wave in enumerate(self.waves):
+            lines.append('Wave %d:' % i)
+            lines.extend('  %s' % step.name for step in wave)
+        if self.skipped:
+            lines.append('Left to AWS: %s' % ', '.join(str(r) for r in self.skipped))
+        return '\n'.join(lines)
+
+    def format_report(self):
+        lines = ['%-4s %-60s %-8s %8s %8s  %s' % ('wave', 'step', 'status', 'attempts', 'seconds',
+                                                  'error')]
+        for result in self.results():
+            lines.append('%-4d %-60s %-8s %8d %8.1f  %s' % (
+                result['wave'], result['name'], result['status'], result['attempts'],
+                result['seconds'], result['error'] or ''))
+        return '\n'.join(lines)
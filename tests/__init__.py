@@ -0,0 +1,58 @@
+# -*- coding: utf8 -*-
+""" Tests of the library. They run offline: every AWS call is answered by a botocore Stubber.
+
+    Run them from the directory containing the package:
+        python -m unittest discover -s awsutils/tests -t .
+"""
+
+import logging
+import os
+import unittest
+from botocore.credentials import Credentials
+from botocore.stub import Stubber
+from .. import boto3_clients as clients
+from .. import reference
+from .. import sessions
+
+# Clients need a region and credentials to build requests, even if none is ever sent
+os.environ.setdefault('AWS_DEFAULT_REGION', 'us-east-1')
+os.environ.setdefault('AWS_ACCESS_KEY_ID', 'testing')
+os.environ.setdefault('AWS_SECRET_ACCESS_KEY', 'testing')
+
+# Errors logged by the code under test are expected, they are checked through its results
+logging.getLogger(__name__.rpartition('.')[0]).addHandler(logging.NullHandler())
+
+ACCOUNT = '123456789012'
+REGION = 'us-east-1'
+# Account reached by assuming a role in it
+OTHER_ACCOUNT = '210987654321'
+
+
+class StubbedTestCase(unittest.TestCase):
+    """ Test case whose AWS calls are answered by the Stubbers created with stub() """
+
+    def setUp(self):
+        # Known beforehand, so they are never asked to STS and EC2
+        clients.account_id = ACCOUNT
+        clients.region = REGION
+        reference.clear()
+        self._stubbers = []
+
+    def tearDown(self):
+        for stubber in self._stubbers:
+            stubber.deactivate()
+
+    def stub(self, service, region=REGION, account=None):
+        """ Returns an active Stubber for the shared client of a service. Clients of other
+            accounts get fixed credentials, instead of assuming a role through STS """
+        if account is not None:
+            sessions.pool._credentials.setdefault((account, sessions.DEFAULT_ROLE),
+                                                  Credentials('testing', 'testing'))
+        stubber = Stubber(clients.client(service, region, account))
+        stubber.activate()
+        self._stubbers.append(stubber)
+        return stubber
+
+    def assertStubsUsed(self):
+        for stubber in self._stubbers:
+            stubber.assert_no_pending_responses()
@@ -0,0 +1,119 @@
+# -*- coding: utf8 -*-
+import unittest
+from botocore.exceptions import ClientError
+from . import StubbedTestCase, REGION
+from .. import actions
+from ..resources import EC2_Resource, SecurityGroup_Resource, Snapshot_Resource
+
+
+def error(code, message=''):
+    return ClientError({'Error': {'Code': code, 'Message': message}}, 'Operation')
+
+
+def instances(count):
+    return [EC2_Resource('i-%d' % i, {}, REGION) for i in range(count)]
+
+
+def state_changes(ids, state='stopping'):
+    return [{'InstanceId': i, 'CurrentState': {'Name': state, 'Code': 64},
+             'PreviousState': {'Name': 'running', 'Code': 16}} for i in ids]
+
+
+class RunBatchTest(unittest.TestCase):
+
+    def setUp(self):
+        self.calls = []
+
+    def act(self, failing=(), code='InvalidInstanceID.NotFound'):
+        def act(client, resources, DryRun):
+            self.calls.append([r._id for r in resources])
+            if any(r._id in failing for r in resources):
+                raise error(code)
+            return dict((r, actions.Result(r, 'done', 'stopping')) for r in resources)
+        return act
+
+    def test_done(self):
+        resources = instances(3)
+        results = actions._run_batch(self.act(), None, resources, False)
+        self.assertEqual([results[r].status for r in resources], ['done'] * 3)
+        self.assertEqual(len(self.calls), 1)
+
+    def test_dry_run(self):
+        resources = instances(3)
+        results = actions._run_batch(self.act(['i-0'], 'DryRunOperation'), None, resources, True)
+        self.assertEqual([results[r].status for r in resources], ['dry-run'] * 3)
+
+    def test_failing_batches_are_split(self):
+        resources = instances(4)
+        results = actions._run_batch(self.act(['i-2']), None, resources, False)
+        self.assertEqual([results[r].status for r in resources],
+                         ['done', 'done', 'not-found', 'done'])
+        self.assertEqual(self.calls, [['i-0', 'i-1', 'i-2', 'i-3'], ['i-0', 'i-1'],
+                                      ['i-2', 'i-3'], ['i-2'], ['i-3']])
+
+    def test_other_errors(self):
+        resources = instances(2)
+        results = actions._run_batch(self.act(['i-1'], 'IncorrectInstanceState'), None,
+                                     resources, False)
+        self.assertEqual([results[r].status for r in resources], ['done', 'failed'])
+
+    def test_permission_errors_are_not_split(self):
+        resources = instances(4)
+        results = actions._run_batch(self.act(['i-0'], 'UnauthorizedOperation'), None,
+                                     resources, False)
+        self.assertEqual([results[r].status for r in resources], ['failed'] * 4)
+        self.assertEqual(len(self.calls), 1)
+
+
+class RunTest(StubbedTestCase):
+
+    def test_results_in_order(self):
+        resources = instances(2)
+        snapshot = Snapshot_Resource('snap-1', {}, REGION)
+        ec2 = self.stub('ec2')
+        ec2.add_response('stop_instances', {'StoppingInstances': state_changes(['i-1', 'i-0'])},
+                         {'InstanceIds': ['i-1', 'i-0'], 'DryRun': False})
+        results = actions.run([resources[1], snapshot, resources[0]], 'stop', max_workers=1)
+        self.assertEqual([(r.resource, r.status, r.detail) for r in results], [
+            (resources[1], 'done', 'stopping'),
+            (snapshot, 'unsupported', 'shutdown is not supported for ec2 resources'),
+            (resources[0], 'done', 'stopping')])
+        self.assertStubsUsed()
+
+    def test_dry_run_checks_termination_protection(self):
+        instance = instances(1)[0]
+        ec2 = self.stub('ec2')
+        ec2.add_client_error('terminate_instances', 'OperationNotPermitted',
+                             'The instance i-0 may not be terminated',
+                             expected_params={'InstanceIds': ['i-0'], 'DryRun': True})
+        ec2.add_client_error('modify_instance_attribute', 'DryRunOperation', expected_params={
+            'InstanceId': 'i-0', 'DisableApiTermination': {'Value': False}, 'DryRun': True})
+        self.assertEqual(actions.terminate_many([instance], DryRun=True)[0].status, 'dry-run')
+        self.assertStubsUsed()
+
+    def test_termination_protection_is_cleared(self):
+        resources = instances(2)
+        ec2 = self.stub('ec2')
+        ec2.add_client_error('terminate_instances', 'OperationNotPermitted',
+                             'The instance i-1 may not be terminated',
+                             expected_params={'InstanceIds': ['i-0', 'i-1'], 'DryRun': False})
+        ec2.add_response('modify_instance_attribute', {}, {
+            'InstanceId': 'i-1', 'DisableApiTermination': {'Value': False}, 'DryRun': False})
+        ec2.add_response('terminate_instances', {
+            'TerminatingInstances': state_changes(['i-0', 'i-1'], 'shutting-down')},
+            {'InstanceIds': ['i-0', 'i-1'], 'DryRun': False})
+        results = actions.terminate_many(resources)
+        self.assertEqual([r.detail for r in results], ['shutting-down'] * 2)
+        self.assertStubsUsed()
+
+    def test_resource_method_errors(self):
+        group = SecurityGroup_Resource('sg-1', {'GroupName': 'web', 'VpcId': 'vpc-1'}, REGION)
+        ec2 = self.stub('ec2')
+        ec2.add_client_error('delete_security_group', 'DependencyViolation',
+                             expected_params={'GroupId': 'sg-1'})
+        self.assertEqual(actions.terminate_many([group])[0].status, 'failed')
+
+    def test_dry_run_without_api_support(self):
+        group = SecurityGroup_Resource('sg-1', {'GroupName': 'web', 'VpcId': 'vpc-1'}, REGION)
+        self.stub('ec2')
+        self.assertEqual(actions.terminate_many([group], DryRun=True)[0].status, 'dry-run')
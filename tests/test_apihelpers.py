@@ -0,0 +1,97 @@
+# -*- coding: utf8 -*-
+import datetime
+from botocore.exceptions import ClientError
+from . import StubbedTestCase, REGION
+from .. import boto3_clients as clients
+from ..apihelpers import ASGAPI, EC2API, S3API, SnapshotAPI
+from ..query import Query
+
+
+def reservations(*ids):
+    return {'Reservations': [{'Instances': [{'InstanceId': i, 'VpcId': 'vpc-1'} for i in ids]}]}
+
+
+def group(name, tags):
+    return {'AutoScalingGroupName': name, 'MinSize': 0, 'MaxSize': 1, 'DesiredCapacity': 0,
+            'DefaultCooldown': 300, 'AvailabilityZones': ['us-east-1a'], 'HealthCheckType': 'EC2',
+            'CreatedTime': datetime.datetime(2020, 1, 1),
+            'Tags': [{'Key': k, 'Value': v} for k, v in tags.items()]}
+
+
+class GetManyTest(StubbedTestCase):
+
+    def test_chunks_failing_on_missing_ids_are_split(self):
+        ec2 = self.stub('ec2')
+        ec2.add_client_error('describe_instances', 'InvalidInstanceID.NotFound',
+                             expected_params={'InstanceIds': ['i-1', 'i-2', 'i-3']})
+        ec2.add_response('describe_instances', reservations('i-1'), {'InstanceIds': ['i-1']})
+        ec2.add_client_error('describe_instances', 'InvalidInstanceID.NotFound',
+                             expected_params={'InstanceIds': ['i-2', 'i-3']})
+        ec2.add_client_error('describe_instances', 'InvalidInstanceID.NotFound',
+                             expected_params={'InstanceIds': ['i-2']})
+        ec2.add_response('describe_instances', reservations('i-3'), {'InstanceIds': ['i-3']})
+
+        found, missing = EC2API.get_many(['i-1', 'i-2', 'i-3', 'i-1'], region=REGION)
+        self.assertEqual([r._id for r in found], ['i-1', 'i-3'])
+        self.assertEqual(missing, ['i-2'])
+        self.assertEqual(found[0]._region, REGION)
+        self.assertStubsUsed()
+
+    def test_other_errors_are_raised(self):
+        ec2 = self.stub('ec2')
+        ec2.add_client_error('describe_instances', 'UnauthorizedOperation',
+                             expected_params={'InstanceIds': ['i-1', 'i-2']})
+        with self.assertRaises(ClientError):
+            EC2API.get_many(['i-1', 'i-2'], region=REGION)
+
+
+class GetTest(StubbedTestCase):
+
+    def test_query_is_sent_as_native_filters(self):
+        ec2 = self.stub('ec2')
+        ec2.add_response('describe_instances', reservations('i-1'), {
+            'Filters': [{'Name': 'vpc-id', 'Values': ['vpc-1']}], 'MaxResults': 1000})
+        found = EC2API.get(regions=[REGION], query=Query(vpc='vpc-1'))
+        self.assertEqual([r._id for r in found], ['i-1'])
+        self.assertStubsUsed()
+
+
+    def test_apis_without_filters_check_the_query_themselves(self):
+        autoscaling = self.stub('autoscaling')
+        autoscaling.add_response('describe_auto_scaling_groups', {'AutoScalingGroups': [
+            group('dev', {'env': 'dev'}), group('prod', {'env': 'prod'})]}, {'MaxRecords': 100})
+        found = ASGAPI.get(regions=[REGION], query=Query(tags={'env': 'dev'}))
+        self.assertEqual([r._id for r in found], ['dev'])
+        self.assertStubsUsed()
+
+
+class PaginateTest(StubbedTestCase):
+
+    def test_every_page_is_read_at_the_largest_size(self):
+        ec2 = self.stub('ec2')
+        ec2.add_response('describe_snapshots', {'Snapshots': [{'SnapshotId': 'snap-1'}],
+                                                'NextToken': 'page-2'}, {'MaxResults': 1000})
+        ec2.add_response('describe_snapshots', {'Snapshots': [{'SnapshotId': 'snap-2'}]},
+                         {'MaxResults': 1000, 'NextToken': 'page-2'})
+        self.assertEqual([r._id for r in SnapshotAPI.get(regions=[REGION])], ['snap-1', 'snap-2'])
+        self.assertStubsUsed()
+
+    def test_errors_are_raised(self):
+        ec2 = self.stub('ec2')
+        ec2.add_client_error('describe_snapshots', 'UnauthorizedOperation',
+                             expected_params={'MaxResults': 1000})
+        with self.assertRaises(ClientError):
+            list(SnapshotAPI._paginate(clients.client('ec2', REGION), {}))
+
+
+class S3Test(StubbedTestCase):
+
+    def test_buckets_are_listed_once_per_account(self):
+        s3 = self.stub('s3', region=None)
+        s3.add_response('list_buckets', {'Buckets': [{'Name': 'a'}, {'Name': 'b'}, {'Name': 'c'}]})
+        for name, location in (('a', {}), ('b', {'LocationConstraint': 'EU'}),
+                               ('c', {'LocationConstraint': 'ap-south-1'})):
+            s3.add_response('get_bucket_location', location, {'Bucket': name})
+        buckets = S3API.get(regions=[REGION, 'eu-west-1'], max_workers=1)
+        self.assertEqual([(b._id, b._region) for b in buckets], [('a', REGION), ('b', 'eu-west-1')])
+        self.assertStubsUsed()
@@ -0,0 +1,68 @@
+# -*- coding: utf8 -*-
+import os
+import shutil
+import sqlite3
+import tempfile
+from contextlib import closing
+from . import StubbedTestCase, REGION
+from .. import cache
+from ..apihelpers import EC2API, RDSAPI
+from ..resources import EC2_Resource
+
+PAGES = [{'Reservations': []}]
+
+
+class InventoryCacheTest(StubbedTestCase):
+
+    def setUp(self):
+        super(InventoryCacheTest, self).setUp()
+        self.directory = tempfile.mkdtemp()
+        self.cache = cache.InventoryCache(os.path.join(self.directory, 'cache.sqlite'),
+                                          ttls={'EC2API': 60})
+
+    def tearDown(self):
+        cache.disable()
+        shutil.rmtree(self.directory)
+        super(InventoryCacheTest, self).tearDown()
+
+    def age(self, seconds):
+        with closing(sqlite3.connect(self.cache.path)) as connection:
+            with connection:
+                connection.execute('UPDATE pages SET created = created - ?', (seconds,))
+
+    def test_pages_expire_after_their_ttl(self):
+        self.cache.put(EC2API, {}, PAGES, region=REGION)
+        self.assertEqual(self.cache.get(EC2API, {}, region=REGION), PAGES)
+        self.assertIsNone(self.cache.get(EC2API, {'MaxResults': 5}, region=REGION))
+        self.age(59)
+        self.assertEqual(self.cache.get(EC2API, {}, region=REGION), PAGES)
+        self.age(2)
+        self.assertIsNone(self.cache.get(EC2API, {}, region=REGION))
+
+    def test_default_ttls(self):
+        self.assertEqual(self.cache.ttls['EC2API'], 60)
+        self.assertEqual(self.cache.ttls['SnapshotAPI'], cache.TTLS['SnapshotAPI'])
+
+    def test_invalidate_service(self):
+        self.cache.put(EC2API, {}, PAGES, region=REGION)
+        self.cache.put(RDSAPI, {}, PAGES, region=REGION)
+        self.cache.put(EC2API, {}, PAGES, region='eu-west-1')
+        self.cache.invalidate('ec2', REGION)
+        self.assertIsNone(self.cache.get(EC2API, {}, region=REGION))
+        self.assertEqual(self.cache.get(RDSAPI, {}, region=REGION), PAGES)
+        self.assertEqual(self.cache.get(EC2API, {}, region='eu-west-1'), PAGES)
+
+    def test_invalidate_resource(self):
+        cache.default = self.cache
+        self.cache.put(EC2API, {}, PAGES, region=REGION)
+        cache.invalidate_resource(EC2_Resource('i-1', {}, REGION))
+        self.assertIsNone(self.cache.get(EC2API, {}, region=REGION))
+
+    def test_get_reads_the_cache(self):
+        cache.default = self.cache
+        ec2 = self.stub('ec2')
+        ec2.add_response('describe_instances', {'Reservations': [
+            {'Instances': [{'InstanceId': 'i-1'}]}]}, {'MaxResults': 1000})
+        for _ in range(2):
+            self.assertEqual([r._id for r in EC2API.get(regions=[REGION])], ['i-1'])
+        self.assertStubsUsed()
@@ -0,0 +1,66 @@
+# -*- coding: utf8 -*-
+import os
+import shutil
+import tempfile
+from . import StubbedTestCase, ACCOUNT, REGION
+from .. import delta
+from ..resources import EC2_Resource, RDS_Resource
+
+
+def instance(instance_id, state='running', tags=None):
+    return EC2_Resource(instance_id, {'InstanceId': instance_id, 'State': {'Name': state},
+                                      'Tags': [{'Key': k, 'Value': v}
+                                               for k, v in (tags or {}).items()]}, REGION)
+
+
+class FingerprintTest(StubbedTestCase):
+
+    def test_tags_loaded_separately_are_left_out(self):
+        loaded = RDS_Resource('db1', {'DBInstanceIdentifier': 'db1'}, region=REGION)
+        loaded._tags = {'env': 'dev'}
+        not_loaded = RDS_Resource('db1', {'DBInstanceIdentifier': 'db1'}, region=REGION)
+        self.assertEqual(delta.fingerprint(loaded), delta.fingerprint(not_loaded))
+        self.assertIsNone(not_loaded._tags)
+
+    def test_tags_of_the_describe_output(self):
+        tagged = instance('i-1', tags={'env': 'dev'})
+        self.assertNotEqual(delta.fingerprint(tagged), delta.fingerprint(instance('i-1')))
+        fingerprint = delta.fingerprint(tagged)
+        tagged.tags
+        self.assertEqual(delta.fingerprint(tagged), fingerprint)
+
+    def test_key(self):
+        self.assertEqual(delta.key(instance('i-1')), 'ec2|%s|%s|i-1' % (ACCOUNT, REGION))
+
+
+class SnapshotTest(StubbedTestCase):
+
+    def setUp(self):
+        super(SnapshotTest, self).setUp()
+        self.old = delta.InventorySnapshot.take([instance('i-1'), instance('i-2'),
+                                                 instance('i-3')])
+
+    def test_changes(self):
+        resources = [instance('i-1'), instance('i-2', state='stopped'), instance('i-4')]
+        new = delta.InventorySnapshot()
+        found = [(change.kind, change.key.rpartition('|')[2], change.resource)
+                 for change in delta.changes(self.old, iter(resources), new)]
+        self.assertEqual(found, [('changed', 'i-2', resources[1]), ('created', 'i-4', resources[2]),
+                                 ('deleted', 'i-3', None)])
+        self.assertEqual(len(new), 3)
+        self.assertEqual(sorted((c.kind, c.key.rpartition('|')[2]) for c in self.old.diff(new)),
+                         [('changed', 'i-2'), ('created', 'i-4'), ('deleted', 'i-3')])
+
+    def test_save_and_load(self):
+        directory = tempfile.mkdtemp()
+        try:
+            path = os.path.join(directory, 'ec2.snapshot')
+            self.old.save(path)
+            loaded = delta.InventorySnapshot.load(path)
+        finally:
+            shutil.rmtree(directory)
+        self.assertEqual(loaded.fingerprints, self.old.fingerprints)
+        self.assertEqual(loaded.taken, self.old.taken)
+        self.assertIn(delta.key(instance('i-1')), loaded)
+        self.assertEqual(list(delta.changes(loaded, [instance('i-1'), instance('i-2'),
+                                                     instance('i-3')])), [])
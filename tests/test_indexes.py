@@ -0,0 +1,165 @@
+# -*- coding: utf8 -*-
+import datetime
+import threading
+import time
+from botocore.stub import ANY
+from . import StubbedTestCase, REGION
+from .. import indexes
+from ..resources import LaunchConfiguration_Resource, SecurityGroup_Resource
+
+DATE = datetime.datetime(2020, 1, 1)
+
+
+class IndexTest(StubbedTestCase):
+
+    def setUp(self):
+        super(IndexTest, self).setUp()
+        self.loads = []
+
+    def load(self, client):
+        self.loads.append(client.meta.region_name)
+        time.sleep(0.05)
+        return len(self.loads)
+
+    def test_loaded_once_until_older_than_its_ttl(self):
+        index = indexes.Index('test', 'ec2', self.load, 60)
+        self.assertEqual(index.get(REGION), 1)
+        self.assertEqual(index.get(REGION), 1)
+        index.ttl = 0
+        self.assertEqual(index.get(REGION), 2)
+
+    def test_loaded_once_for_all_threads(self):
+        index = indexes.Index('test', 'ec2', self.load, 60)
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(index.get(REGION)))
+                   for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(results, [1] * 8)
+
+    def test_locations_are_loaded_and_invalidated_apart(self):
+        index = indexes.Index('test', 'ec2', self.load, 60)
+        self.assertEqual((index.get(REGION), index.get('eu-west-1')), (1, 2))
+        index.invalidate('eu-west-1')
+        self.assertEqual((index.get(REGION), index.get('eu-west-1')), (1, 3))
+        index.clear()
+        self.assertEqual(index.get(REGION), 4)
+        self.assertEqual(self.loads, [REGION, 'eu-west-1', 'eu-west-1', REGION])
+
+
+class RDSEventsTest(StubbedTestCase):
+
+    def setUp(self):
+        super(RDSEventsTest, self).setUp()
+        indexes.rds_events.clear()
+
+    def test_last_event_of_every_instance(self):
+        rds = self.stub('rds')
+        rds.add_response('describe_events', {'Events': [
+            {'SourceIdentifier': 'db1', 'Message': 'DB instance created', 'Date': DATE},
+            {'SourceIdentifier': 'db1', 'Message': 'DB instance stopped',
+             'Date': DATE + datetime.timedelta(days=1)},
+            {'SourceIdentifier': 'db2', 'Message': 'DB instance restarted', 'Date': DATE}]}, {
+            'SourceType': 'db-instance', 'StartTime': ANY, 'EndTime': ANY, 'MaxRecords': 100,
+            'EventCategories': indexes.RDS_EVENT_CATEGORIES})
+        self.assertEqual(indexes.rds_last_event('db1', REGION)['Message'], 'DB instance stopped')
+        self.assertEqual(indexes.rds_last_event('db2', REGION)['Message'], 'DB instance restarted')
+        self.assertIsNone(indexes.rds_last_event('db3', REGION))
+        self.assertStubsUsed()
+
+
+class ScalingActivitiesTest(StubbedTestCase):
+
+    def setUp(self):
+        super(ScalingActivitiesTest, self).setUp()
+        indexes.scaling_activities.clear()
+
+    def activity(self, group, description, days):
+        return {'ActivityId': '%s-%d' % (group, days), 'AutoScalingGroupName': group,
+                'Description': description, 'Cause': 'test', 'StatusCode': 'Successful',
+                'StartTime': DATE + datetime.timedelta(days=days)}
+
+    def test_last_launch_and_terminate_of_every_group(self):
+        autoscaling = self.stub('autoscaling')
+        autoscaling.add_response('describe_scaling_activities', {'Activities': [
+            self.activity('web', 'Launching a new EC2 instance: i-1', 1),
+            self.activity('web', 'Launching a new EC2 instance: i-2', 3),
+            self.activity('web', 'Terminating EC2 instance: i-1', 2),
+            self.activity('web', 'Updating load balancers', 4)], 'NextToken': 'page-2'},
+            {'MaxRecords': 100})
+        autoscaling.add_response('describe_scaling_activities', {'Activities': [
+            self.activity('batch', 'Terminating EC2 instance: i-3', 5)]},
+            {'MaxRecords': 100, 'NextToken': 'page-2'})
+        self.assertEqual(indexes.last_scaling_activity('web', 'Launch', REGION),
+                         DATE + datetime.timedelta(days=3))
+        self.assertEqual(indexes.last_scaling_activity('web', 'Terminate', REGION),
+                         DATE + datetime.timedelta(days=2))
+        self.assertIsNone(indexes.last_scaling_activity('batch', 'Launch', REGION))
+        self.assertEqual(indexes.last_scaling_activity('batch', 'Terminate', REGION),
+                         DATE + datetime.timedelta(days=5))
+        self.assertStubsUsed()
+
+
+class UsageTest(StubbedTestCase):
+
+    def setUp(self):
+        super(UsageTest, self).setUp()
+        indexes.resource_usage.clear()
+        ec2 = self.stub('ec2')
+        ec2.add_response('describe_network_interfaces', {'NetworkInterfaces': [
+            {'NetworkInterfaceId': 'eni-1', 'Groups': [{'GroupId': 'sg-web'}]}]},
+            {'MaxResults': 1000})
+        ec2.add_response('describe_instances', {'Reservations': [{'Instances': [
+            {'InstanceId': 'i-1', 'KeyName': 'key-1', 'ImageId': 'ami-1',
+             'SecurityGroups': [{'GroupId': 'sg-web'}]}]}]}, {'MaxResults': 1000})
+        ec2.add_response('describe_security_groups', {'SecurityGroups': [
+            {'GroupId': 'sg-web', 'IpPermissions': [{'UserIdGroupPairs': [
+                {'GroupId': 'sg-lb'}, {'GroupId': 'sg-web'}]}]},
+            {'GroupId': 'sg-lb', 'IpPermissions': [{'UserIdGroupPairs': [
+                {'GroupId': 'sg-lb'}]}]}]}, {'MaxResults': 1000})
+        ec2.add_response('describe_images', {'Images': [
+            {'ImageId': 'ami-1', 'BlockDeviceMappings': [{'Ebs': {'SnapshotId': 'snap-1'}},
+                                                          {'VirtualName': 'ephemeral0'}]}]},
+            {'Owners': ['self']})
+        autoscaling = self.stub('autoscaling')
+        autoscaling.add_response('describe_launch_configurations', {'LaunchConfigurations': [
+            {'LaunchConfigurationName': 'lc-1', 'ImageId': 'ami-2', 'InstanceType': 't2.micro',
+             'SecurityGroups': ['sg-lc'], 'CreatedTime': DATE, 'BlockDeviceMappings': [
+                 {'DeviceName': '/dev/sda1', 'Ebs': {'SnapshotId': 'snap-2'}}]},
+            {'LaunchConfigurationName': 'lc-old', 'ImageId': 'ami-2', 'InstanceType': 't2.micro',
+             'CreatedTime': DATE}]}, {'MaxRecords': 100})
+        autoscaling.add_response('describe_auto_scaling_groups', {'AutoScalingGroups': [
+            {'AutoScalingGroupName': 'asg-1', 'LaunchConfigurationName': 'lc-1', 'MinSize': 0,
+             'MaxSize': 1, 'DesiredCapacity': 0, 'DefaultCooldown': 300,
+             'AvailabilityZones': ['us-east-1a'], 'HealthCheckType': 'EC2', 'CreatedTime': DATE}]},
+            {'MaxRecords': 100})
+
+    def test_referrers(self):
+        self.assertEqual(indexes.referrers('securitygroup', 'sg-web', REGION),
+                         set([('networkinterface', 'eni-1'), ('instance', 'i-1')]))
+        # Rules referring to their own group do not count
+        self.assertEqual(indexes.referrers('securitygroup', 'sg-lb', REGION),
+                         set([('securitygroup', 'sg-web')]))
+        self.assertEqual(indexes.referrers('keypair', 'key-1', REGION), set([('instance', 'i-1')]))
+        self.assertEqual(indexes.referrers('image', 'ami-2', REGION),
+                         set([('launchconfiguration', 'lc-1'), ('launchconfiguration', 'lc-old')]))
+        self.assertEqual(indexes.referrers('snapshot', 'snap-1', REGION), set([('image', 'ami-1')]))
+        self.assertEqual(indexes.referrers('snapshot', 'snap-2', REGION),
+                         set([('launchconfiguration', 'lc-1')]))
+        self.assertEqual(indexes.referrers('launchconfiguration', 'lc-1', REGION),
+                         set([('autoscaling', 'asg-1')]))
+        self.assertEqual(indexes.referrers('securitygroup', 'sg-unused', REGION), set())
+        self.assertStubsUsed()
+
+    def test_unused(self):
+        resources = [
+            SecurityGroup_Resource('sg-web', {'GroupName': 'web'}, region=REGION),
+            SecurityGroup_Resource('sg-free', {'GroupName': 'free'}, region=REGION),
+            SecurityGroup_Resource('sg-default', {'GroupName': 'default'}, region=REGION),
+            LaunchConfiguration_Resource('lc-1', {}, region=REGION),
+            LaunchConfiguration_Resource('lc-old', {}, region=REGION),
+        ]
+        self.assertEqual(indexes.unused(resources), [resources[1], resources[4]])
+        self.assertStubsUsed()
@@ -0,0 +1,59 @@
+# -*- coding: utf8 -*-
+import threading
+import time
+import unittest
+from .. import apihelpers
+from .. import inventory
+
+
+def fake_api(name, service, resources=(), error=None, running=None):
+    """ APIHelper-like class whose get() returns the given resources, or raises the error """
+    def get(**params):
+        if running is not None:
+            with running['lock']:
+                running['now'] += 1
+                running['max'] = max(running['max'], running['now'])
+            time.sleep(0.02)
+            with running['lock']:
+                running['now'] -= 1
+        if error is not None:
+            raise error
+        return list(resources)
+    return type(name, (object,), {'_type': service, 'get': staticmethod(get)})
+
+
+class InventoryTest(unittest.TestCase):
+
+    def test_fetch(self):
+        progress = []
+        apis = [fake_api('FirstAPI', 'ec2', ['i-1', 'i-2']), fake_api('SecondAPI', 'rds', ['db1']),
+                fake_api('FailingAPI', 'rds', error=ValueError('denied'))]
+        fetched = inventory.Inventory(apis, progress=lambda name, entry: progress.append(name))
+        self.assertIs(fetched.fetch(), fetched)
+        self.assertEqual(fetched['FirstAPI'], ['i-1', 'i-2'])
+        self.assertEqual(fetched[apis[1]], ['db1'])
+        self.assertEqual(fetched['FailingAPI'], [])
+        self.assertEqual(sorted(fetched), ['db1', 'i-1', 'i-2'])
+        self.assertEqual(fetched.report['FirstAPI']['count'], 2)
+        self.assertEqual(fetched.report['FailingAPI']['error'], 'denied')
+        self.assertEqual(sorted(progress), ['FailingAPI', 'FirstAPI', 'SecondAPI'])
+        self.assertIn('FailingAPI', fetched.format_report())
+
+    def test_classes_of_a_service_are_capped(self):
+        running = {'lock': threading.Lock(), 'now': 0, 'max': 0}
+        apis = [fake_api('API%d' % i, 'efs', running=running) for i in range(4)]
+        inventory.Inventory(apis, service_limits={'efs': 2}).fetch()
+        self.assertEqual(running['max'], 2)
+
+    def test_get_params_are_passed_on(self):
+        calls = []
+        api = type('API', (object,), {'_type': 's3', 'get': staticmethod(
+            lambda **params: calls.append(params) or [])})
+        inventory.Inventory([api], regions=['eu-west-1'], with_tags=True).fetch()
+        self.assertEqual(calls, [{'regions': ['eu-west-1'], 'with_tags': True}])
+
+    def test_api_classes(self):
+        classes = inventory.api_classes()
+        self.assertIn(apihelpers.EC2API, classes)
+        self.assertIn(apihelpers.S3API, classes)
+        self.assertNotIn(apihelpers.APIHelper, classes)
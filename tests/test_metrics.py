@@ -0,0 +1,111 @@
+# -*- coding: utf8 -*-
+import json
+import StringIO
+import unittest
+from botocore.response import StreamingBody
+from . import StubbedTestCase, REGION
+from .. import boto3_clients as clients
+from .. import metrics
+from .. import parallel
+
+
+class MetricsTest(StubbedTestCase):
+
+    def setUp(self):
+        super(MetricsTest, self).setUp()
+        metrics.reset()
+
+    def series(self, operation):
+        return [series for series in metrics.snapshot() if series['operation'] == operation]
+
+    def test_calls_and_errors_are_counted(self):
+        sqs = self.stub('sqs')
+        sqs.add_response('list_queues', {'QueueUrls': []})
+        sqs.add_response('list_queues', {'QueueUrls': []})
+        sqs.add_client_error('list_queues', 'AccessDenied', http_status_code=403)
+        client = clients.client('sqs', REGION)
+        client.list_queues()
+        client.list_queues()
+        with self.assertRaises(Exception):
+            client.list_queues()
+        series, = self.series('ListQueues')
+        self.assertEqual(series['service'], 'sqs')
+        self.assertEqual(series['tags'], {})
+        self.assertEqual((series['calls'], series['errors'], series['retries']), (3, 1, 0))
+        self.assertEqual(series['latency_buckets']['+Inf'], 3)
+        self.assertStubsUsed()
+
+    def test_throttled_answers_are_counted(self):
+        sqs = self.stub('sqs')
+        sqs.add_client_error('list_queues', 'RequestThrottled', http_status_code=400)
+        with self.assertRaises(Exception):
+            clients.client('sqs', REGION).list_queues()
+        series, = self.series('ListQueues')
+        self.assertEqual((series['errors'], series['throttles']), (1, 1))
+
+    def test_calls_are_tagged_with_their_context(self):
+        sqs = self.stub('sqs')
+        sqs.add_response('list_queues', {'QueueUrls': []})
+        sqs.add_response('list_queues', {'QueueUrls': []})
+        with metrics.context(job='sweep'):
+            with metrics.context(step='queues'):
+                clients.client('sqs', REGION).list_queues()
+            # Threads of parallel.py keep the tags of the thread starting them
+            parallel.pmap(lambda _: clients.client('sqs', REGION).list_queues(), [None])
+        self.assertEqual(sorted(series['tags'] for series in self.series('ListQueues')),
+                         [{'job': 'sweep'}, {'job': 'sweep', 'step': 'queues'}])
+        self.assertEqual(metrics._current_tags(), {})
+
+    def test_reset(self):
+        sqs = self.stub('sqs')
+        sqs.add_response('list_queues', {'QueueUrls': []})
+        clients.client('sqs', REGION).list_queues()
+        metrics.reset()
+        self.assertEqual(metrics.snapshot(), [])
+
+
+class BodySizeTest(unittest.TestCase):
+
+    def test_body_read(self):
+        self.assertEqual(metrics._body_size({'headers': {}, 'body': '<xml/>'}), 6)
+
+    def test_streaming_body_is_not_read(self):
+        body = StreamingBody(StringIO.StringIO('content'), 7)
+        self.assertEqual(metrics._body_size({'headers': {'content-length': '7'}, 'body': body}),
+                         7)
+        self.assertEqual(body.read(), 'content')
+
+    def test_streaming_body_without_length(self):
+        body = StreamingBody(StringIO.StringIO('content'), 7)
+        self.assertEqual(metrics._body_size({'headers': {}, 'body': body}), 0)
+
+
+class ExportTest(StubbedTestCase):
+
+    def setUp(self):
+        super(ExportTest, self).setUp()
+        metrics.reset()
+        sqs = self.stub('sqs')
+        sqs.add_response('list_queues', {'QueueUrls': []})
+        with metrics.context(**{'job': 'say "hi"', 'team-name': 'ops', '2nd.step': 'x'}):
+            clients.client('sqs', REGION).list_queues()
+
+    def test_to_json(self):
+        series, = json.loads(metrics.to_json())
+        self.assertEqual(series['operation'], 'ListQueues')
+        self.assertEqual(series['calls'], 1)
+
+    def test_to_prometheus(self):
+        lines = metrics.to_prometheus(prefix='test').splitlines()
+        labels = ('service="sqs",operation="ListQueues",_2nd_step="x",job="say \\"hi\\"",'
+                  'team_name="ops"')
+        self.assertIn('# TYPE test_calls_total counter', lines)
+        self.assertIn('test_calls_total{%s} 1' % labels, lines)
+        self.assertIn('test_call_seconds_bucket{%s,le="+Inf"} 1' % labels, lines)
+        self.assertIn('test_call_seconds_count{%s} 1' % labels, lines)
+
+    def test_label_names(self):
+        self.assertEqual(metrics._label_name('team-name'), 'team_name')
+        self.assertEqual(metrics._label_name('2nd'), '_2nd')
+        self.assertEqual(metrics._label_name(u'équipe'), '_quipe')
+        self.assertEqual(metrics._label_name('_ok_1'), '_ok_1')
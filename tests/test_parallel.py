@@ -0,0 +1,58 @@
+# -*- coding: utf8 -*-
+import time
+import unittest
+from .. import parallel
+
+
+class PrefetchTest(unittest.TestCase):
+
+    def test_items_in_order(self):
+        self.assertEqual(list(parallel.prefetch(iter(range(5)))), range(5))
+        self.assertEqual(list(parallel.prefetch([])), [])
+
+    def test_next_item_is_read_ahead(self):
+        read = []
+
+        def items():
+            for i in range(3):
+                read.append(i)
+                yield i
+
+        prefetched = parallel.prefetch(items())
+        self.assertEqual(next(prefetched), 0)
+        # The second item is requested while the caller still holds the first one
+        for _ in range(100):
+            if len(read) == 2:
+                break
+            time.sleep(0.01)
+        self.assertEqual(read, [0, 1])
+        self.assertEqual(list(prefetched), [1, 2])
+
+    def test_errors_are_raised_to_the_caller(self):
+        def items():
+            yield 1
+            raise ValueError('page 2')
+
+        prefetched = parallel.prefetch(items())
+        self.assertEqual(next(prefetched), 1)
+        with self.assertRaises(ValueError):
+            next(prefetched)
+
+
+class PmapTest(unittest.TestCase):
+
+    def test_results_in_order(self):
+        self.assertEqual(parallel.pmap(lambda x: x * 2, range(20), max_workers=4),
+                         [x * 2 for x in range(20)])
+        self.assertEqual(parallel.pmap(lambda x: x, []), [])
+
+    def test_errors_are_raised(self):
+        def fail(x):
+            if x == 3:
+                raise KeyError(x)
+            return x
+        with self.assertRaises(KeyError):
+            parallel.pmap(fail, range(5))
+
+    def test_chunks(self):
+        self.assertEqual(parallel.chunks(range(5), 2), [[0, 1], [2, 3], [4]])
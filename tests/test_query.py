@@ -0,0 +1,76 @@
+# -*- coding: utf8 -*-
+import datetime
+import unittest
+from ..query import Query
+from ..resources import EC2_Resource, ELB_Resource, LaunchConfiguration_Resource, \
+    S3Bucket_Resource
+
+EC2_FILTERS = {'tag': 'tag:%s', 'tag-key': 'tag-key', 'vpc': 'vpc-id',
+               'state': 'instance-state-name'}
+
+
+def instance(vpc='vpc-1', state='running', tags=None, launched=datetime.datetime(2020, 1, 2)):
+    return EC2_Resource('i-1', {'VpcId': vpc, 'State': {'Name': state}, 'LaunchTime': launched,
+                                'Tags': [{'Key': k, 'Value': v} for k, v in (tags or {}).items()]})
+
+
+class CompileTest(unittest.TestCase):
+
+    def test_native_filters(self):
+        query = Query(vpc='vpc-1', state=['running', 'stopped'], tags={'env': 'dev', 'team': None})
+        compiled = query.compile(EC2_FILTERS)
+        self.assertEqual(sorted(compiled.filters), sorted([
+            {'Name': 'vpc-id', 'Values': ['vpc-1']},
+            {'Name': 'instance-state-name', 'Values': ['running', 'stopped']},
+            {'Name': 'tag:env', 'Values': ['dev']},
+            {'Name': 'tag-key', 'Values': ['team']},
+        ]))
+        self.assertEqual(compiled.checks, [])
+        self.assertEqual(compiled.tag_checks, [])
+
+    def test_params_keep_existing_filters(self):
+        compiled = Query(vpc='vpc-1').compile(EC2_FILTERS)
+        params = {'Filters': [{'Name': 'owner-id', 'Values': ['1']}], 'MaxResults': 5}
+        self.assertEqual(compiled.params(params), {
+            'Filters': [{'Name': 'owner-id', 'Values': ['1']},
+                        {'Name': 'vpc-id', 'Values': ['vpc-1']}],
+            'MaxResults': 5})
+        self.assertEqual(len(params['Filters']), 1)
+
+    def test_client_side_checks(self):
+        compiled = Query(vpc='vpc-1', state='running', tags={'env': ['dev', 'test']}).compile({})
+        self.assertEqual(compiled.filters, [])
+        self.assertEqual(compiled.params({}), {})
+        self.assertEqual((len(compiled.checks), len(compiled.tag_checks)), (2, 1))
+
+
+class MatchesTest(unittest.TestCase):
+
+    def test_conditions(self):
+        compiled = Query(vpc='vpc-1', state='running', tags={'env': ['dev', 'test'],
+                                                             'team': None}).compile({})
+        self.assertTrue(compiled.matches(instance(tags={'env': 'test', 'team': 'x'})))
+        self.assertFalse(compiled.matches(instance(vpc='vpc-2', tags={'env': 'dev', 'team': 'x'})))
+        self.assertFalse(compiled.matches(instance(state='stopped',
+                                                   tags={'env': 'dev', 'team': 'x'})))
+        self.assertFalse(compiled.matches(instance(tags={'env': 'prod', 'team': 'x'})))
+        self.assertFalse(compiled.matches(instance(tags={'env': 'dev'})))
+
+    def test_creation_range(self):
+        compiled = Query(created_after=datetime.datetime(2020, 1, 1),
+                         created_before=datetime.datetime(2020, 1, 3)).compile({})
+        self.assertTrue(compiled.matches(instance()))
+        self.assertFalse(compiled.matches(instance(launched=datetime.datetime(2020, 1, 4))))
+
+    def test_types_without_the_attribute_never_match(self):
+        self.assertFalse(Query(vpc='vpc-1').compile({}).matches(LaunchConfiguration_Resource('lc')))
+        for resource in (ELB_Resource('lb', {}), S3Bucket_Resource('b', {})):
+            self.assertFalse(Query(state='running').compile({}).matches(resource))
+
+    def test_filter_prefetches_tags_of_the_resources_left(self):
+        resources = [instance(tags={'env': 'dev'}), instance(vpc='vpc-2', tags={'env': 'dev'})]
+        prefetched = []
+        found = Query(vpc='vpc-1', tags={'env': 'dev'}).compile({}).filter(
+            resources, prefetch_tags=prefetched.extend)
+        self.assertEqual(found, resources[:1])
+        self.assertEqual(prefetched, resources[:1])
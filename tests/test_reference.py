@@ -0,0 +1,52 @@
+# -*- coding: utf8 -*-
+from . import StubbedTestCase, OTHER_ACCOUNT, REGION
+from .. import reference
+from ..resources import EC2_Resource
+
+SUBNETS = {'Subnets': [{'SubnetId': 'subnet-1', 'VpcId': 'vpc-1'},
+                       {'SubnetId': 'subnet-2', 'VpcId': 'vpc-2'}]}
+DEFAULT_SGS = {'SecurityGroups': [{'GroupId': 'sg-1', 'GroupName': 'default', 'VpcId': 'vpc-1'},
+                                  {'GroupId': 'sg-classic', 'GroupName': 'default'}]}
+DEFAULT_SG_FILTERS = {'Filters': [{'Name': 'group-name', 'Values': ['default']}]}
+
+
+class ReferenceTest(StubbedTestCase):
+
+    def test_lookups_are_answered_from_one_bulk_call(self):
+        ec2 = self.stub('ec2')
+        ec2.add_response('describe_subnets', SUBNETS, {})
+        self.assertEqual(reference.subnet_vpc('subnet-1', REGION), 'vpc-1')
+        self.assertEqual(reference.subnet_vpc('subnet-2', REGION), 'vpc-2')
+        self.assertIsNone(reference.subnet_vpc('subnet-3', REGION))
+        self.assertEqual(sorted(reference.subnets(REGION)), ['subnet-1', 'subnet-2'])
+        self.assertStubsUsed()
+
+    def test_default_security_groups(self):
+        ec2 = self.stub('ec2')
+        ec2.add_response('describe_security_groups', DEFAULT_SGS, DEFAULT_SG_FILTERS)
+        instance = EC2_Resource('i-1', {'VpcId': 'vpc-1'}, REGION)
+        self.assertEqual(instance.default_sg(), 'sg-1')
+        self.assertIsNone(reference.default_sg('vpc-2', REGION))
+        self.assertStubsUsed()
+
+    def test_data_is_kept_per_account_and_region(self):
+        for region, account, vpc in ((REGION, None, 'vpc-1'), ('eu-west-1', None, 'vpc-2'),
+                                     (REGION, OTHER_ACCOUNT, 'vpc-3')):
+            ec2 = self.stub('ec2', region, account)
+            ec2.add_response('describe_vpcs', {'Vpcs': [{'VpcId': vpc}]}, {})
+        self.assertEqual(list(reference.vpcs(REGION)), ['vpc-1'])
+        self.assertEqual(list(reference.vpcs('eu-west-1')), ['vpc-2'])
+        self.assertEqual(list(reference.vpcs(REGION, OTHER_ACCOUNT)), ['vpc-3'])
+        self.assertEqual(list(reference.vpcs(REGION)), ['vpc-1'])
+        self.assertStubsUsed()
+
+    def test_invalidated_data_is_loaded_again(self):
+        ec2 = self.stub('ec2')
+        ec2.add_response('describe_availability_zones', {'AvailabilityZones': [
+            {'ZoneName': 'us-east-1a'}]}, {})
+        ec2.add_response('describe_availability_zones', {'AvailabilityZones': [
+            {'ZoneName': 'us-east-1a'}, {'ZoneName': 'us-east-1b'}]}, {})
+        self.assertEqual(reference.availability_zones(REGION), ['us-east-1a'])
+        reference.invalidate(REGION)
+        self.assertEqual(reference.availability_zones(REGION), ['us-east-1a', 'us-east-1b'])
+        self.assertStubsUsed()
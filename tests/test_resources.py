@@ -0,0 +1,90 @@
+# -*- coding: utf8 -*-
+import unittest
+from botocore.exceptions import ClientError
+from . import StubbedTestCase, OTHER_ACCOUNT, REGION
+from .. import tags
+from ..apihelpers import EC2API
+from ..resources import EC2_Resource, S3Bucket_Resource, _project, is_not_found
+
+
+class S3BucketTest(StubbedTestCase):
+
+    def test_terminate_in_the_account_of_the_bucket(self):
+        bucket = S3Bucket_Resource('b', {}, region='eu-west-1', account=OTHER_ACCOUNT)
+        s3 = self.stub('s3', 'eu-west-1', OTHER_ACCOUNT)
+        s3.add_response('list_object_versions', {
+            'Versions': [{'Key': 'k', 'VersionId': 'v1'}],
+            'DeleteMarkers': [{'Key': 'k', 'VersionId': 'v2'}]}, {'Bucket': 'b'})
+        s3.add_response('delete_objects', {}, {'Bucket': 'b', 'Delete': {'Quiet': True, 'Objects': [
+            {'Key': 'k', 'VersionId': 'v1'}, {'Key': 'k', 'VersionId': 'v2'}]}})
+        s3.add_response('delete_bucket', {}, {'Bucket': 'b'})
+        bucket.terminate()
+        self.assertStubsUsed()
+
+    def test_tags_are_looked_for_in_the_regions_of_the_bucket_account(self):
+        bucket = S3Bucket_Resource('b', {}, account=OTHER_ACCOUNT)
+        ec2 = self.stub('ec2', None, OTHER_ACCOUNT)
+        ec2.add_response('describe_regions', {'Regions': [{'RegionName': 'us-east-1'},
+                                                          {'RegionName': 'eu-west-1'}]})
+        for region, mappings in (('us-east-1', []), ('eu-west-1', [{
+                'ResourceARN': 'arn:aws:s3:::b', 'Tags': [{'Key': 'env', 'Value': 'dev'}]}])):
+            tagging = self.stub('resourcegroupstaggingapi', region, OTHER_ACCOUNT)
+            tagging.add_response('get_resources', {'ResourceTagMappingList': mappings},
+                                 {'ResourceTypeFilters': ['s3'], 'ResourcesPerPage': 100})
+        tags.prefetch([bucket])
+        self.assertEqual(bucket.tags, {'env': 'dev'})
+        self.assertStubsUsed()
+
+
+class IsNotFoundTest(unittest.TestCase):
+
+    def test_codes(self):
+        for code, message, expected in (('InvalidInstanceID.NotFound', '', True),
+                                        ('InvalidInstanceID.Malformed', '', True),
+                                        ('InvalidID', '', True),
+                                        ('DBInstanceNotFound', '', True),
+                                        ('ValidationError', 'Stack foo does not exist', True),
+                                        ('ValidationError', 'Invalid template', False),
+                                        ('UnauthorizedOperation', '', False)):
+            error = ClientError({'Error': {'Code': code, 'Message': message}}, 'Operation')
+            self.assertEqual(is_not_found(error), expected, code)
+
+
+class CompactTest(StubbedTestCase):
+
+    def instance(self, instance_id):
+        return {'InstanceId': instance_id, 'VpcId': 'vpc-1', 'State': {'Name': 'running'},
+                'ImageId': 'ami-1', 'Tags': [{'Key': 'env', 'Value': u'dev'}]}
+
+    def test_project(self):
+        data = {'DBSubnetGroup': {'VpcId': 'vpc-1', 'Subnets': []}, 'Engine': 'mysql'}
+        self.assertEqual(_project(data, ('DBSubnetGroup.VpcId', 'Missing.Field', 'Other')),
+                         {'DBSubnetGroup': {'VpcId': 'vpc-1'}})
+
+    def test_compact_resources_keep_the_fields_of_their_properties(self):
+        ec2 = self.stub('ec2')
+        ec2.add_response('describe_instances', {'Reservations': [{'Instances': [
+            self.instance('i-1'), self.instance('i-2')]}]}, {'MaxResults': 1000})
+        first, second = EC2API.get(regions=[REGION], compact=True)
+        self.assertEqual(first._data, {'VpcId': 'vpc-1', 'State': {'Name': 'running'}})
+        self.assertEqual((first.vpc, first.status, first.tags), ('vpc-1', 'running', {'env': 'dev'}))
+        # Tag strings are shared by all the resources
+        self.assertIs(first._tags.keys()[0], second._tags.keys()[0])
+        self.assertIs(first._tags.values()[0], second._tags.values()[0])
+        self.assertStubsUsed()
+
+        # The full describe output is loaded again only once, when it is needed
+        ec2.add_response('describe_instances', {'Reservations': [{'Instances': [
+            self.instance('i-1')]}]}, {'InstanceIds': ['i-1']})
+        self.assertEqual(first.data['ImageId'], 'ami-1')
+        self.assertEqual(first.data['ImageId'], 'ami-1')
+        self.assertEqual(first.tags, {'env': 'dev'})
+        self.assertStubsUsed()
+
+    def test_resources_gone_keep_their_compact_data(self):
+        resource = EC2_Resource('i-1', self.instance('i-1'), REGION)
+        resource._compact(EC2API._describe_resource, {})
+        ec2 = self.stub('ec2')
+        ec2.add_response('describe_instances', {'Reservations': []}, {'InstanceIds': ['i-1']})
+        self.assertEqual(resource.data, {'VpcId': 'vpc-1', 'State': {'Name': 'running'}})
+        self.assertStubsUsed()
@@ -0,0 +1,19 @@
+# -*- coding: utf8 -*-
+import os
+import subprocess
+import sys
+import unittest
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+class ScriptImportTest(unittest.TestCase):
+    """ The scripts of the repo (asg.py, stacks.py, deploy_lambda.py) are run from its directory,
+        where its modules are top-level modules """
+
+    def test_modules_used_by_scripts_import_outside_the_package(self):
+        process = subprocess.Popen(
+            [sys.executable, '-c', 'import boto3_clients, parallel, arn, stacks, sessions'],
+            cwd=REPO, stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+        output = process.communicate()[0]
+        self.assertEqual(process.returncode, 0, output)
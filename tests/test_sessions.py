@@ -0,0 +1,54 @@
+# -*- coding: utf8 -*-
+import datetime
+from dateutil.tz import tzutc
+from . import StubbedTestCase, OTHER_ACCOUNT
+from .. import sessions
+
+FIRST_KEY = 'AKIAIOSFODNN7FIRST1'
+SECOND_KEY = 'AKIAIOSFODNN7SECOND'
+ROLE_ARN = 'arn:aws:iam::%s:role/%s' % (OTHER_ACCOUNT, sessions.DEFAULT_ROLE)
+
+
+def assumed(access_key, expires_in):
+    return {'Credentials': {
+        'AccessKeyId': access_key, 'SecretAccessKey': 'secret', 'SessionToken': 'token',
+        'Expiration': datetime.datetime.now(tzutc()) + datetime.timedelta(seconds=expires_in)}}
+
+
+class SessionPoolTest(StubbedTestCase):
+
+    def setUp(self):
+        super(SessionPoolTest, self).setUp()
+        self.pool = sessions.SessionPool()
+        self.sts = self.stub('sts', region=None)
+
+    def assume_role(self, access_key, expires_in=sessions.CREDENTIALS_DURATION):
+        self.sts.add_response('assume_role', assumed(access_key, expires_in), {
+            'RoleArn': ROLE_ARN, 'RoleSessionName': 'awsutils-%s' % OTHER_ACCOUNT,
+            'DurationSeconds': sessions.CREDENTIALS_DURATION})
+
+    def test_role_is_assumed_once(self):
+        self.assume_role(FIRST_KEY)
+        credentials = self.pool.credentials(OTHER_ACCOUNT)
+        self.assertIs(self.pool.credentials(OTHER_ACCOUNT, sessions.DEFAULT_ROLE), credentials)
+        self.assertEqual(credentials.get_frozen_credentials().access_key, FIRST_KEY)
+        self.assertStubsUsed()
+
+    def test_sessions_of_every_region_share_the_credentials(self):
+        self.assume_role(FIRST_KEY)
+        east = self.pool.session(OTHER_ACCOUNT, region='us-east-1')
+        west = self.pool.session(OTHER_ACCOUNT, region='eu-west-1')
+        self.assertIs(self.pool.session(OTHER_ACCOUNT, region='eu-west-1'), west)
+        self.assertEqual(west.region_name, 'eu-west-1')
+        for session in (east, west):
+            self.assertEqual(session.get_credentials().get_frozen_credentials().access_key,
+                             FIRST_KEY)
+            self.assertEqual(session.get_credentials().method, 'sts-assume-role')
+        self.assertStubsUsed()
+
+    def test_credentials_close_to_expiring_are_refreshed(self):
+        self.assume_role(FIRST_KEY, expires_in=300)
+        self.assume_role(SECOND_KEY)
+        credentials = self.pool.session(OTHER_ACCOUNT).get_credentials()
+        self.assertEqual(credentials.get_frozen_credentials().access_key, SECOND_KEY)
+        self.assertStubsUsed()
@@ -0,0 +1,110 @@
+# -*- coding: utf8 -*-
+from . import StubbedTestCase, REGION
+from .. import tags
+from ..resources import EC2_Resource, ELB_Resource, ELBv2_Resource, RDS_Resource, \
+    LaunchConfiguration_Resource
+
+TAGS = [{'Key': 'env', 'Value': 'dev'}]
+LB_ARN = 'arn:aws:elasticloadbalancing:us-east-1:123456789012:loadbalancer/app/%s/1'
+
+
+def instances(count):
+    return [EC2_Resource('i-%d' % i, {}, REGION) for i in range(count)]
+
+
+class TagManyTest(StubbedTestCase):
+
+    def test_ec2_batches(self):
+        resources = instances(1001)
+        ec2 = self.stub('ec2')
+        ec2.add_response('create_tags', {}, {'Resources': [r._id for r in resources[:1000]],
+                                             'Tags': TAGS})
+        ec2.add_response('create_tags', {}, {'Resources': ['i-1000'], 'Tags': TAGS})
+        self.assertEqual(tags.tag_many(resources, {'env': 'dev'}, max_workers=1), {})
+        self.assertStubsUsed()
+
+    def test_loaded_tags_are_updated(self):
+        resource = EC2_Resource('i-1', {'Tags': [{'Key': 'env', 'Value': 'prod'},
+                                                 {'Key': 'team', 'Value': 'a'}]}, REGION)
+        resource.tags
+        ec2 = self.stub('ec2')
+        ec2.add_response('delete_tags', {}, {'Resources': ['i-1'], 'Tags': [{'Key': 'team'}]})
+        tags.untag_many([resource], ['team'])
+        self.assertEqual(resource.tags, {'env': 'prod'})
+
+    def test_classic_elbs_one_per_call(self):
+        elb = self.stub('elb')
+        for name in ('a', 'b'):
+            elb.add_response('add_tags', {}, {'LoadBalancerNames': [name], 'Tags': TAGS})
+        resources = [ELB_Resource(name, {}, REGION) for name in ('a', 'b')]
+        self.assertEqual(tags.tag_many(resources, {'env': 'dev'}, max_workers=1), {})
+        self.assertStubsUsed()
+
+    def test_batches_failing_on_invalid_ids_are_split(self):
+        resources = instances(4)
+        ec2 = self.stub('ec2')
+        ec2.add_client_error('create_tags', 'InvalidInstanceID.NotFound', expected_params={
+            'Resources': ['i-0', 'i-1', 'i-2', 'i-3'], 'Tags': TAGS})
+        ec2.add_response('create_tags', {}, {'Resources': ['i-0', 'i-1'], 'Tags': TAGS})
+        ec2.add_client_error('create_tags', 'InvalidInstanceID.NotFound', expected_params={
+            'Resources': ['i-2', 'i-3'], 'Tags': TAGS})
+        ec2.add_client_error('create_tags', 'InvalidInstanceID.NotFound', expected_params={
+            'Resources': ['i-2'], 'Tags': TAGS})
+        ec2.add_response('create_tags', {}, {'Resources': ['i-3'], 'Tags': TAGS})
+        failed = tags.tag_many(resources, {'env': 'dev'})
+        self.assertEqual(list(failed), [resources[2]])
+        self.assertStubsUsed()
+
+    def test_other_errors_fail_the_whole_batch(self):
+        resources = instances(2)
+        ec2 = self.stub('ec2')
+        ec2.add_client_error('create_tags', 'UnauthorizedOperation', expected_params={
+            'Resources': ['i-0', 'i-1'], 'Tags': TAGS})
+        self.assertEqual(set(tags.tag_many(resources, {'env': 'dev'})), set(resources))
+
+    def test_tagging_api_failures(self):
+        resource = ELBv2_Resource(LB_ARN % 'a', {}, REGION)
+        tagging = self.stub('resourcegroupstaggingapi')
+        tagging.add_response('tag_resources', {'FailedResourcesMap': {
+            LB_ARN % 'a': {'ErrorCode': 'InvalidParameterException', 'ErrorMessage': 'denied'}}},
+            {'ResourceARNList': [LB_ARN % 'a'], 'Tags': {'env': 'dev'}})
+        self.assertEqual(tags.tag_many([resource], {'env': 'dev'}), {resource: 'denied'})
+
+    def test_unsupported_types(self):
+        resource = LaunchConfiguration_Resource('lc', {}, REGION)
+        self.assertEqual(list(tags.tag_many([resource], {'env': 'dev'})), [resource])
+
+
+class PrefetchTest(StubbedTestCase):
+
+    def test_batch_apis(self):
+        resources = [ELB_Resource('lb%d' % i, {}, REGION) for i in range(21)]
+        elb = self.stub('elb')
+        for names in ([r._id for r in resources[:20]], ['lb20']):
+            elb.add_response('describe_tags', {'TagDescriptions': [
+                {'LoadBalancerName': name, 'Tags': TAGS} for name in names if name != 'lb1']},
+                {'LoadBalancerNames': names})
+        tags.prefetch(resources, max_workers=1)
+        self.assertEqual(resources[0]._tags, {'env': 'dev'})
+        self.assertEqual(resources[1]._tags, {})
+        self.assertEqual(resources[20]._tags, {'env': 'dev'})
+        self.assertStubsUsed()
+
+    def test_tagging_api(self):
+        resources = [RDS_Resource(name, {}, region=REGION) for name in ('db1', 'db2')]
+        tagging = self.stub('resourcegroupstaggingapi')
+        tagging.add_response('get_resources', {'ResourceTagMappingList': [
+            {'ResourceARN': resources[0]._id, 'Tags': TAGS},
+            {'ResourceARN': RDS_Resource('other', {}, region=REGION)._id, 'Tags': TAGS}]},
+            {'ResourceTypeFilters': ['rds:db'], 'ResourcesPerPage': 100})
+        tags.prefetch(resources)
+        self.assertEqual([r.tags for r in resources], [{'env': 'dev'}, {}])
+        self.assertStubsUsed()
+
+    def test_tags_already_known_are_not_loaded(self):
+        loaded = ELB_Resource('lb', {}, REGION)
+        loaded._tags = {'team': 'a'}
+        resources = [loaded, EC2_Resource('i-1', {'Tags': TAGS}, REGION)]
+        self.stub('elb')
+        self.assertIs(tags.prefetch(resources), resources)
+        self.assertEqual([r.tags for r in resources], [{'team': 'a'}, {'env': 'dev'}])
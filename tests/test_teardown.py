@@ -0,0 +1,151 @@
+# -*- coding: utf8 -*-
+import unittest
+from botocore.exceptions import ClientError
+from . import StubbedTestCase, ACCOUNT, REGION
+from .. import teardown
+from ..query import Query
+from ..resources import AutoScalingGroup_Resource, LaunchConfiguration_Resource, EC2_Resource, \
+    ENI_Resource, EBSVolume_Resource, RDS_Resource, RDSAurora_Resource, EFS_Resource, \
+    SecurityGroup_Resource
+
+
+def environment():
+    """ An AutoScaling group with its launch configuration and instance, an instance with its
+        network interfaces, a DB instance in a cluster, a file system and their security
+        groups """
+    file_system = EFS_Resource('fs-1', {'Name': 'fs'})
+    file_system._mount_targets = [{'MountTargetId': 'fsmt-1'}]
+    file_system._security_groups = {'fsmt-1': ['sg-a']}
+    return [
+        AutoScalingGroup_Resource('asg1', {'Instances': [{'InstanceId': 'i-1'}],
+                                           'LaunchConfigurationName': 'lc1'}),
+        LaunchConfiguration_Resource('lc1', {}),
+        EC2_Resource('i-1', {'SecurityGroups': [{'GroupId': 'sg-a'}], 'Tags': [
+            {'Key': teardown.ASG_TAG, 'Value': 'asg1'}]}),
+        EC2_Resource('i-2', {'SecurityGroups': [{'GroupId': 'sg-b'}], 'Tags': []}),
+        ENI_Resource('eni-1', {'Attachment': {'InstanceId': 'i-2', 'DeleteOnTermination': True},
+                               'Groups': [{'GroupId': 'sg-b'}]}),
+        ENI_Resource('eni-2', {'Attachment': {'InstanceId': 'i-2', 'DeleteOnTermination': False},
+                               'Groups': [{'GroupId': 'sg-c'}]}),
+        ENI_Resource('eni-3', {'RequesterManaged': True, 'Groups': [{'GroupId': 'sg-c'}]}),
+        RDS_Resource('db1', {'DBInstanceIdentifier': 'db1', 'DBClusterIdentifier': 'cl1',
+                             'VpcSecurityGroups': [{'VpcSecurityGroupId': 'sg-c'}]}),
+        RDSAurora_Resource('cl1', {}),
+        file_system,
+    ] + [SecurityGroup_Resource(g, {'GroupName': n, 'VpcId': 'vpc-1'})
+         for g, n in (('sg-a', 'a'), ('sg-b', 'b'), ('sg-c', 'c'), ('sg-d', 'default'))]
+
+
+def waves(plan):
+    return [[step.name.split(' ')[0] for step in wave] for wave in plan.waves]
+
+
+def error(code):
+    return ClientError({'Error': {'Code': code, 'Message': ''}}, 'Delete')
+
+
+class PlanTest(unittest.TestCase):
+
+    def setUp(self):
+        self.plan = teardown.Teardown(environment())
+
+    def test_waves(self):
+        self.assertEqual(waves(self.plan), [
+            ['[autoscaling]:asg1', '[ec2]:i-2', '[efs-mount-target]:fsmt-1',
+             '[rds]:arn:aws:rds:%s:%s:db:db1' % (REGION, ACCOUNT)],
+            ['[autoscaling]:lc1', '[ec2]:eni-2', '[efs]:fs-1', '[rds]:cl1',
+             '[securitygroup]:sg-a', '[securitygroup]:sg-b'],
+            ['[securitygroup]:sg-c'],
+        ])
+
+    def test_resources_left_to_aws(self):
+        self.assertEqual(sorted(r._id for r in self.plan.skipped), ['eni-3', 'sg-d'])
+
+    def test_circular_dependencies(self):
+        first, second = teardown.Step('first', None), teardown.Step('second', None)
+        first.after.add(second)
+        second.after.add(first)
+        with self.assertRaises(ValueError):
+            teardown._waves([first, second])
+
+
+class ExecuteTest(unittest.TestCase):
+
+    def setUp(self):
+        self.retry_delay = teardown.RETRY_DELAY
+        teardown.RETRY_DELAY = 0
+        self.plan = teardown.Teardown(environment(), max_workers=1)
+        self.steps = dict((step.name.split(' ')[0], step) for step in self.plan.steps)
+        for step in self.plan.steps:
+            step.action = lambda: None
+
+    def tearDown(self):
+        teardown.RETRY_DELAY = self.retry_delay
+
+    def test_steps_after_a_failed_one_are_skipped(self):
+        def fail():
+            raise error('UnauthorizedOperation')
+        self.steps['[ec2]:eni-2'].action = fail
+        self.assertFalse(self.plan.execute())
+        self.assertEqual(self.steps['[ec2]:eni-2'].status, 'failed')
+        self.assertEqual(self.steps['[securitygroup]:sg-c'].status, 'skipped')
+        self.assertEqual(self.steps['[securitygroup]:sg-a'].status, 'done')
+
+    def test_dependency_errors_are_retried(self):
+        errors = [error('DependencyViolation'), error('DependencyViolation')]
+
+        def delete():
+            if errors:
+                raise errors.pop()
+        self.steps['[securitygroup]:sg-c'].action = delete
+        self.assertTrue(self.plan.execute())
+        self.assertEqual(self.steps['[securitygroup]:sg-c'].attempts, 3)
+
+    def test_resources_already_gone_are_done(self):
+        def delete():
+            raise error('InvalidGroup.NotFound')
+        self.steps['[securitygroup]:sg-c'].action = delete
+        self.assertTrue(self.plan.execute())
+
+
+class InVpcTest(StubbedTestCase):
+
+    def test_resources_without_vpc_are_selected_through_related_ones(self):
+        ec2 = self.stub('ec2')
+        ec2.add_response('describe_subnets', {'Subnets': [
+            {'SubnetId': 'subnet-1', 'VpcId': 'vpc-1'},
+            {'SubnetId': 'subnet-2', 'VpcId': 'vpc-2'}]})
+        resources = [
+            EC2_Resource('i-1', {'VpcId': 'vpc-1'}, region=REGION),
+            RDS_Resource('db1', {'DBInstanceIdentifier': 'db1', 'DBClusterIdentifier': 'cl1',
+                                 'DBSubnetGroup': {'DBSubnetGroupName': 'sn1', 'VpcId': 'vpc-1'}},
+                         region=REGION),
+            AutoScalingGroup_Resource('asg-in', {'VPCZoneIdentifier': 'subnet-2,subnet-1',
+                                                 'LaunchConfigurationName': 'lc-in'},
+                                      region=REGION),
+            AutoScalingGroup_Resource('asg-out', {'VPCZoneIdentifier': 'subnet-2',
+                                                  'LaunchConfigurationName': 'lc-out'},
+                                      region=REGION),
+            LaunchConfiguration_Resource('lc-in', {}, region=REGION),
+            LaunchConfiguration_Resource('lc-out', {}, region=REGION),
+            EBSVolume_Resource('vol-in', {'Attachments': [{'InstanceId': 'i-1'}]}, region=REGION),
+            EBSVolume_Resource('vol-out', {'Attachments': [{'InstanceId': 'i-9'}]}, region=REGION),
+            EBSVolume_Resource('vol-unattached', {'Attachments': []}, region=REGION),
+            RDSAurora_Resource('cl1', {'DBSubnetGroup': 'sn2'}, region=REGION),
+            RDSAurora_Resource('cl2', {'DBSubnetGroup': 'sn1'}, region=REGION),
+            RDSAurora_Resource('cl3', {}, region=REGION),
+        ]
+        selected = teardown._with_launch_configurations(teardown._in_vpc(resources, 'vpc-1'))
+        self.assertEqual(selected, [resources[i] for i in (0, 1, 2, 4, 6, 9, 10)])
+
+
+class FileSystemVpcTest(unittest.TestCase):
+
+    def test_file_systems_without_mount_targets_are_in_no_vpc(self):
+        in_vpc = EFS_Resource('fs-1', {'Name': 'fs1'}, region=REGION)
+        in_vpc._mount_targets = [{'MountTargetId': 'fsmt-1', 'VpcId': 'vpc-1'}]
+        unmounted = EFS_Resource('fs-2', {'Name': 'fs2'}, region=REGION)
+        unmounted._mount_targets = []
+        self.assertIsNone(unmounted.vpc)
+        # As selected by Teardown.select(vpc=...)
+        self.assertEqual(Query(vpc='vpc-1').compile({}).filter([in_vpc, unmounted]), [in_vpc])
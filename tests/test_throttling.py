@@ -0,0 +1,89 @@
+# -*- coding: utf8 -*-
+import collections
+import time
+import unittest
+import boto3
+from . import ACCOUNT, REGION
+from .. import throttling
+
+HTTPResponse = collections.namedtuple('HTTPResponse', ['status_code'])
+
+
+class TokenBucketTest(unittest.TestCase):
+
+    def test_throttles_cut_the_rate_in_half(self):
+        bucket = throttling.TokenBucket(10)
+        bucket.on_throttle()
+        self.assertEqual(bucket.rate, 5)
+        # Requests throttled together slow down only once
+        bucket.on_throttle()
+        self.assertEqual(bucket.rate, 5)
+
+    def test_successes_grow_the_rate_back(self):
+        bucket = throttling.TokenBucket(10, max_rate=10.25)
+        bucket.on_success()
+        self.assertAlmostEqual(bucket.rate, 10 + throttling.INCREASE_STEP)
+        for _ in range(5):
+            bucket.on_success()
+        self.assertEqual(bucket.rate, 10.25)
+
+    def test_rate_is_kept_above_the_minimum(self):
+        bucket = throttling.TokenBucket(1, min_rate=0.8)
+        bucket.on_throttle()
+        self.assertEqual(bucket.rate, 0.8)
+
+    def test_requests_wait_for_their_token(self):
+        bucket = throttling.TokenBucket(20)
+        start = time.time()
+        for _ in range(3):
+            bucket.acquire()
+        # The first token is there from the start, the other two take 1/20 s each
+        self.assertGreaterEqual(time.time() - start, 0.09)
+
+
+class BucketTest(unittest.TestCase):
+
+    def test_buckets_by_service_region_and_account(self):
+        bucket = throttling.bucket('ec2', REGION, ACCOUNT)
+        self.assertIs(throttling.bucket('ec2', REGION, ACCOUNT), bucket)
+        self.assertIsNot(throttling.bucket('ec2', REGION, '210987654321'), bucket)
+        self.assertIsNot(throttling.bucket('ec2', 'eu-west-1', ACCOUNT), bucket)
+        self.assertEqual(throttling.bucket('rds', REGION, ACCOUNT).rate, throttling.RATES['rds'])
+
+    def test_registered_clients_adapt_to_throttling(self):
+        client = boto3.client('sqs', region_name=REGION)
+        throttling.register(client, 'throttled-account')
+        bucket = throttling.bucket('sqs', REGION, 'throttled-account')
+        rate = bucket.rate
+
+        def respond(status_code, parsed):
+            client.meta.events.emit(
+                'needs-retry.sqs.ListQueues', response=(HTTPResponse(status_code), parsed),
+                attempts=1, caught_exception=None, request_dict={'context': {}},
+                operation=client.meta.service_model.operation_model('ListQueues'))
+
+        respond(400, {'Error': {'Code': 'RequestThrottled'}})
+        self.assertEqual(bucket.rate, rate * throttling.DECREASE_FACTOR)
+        respond(200, {})
+        self.assertAlmostEqual(bucket.rate, rate * throttling.DECREASE_FACTOR +
+                               throttling.INCREASE_STEP)
+
+
+class ConfigureTest(unittest.TestCase):
+
+    def setUp(self):
+        self.settings = dict(throttling.settings)
+
+    def tearDown(self):
+        throttling.configure(**self.settings)
+
+    def test_client_config(self):
+        throttling.configure(max_pool_connections=7, max_attempts=3)
+        config = throttling.client_config()
+        self.assertEqual(config.max_pool_connections, 7)
+        self.assertEqual(config.retries, {'mode': throttling.RETRY_MODE, 'max_attempts': 3})
+        self.assertIs(throttling.client_config(), config)
+
+    def test_unknown_settings(self):
+        with self.assertRaises(ValueError):
+            throttling.configure(pool_size=7)
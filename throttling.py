@@ -0,0 +1,188 @@
+# -*- coding: utf8 -*-
+""" Client-side rate limiting shared by every client created through boto3_clients.
+
+    There is one token bucket per (service, region, account), as AWS limits the rate of each
+    account in each region, shared by all threads. Every HTTP request
+    (including retries) takes a token first. When AWS throttles a request the rate of the bucket
+    is cut in half, and every successful request grows it back a little (AIMD), so parallel scans
+    stay close to the API limit without tipping over it.
+
+    Throttled requests are retried by botocore with jittered exponential backoff ('standard'
+    retry mode).
+
+    The botocore Config of every client, with its retries, timeouts and connection pool size, is
+    also built here (see client_config and configure). """
+
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# Error codes returned by the different AWS APIs when a request is throttled
+THROTTLING_ERRORS = ('Throttling', 'ThrottlingException', 'ThrottledException',
+                     'RequestThrottledException', 'TooManyRequestsException',
+                     'ProvisionedThroughputExceededException', 'RequestLimitExceeded',
+                     'BandwidthLimitExceeded', 'RequestThrottled', 'SlowDown',
+                     'PriorRequestNotComplete', 'EC2ThrottledException')
+
+# Starting rate (requests per second) of the bucket of each service. The rate adapts from there,
+# between MIN_RATE and MAX_RATE.
+DEFAULT_RATE = 10
+RATES = {
+    'ec2': 20,
+    'autoscaling': 5,
+    'cloudformation': 5,
+    'efs': 5,
+    'rds': 5,
+}
+MIN_RATE = 0.5
+MAX_RATE = 100
+
+# Adaptation of the rate: multiplied on every throttle, increased on every successful request
+DECREASE_FACTOR = 0.5
+INCREASE_STEP = 0.1
+
+# Retries for every call, made by botocore with jittered exponential backoff
+MAX_ATTEMPTS = 10
+RETRY_MODE = 'standard'
+
+# Connections of every client. Each client keeps up to max_pool_connections open connections,
+# shared by all the threads using it, so it should be at least the number of threads calling a
+# service at once (botocore keeps 10 by default).
+MAX_POOL_CONNECTIONS = 50
+CONNECT_TIMEOUT = 10
+READ_TIMEOUT = 60
+TCP_KEEPALIVE = True
+
+# Current settings of the botocore Config of every client, see configure()
+settings = {
+    'max_attempts': MAX_ATTEMPTS,
+    'retry_mode': RETRY_MODE,
+    'max_pool_connections': MAX_POOL_CONNECTIONS,
+    'connect_timeout': CONNECT_TIMEOUT,
+    'read_timeout': READ_TIMEOUT,
+    'tcp_keepalive': TCP_KEEPALIVE,
+}
+_client_config = None
+_config_lock = threading.Lock()
+
+
+def configure(**new_settings):
+    """ Changes the settings of the botocore Config of the clients created from now on. Takes any
+        of the keys of 'settings' """
+    global _client_config
+    unknown = set(new_settings) - set(settings)
+    if unknown:
+        raise ValueError('Unknown client settings: %s' % ', '.join(sorted(unknown)))
+    with _config_lock:
+        settings.update(new_settings)
+        _client_config = None
+
+
+def client_config():
+    """ Returns the botocore Config of every client. botocore is only imported when the first
+        client is created """
+    global _client_config
+    with _config_lock:
+        if _client_config is None:
+            from botocore.config import Config
+            options = {
+                'retries': {'mode': settings['retry_mode'],
+                            'max_attempts': settings['max_attempts']},
+                'max_pool_connections': settings['max_pool_connections'],
+                'connect_timeout': settings['connect_timeout'],
+                'read_timeout': settings['read_timeout'],
+            }
+            # TCP keepalive is only supported by recent versions of botocore
+            if 'tcp_keepalive' in Config.OPTION_DEFAULTS:
+                options['tcp_keepalive'] = settings['tcp_keepalive']
+            elif settings['tcp_keepalive']:
+                logger.debug('TCP keepalive is not supported by this version of botocore')
+            _client_config = Config(**options)
+        return _client_config
+
+
+class TokenBucket(object):
+
+    def __init__(self, rate, min_rate=MIN_RATE, max_rate=MAX_RATE):
+        self.rate = float(rate)
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self._tokens = 1.0
+        self._last_refill = time.time()
+        self._last_decrease = 0
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.time()
+        # Allow bursts of up to one second worth of requests
+        self._tokens = min(max(self.rate, 1.0),
+                           self._tokens + (now - self._last_refill) * self.rate)
+        self._last_refill = now
+
+    def acquire(self):
+        """ Blocks until a request can be sent """
+        while True:
+            with self._lock:
+                self._refill()
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+    def on_throttle(self):
+        with self._lock:
+            now = time.time()
+            # Requests sent concurrently are throttled together, slow down only once for all of them
+            if now - self._last_decrease > 1 / self.rate:
+                self.rate = max(self.min_rate, self.rate * DECREASE_FACTOR)
+                self._last_decrease = now
+                logger.info('Request throttled, rate reduced to %.2f requests per second', self.rate)
+            self._tokens = min(self._tokens, 0.0)
+
+    def on_success(self):
+        with self._lock:
+            self.rate = min(self.max_rate, self.rate + INCREASE_STEP)
+
+
+_buckets = {}
+_lock = threading.Lock()
+
+
+def bucket(service, region, account=None):
+    """ Returns the token bucket shared by all clients of a service in a region and account. The
+        account None is the one of the default credentials """
+    key = (service, region, account)
+    with _lock:
+        if key not in _buckets:
+            _buckets[key] = TokenBucket(RATES.get(service, DEFAULT_RATE))
+        return _buckets[key]
+
+
+def is_throttling_error(code):
+    return code in THROTTLING_ERRORS
+
+
+def register(client, account=None):
+    """ Makes all requests of a client go through the token bucket of its service, region and
+        account """
+    token_bucket = bucket(client.meta.service_model.service_name, client.meta.region_name, account)
+
+    def before_send(**kwargs):
+        token_bucket.acquire()
+
+    def check_response(response=None, **kwargs):
+        if response is None:
+            return
+        http_response, parsed = response
+        if http_response.status_code == 429 or \
+                is_throttling_error(parsed.get('Error', {}).get('Code')):
+            token_bucket.on_throttle()
+        elif http_response.status_code < 400:
+            token_bucket.on_success()
+
+    client.meta.events.register('before-send', before_send)
+    client.meta.events.register('needs-retry', check_response)
+    return client